@@ -0,0 +1,100 @@
+"""
+Benchmark de backends de almacenamiento (src/db/embedded.py): carga, checks de calidad
+(un solo scan) y consultas de sql/queries_analiticas.sql sobre los mismos datos en
+SQLite, DuckDB (si está instalado) y, con --postgres-url, PostgreSQL.
+
+La base PostgreSQL indicada debe ser de pruebas: se crean las tablas del esquema si
+faltan y se vacían con la carga histórica.
+
+Uso:
+    python benchmarks/bench_backends.py --rows 1000000 [--postgres-url postgresql://...]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, text
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.data_quality import run_checks
+from src.db.embedded import (create_embedded_engine, create_embedded_schema, duckdb_available,
+                             load_analytic_queries, run_analytic_queries)
+from src.load.load_db import METRICS_COLUMNS, load_data_to_supabase
+from src.transform.kpis import calculate_kpis
+
+# Consulta de scan completo de la tabla de hechos (agregado por moneda, sin rollups)
+SCAN_QUERY = ('scan: agregado por moneda',
+              "SELECT coin, COUNT(*), MIN(price), MAX(price), AVG(price), SUM(volume) "
+              "FROM cryptocurrency_prices GROUP BY coin")
+
+
+def synthetic_batch(rows, days):
+    """Salida del transform (coin_id, date, precios y KPIs) con series que terminan hoy."""
+    n_coins = max(1, -(-rows // days))
+    dates = pd.date_range(end=pd.Timestamp.now().normalize(), periods=days, freq='D')
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        'coin_id': np.repeat([f'coin-{i}' for i in range(n_coins)], days),
+        'date': np.tile(dates, n_coins),
+    }).head(rows)
+    df['price'] = 100 * np.exp(np.cumsum(rng.normal(0, 0.04, len(df))))
+    df['volume'] = rng.uniform(1e3, 1e10, len(df))
+    df['market_cap'] = df['price'] * 1e6
+    return calculate_kpis(df, columns=METRICS_COLUMNS)
+
+
+def timed(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--days', type=int, default=1825)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--postgres-url', help='Base PostgreSQL de pruebas a comparar')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    engines = {'sqlite': create_embedded_engine('sqlite', os.path.join(directory, 'bench.sqlite'))}
+    if duckdb_available():
+        engines['duckdb'] = create_embedded_engine('duckdb', os.path.join(directory, 'bench.duckdb'))
+    else:
+        print("DuckDB no está instalado (pip install duckdb duckdb-engine): se omite")
+    if args.postgres_url:
+        engines['postgres'] = create_engine(args.postgres_url)
+        create_embedded_schema(engines['postgres'])
+
+    df = synthetic_batch(args.rows, args.days)
+    print(f"{len(df):,} filas, {df['coin_id'].nunique()} monedas")
+    queries = [SCAN_QUERY] + load_analytic_queries()
+    timings = {}
+    for name, engine in engines.items():
+        start = time.perf_counter()
+        load_data_to_supabase(df, engine=engine, parallel=False)
+        if engine.dialect.name == 'postgresql':
+            with engine.begin() as conn:
+                conn.execute(text("ANALYZE"))
+        timings[name] = {'carga (incl. rollups)': time.perf_counter() - start,
+                         'checks de calidad': timed(lambda: run_checks(engine), args.repeat)}
+        for title, sql in queries:
+            timings[name][title] = timed(lambda: run_analytic_queries(engine, [(title, sql)]), args.repeat)
+
+    print(f"\n{'operación (s)':<48}" + ''.join(f"{name:>12}" for name in engines))
+    for operation in timings['sqlite']:
+        print(f"{operation[:48]:<48}" + ''.join(f"{timings[name][operation]:>12.3f}" for name in engines))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Benchmark de los checks de calidad (src/data_quality.py): una consulta por check
+(como antes) vs todas las métricas en un solo scan vs un solo scan limitado al rango
+de claves del último lote (DQ_SCOPE=batch).
+
+Necesita un PostgreSQL accesible vía DATABASE_URL. Trabaja sobre una tabla propia
+`bench_dq_prices` con la clave primaria del esquema, que se elimina al terminar.
+
+Uso:
+    python benchmarks/bench_dq.py --rows 3000000 --repeat 3
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import pandas as pd
+from sqlalchemy import text
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.bench_load import DDL, synthetic_prices, TABLE as LOAD_TABLE
+from src.data_quality import recent_scope, run_checks
+from src.db.connection import get_engine
+from src.load.load_db import copy_frame
+
+TABLE = 'bench_dq_prices'
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=3_000_000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--batch-days', type=int, default=3, help="Días del último lote (modo batch)")
+    args = parser.parse_args()
+
+    engine = get_engine()
+    df = synthetic_prices(args.rows)
+    # Serie que termina hoy, como tras una carga incremental
+    df['price_timestamp'] += pd.Timestamp.now().normalize() - df['price_timestamp'].max()
+    coins = sorted(df['coin'].unique())
+    try:
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP TABLE IF EXISTS {TABLE}"))
+            conn.execute(text(DDL.replace(LOAD_TABLE, TABLE)))
+        copy_frame(df, TABLE, engine)
+        with engine.begin() as conn:
+            conn.execute(text(f"ANALYZE {TABLE}"))
+
+        variants = {
+            'una consulta por check': dict(single_scan=False),
+            'un solo scan': dict(single_scan=True),
+            f'un solo scan, últimos {args.batch_days} días': dict(
+                single_scan=True, scope=recent_scope(coins, days=args.batch_days)),
+        }
+        print(f"{len(df):,} filas, {len(coins)} monedas")
+        print(f"{'variante':<36} {'segundos':>9}   por check (ms)")
+        for label, options in variants.items():
+            samples, report = [], None
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                report = run_checks(engine, table=TABLE, **options)
+                samples.append(time.perf_counter() - start)
+            per_check = ', '.join(f"{r.name}={r.seconds * 1000:.0f}" for r in report.results)
+            print(f"{label:<36} {statistics.median(samples):>9.3f}   {per_check}")
+    finally:
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP TABLE IF EXISTS {TABLE}"))
+
+
+if __name__ == "__main__":
+    main()
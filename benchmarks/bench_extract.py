@@ -0,0 +1,50 @@
+"""
+Benchmark de extracción: secuencial vs concurrente contra un CoinGecko mock local.
+
+Uso:
+    python benchmarks/bench_extract.py --coins 60 --workers 1 8 16 --latency 0.3 --server-rate 20
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.mock_coingecko import start_mock_server
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--coins', type=int, default=60)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 8, 16])
+    parser.add_argument('--latency', type=float, default=0.3, help='Latencia simulada por petición (s)')
+    parser.add_argument('--server-rate', type=int, default=20, help='Límite del mock en peticiones/s (429 al superarlo)')
+    parser.add_argument('--client-rate', type=float, default=1200, help='Límite del token bucket (peticiones/min)')
+    args = parser.parse_args()
+
+    server, base_url = start_mock_server(latency=args.latency, rate_limit_per_second=args.server_rate)
+    # La configuración se lee al importar src.config: fijar el entorno antes
+    os.environ['COINGECKO_API_URL'] = base_url
+    os.environ['API_BACKOFF_BASE_SECONDS'] = '0.25'
+
+    from src.etl import extract
+    from src.etl.rate_limit import TokenBucket
+
+    coins = [f"coin-{i}" for i in range(args.coins)]
+    print(f"{args.coins} monedas, {args.days} días, latencia {args.latency}s, mock limitado a {args.server_rate} req/s")
+    print(f"{'workers':>8} {'segundos':>10} {'filas':>10} {'429s':>6}")
+    for workers in args.workers:
+        rejected_before = server.limiter.rejected
+        limiter = TokenBucket(rate_per_minute=args.client_rate, burst=workers)
+        start = time.perf_counter()
+        df = extract.extract_all_coins(coins=coins, max_workers=workers, limiter=limiter)
+        elapsed = time.perf_counter() - start
+        print(f"{workers:>8} {elapsed:>10.2f} {len(df):>10} {server.limiter.rejected - rejected_before:>6}")
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Benchmark del traspaso de datos entre tareas del DAG: pickle del DataFrame completo
+(implementación anterior, /tmp/crypto_processed.pkl) vs IntermediateStore en Parquet
+y Arrow IPC particionado por moneda.
+
+Mide tamaño en disco, escritura, lectura completa, lectura de las columnas que usa
+la carga y lectura de una sola moneda en un rango de 30 días.
+
+Uso:
+    python benchmarks/bench_intermediate.py --coins 500 --days 1825
+"""
+import argparse
+import os
+import pickle
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.bench_kpis import synthetic_clean
+from src.load.load_db import METRICS_COLUMNS
+from src.transform.kpis import calculate_kpis
+from src.utils.intermediate_store import IntermediateStore
+
+LOAD_COLUMNS = ['coin_id', 'date', 'price', 'volume', 'market_cap'] + METRICS_COLUMNS
+
+
+def timed(func, repeat=3):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--coins', type=int, default=500)
+    parser.add_argument('--days', type=int, default=1825)
+    args = parser.parse_args()
+
+    df = calculate_kpis(synthetic_clean(args.coins, args.days))
+    coin = df['coin_id'].iloc[0]
+    end = df['date'].max()
+    start = end - (30 - 1) * (df['date'].iloc[1] - df['date'].iloc[0])
+    print(f"{len(df):,} filas x {len(df.columns)} columnas")
+    print(f"{'formato':<9} {'MB':>8} {'escritura s':>12} {'lectura s':>10} {'cols carga s':>13} {'1 moneda/30d s':>15}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'crypto_processed.pkl')
+        write_s, _ = timed(lambda: df.to_pickle(path))
+
+        def read_pickle():
+            with open(path, 'rb') as f:
+                return pickle.load(f)
+
+        read_s, _ = timed(read_pickle)
+        # Con pickle hay que deserializar todo y luego filtrar
+        cols_s, _ = timed(lambda: read_pickle()[LOAD_COLUMNS])
+        coin_s, _ = timed(lambda: (lambda d: d[(d['coin_id'] == coin) & (d['date'] >= start)])(read_pickle()))
+        size = os.path.getsize(path) / 1e6
+        print(f"{'pickle':<9} {size:>8.1f} {write_s:>12.2f} {read_s:>10.2f} {cols_s:>13.2f} {coin_s:>15.3f}")
+
+        for file_format in ('parquet', 'arrow'):
+            store = IntermediateStore(f'bench-{file_format}', base_dir=tmp, file_format=file_format)
+            write_s, _ = timed(lambda: store.write('processed', df), repeat=1)
+            read_s, _ = timed(lambda: store.read('processed'))
+            cols_s, _ = timed(lambda: store.read('processed', columns=LOAD_COLUMNS))
+            coin_s, subset = timed(lambda: store.read('processed', coins=[coin], start=start, end=end))
+            assert len(subset) == 30
+            size = store.size_bytes('processed') / 1e6
+            print(f"{file_format:<9} {size:>8.1f} {write_s:>12.2f} {read_s:>10.2f} {cols_s:>13.2f} {coin_s:>15.3f}")
+
+
+if __name__ == "__main__":
+    main()
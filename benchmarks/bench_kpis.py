@@ -0,0 +1,96 @@
+"""
+Benchmark de calculate_kpis: implementación con un groupby por métrica (legado)
+vs motor vectorizado de una pasada.
+
+Por defecto genera 10.000 monedas x 5 años de datos diarios (~18M filas). La
+implementación legada necesita varios GB de RAM a ese tamaño; usar --coins para
+escalas menores. Cada variante corre en un subproceso para medir su pico de RSS
+de forma aislada.
+
+Uso:
+    python benchmarks/bench_kpis.py --coins 10000 --days 1825
+"""
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+def legacy_calculate_kpis(df):
+    df = df.sort_values(by=['coin_id', 'date'])
+    df['daily_return'] = df.groupby('coin_id')['price'].pct_change()
+    df['market_cap_change_24h'] = df.groupby('coin_id')['market_cap'].pct_change(periods=1) * 100
+    df['volume_change_24h'] = df.groupby('coin_id')['volume'].pct_change(periods=1) * 100
+    df['profitability_30d'] = df.groupby('coin_id')['price'].pct_change(periods=30) * 100
+    df['volatility_30d'] = df.groupby('coin_id')['daily_return'].rolling(window=30).std().reset_index(0, drop=True) * 100
+    df['price_change_24h'] = df.groupby('coin_id')['price'].pct_change(periods=1) * 100
+    df['price_change_7d'] = df.groupby('coin_id')['price'].pct_change(periods=7) * 100
+    df['price_change_30d'] = df.groupby('coin_id')['price'].pct_change(periods=30) * 100
+    df['market_cap_change_7d'] = df.groupby('coin_id')['market_cap'].pct_change(periods=7) * 100
+    df['market_cap_change_30d'] = df.groupby('coin_id')['market_cap'].pct_change(periods=30) * 100
+    df['volume_change_7d'] = df.groupby('coin_id')['volume'].pct_change(periods=7) * 100
+    df['volume_change_30d'] = df.groupby('coin_id')['volume'].pct_change(periods=30) * 100
+    return df.fillna(0)
+
+
+def synthetic_clean(coins, days, seed=0):
+    """Frame con la forma de la salida de clean_data (ordenado por moneda y fecha)."""
+    rng = np.random.default_rng(seed)
+    n = coins * days
+    price = 100 * np.cumprod(1 + rng.normal(0, 0.03, n))
+    return pd.DataFrame({
+        'timestamp': np.tile(pd.date_range('2019-01-01', periods=days, freq='D').as_unit('ms').asi8, coins),
+        'price': price,
+        'volume': rng.uniform(1e6, 1e9, n),
+        'market_cap': price * 1e6,
+        'coin_id': np.repeat([f'coin-{i:05d}' for i in range(coins)], days),
+        'date': np.tile(pd.date_range('2019-01-01', periods=days, freq='D'), coins),
+    })
+
+
+def run_variant(variant, coins, days):
+    df = synthetic_clean(coins, days)
+    baseline_kib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if variant == 'legacy':
+        func = legacy_calculate_kpis
+    else:
+        from src.transform.kpis import calculate_kpis as func
+    start = time.perf_counter()
+    func(df)
+    elapsed = time.perf_counter() - start
+    peak_kib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"{variant},{len(df)},{elapsed:.3f},{peak_kib / 1024:.0f},{(peak_kib - baseline_kib) / 1024:.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--coins', type=int, default=10_000)
+    parser.add_argument('--days', type=int, default=1825)
+    parser.add_argument('--variants', nargs='+', default=['legacy', 'vectorized'])
+    parser.add_argument('--run', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_variant(args.run, args.coins, args.days)
+        return
+
+    print(f"{'variante':<11} {'filas':>11} {'segundos':>9} {'pico RSS MB':>12} {'Δ RSS MB':>9}")
+    for variant in args.variants:
+        out = subprocess.run([sys.executable, __file__, '--run', variant, '--coins', str(args.coins),
+                              '--days', str(args.days)], capture_output=True, text=True)
+        if out.returncode != 0:
+            print(f"{variant:<11} falló (¿memoria insuficiente?): {out.stderr.strip().splitlines()[-1:]}")
+            continue
+        name, rows, secs, peak, delta = out.stdout.strip().splitlines()[-1].split(',')
+        print(f"{name:<11} {int(rows):>11,} {float(secs):>9.2f} {int(peak):>12,} {int(delta):>9,}")
+
+
+if __name__ == "__main__":
+    main()
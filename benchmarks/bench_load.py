@@ -0,0 +1,79 @@
+"""
+Benchmark de carga: `to_sql` con INSERTs (chunksize=1000) vs COPY FROM STDIN.
+
+Necesita un PostgreSQL accesible vía DATABASE_URL (p. ej. `docker-compose up -d`).
+Trabaja sobre una tabla temporal propia `bench_cryptocurrency_prices`, que se
+elimina al terminar; no toca las tablas del pipeline.
+
+Uso:
+    python benchmarks/bench_load.py --rows 100000 500000
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.db.connection import get_engine
+from src.load.load_db import write_frame
+
+TABLE = 'bench_cryptocurrency_prices'
+DDL = f"""
+CREATE TABLE IF NOT EXISTS {TABLE} (
+    row_index BIGINT,
+    coin TEXT NOT NULL,
+    price_timestamp TIMESTAMP NOT NULL,
+    price NUMERIC,
+    volume NUMERIC,
+    market_cap NUMERIC,
+    PRIMARY KEY (coin, price_timestamp)
+);
+"""
+
+
+def synthetic_prices(rows, days=1825):
+    n_coins = max(1, rows // days)
+    dates = pd.date_range('2019-01-01', periods=days, freq='D')
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        'coin': np.repeat([f'coin-{i}' for i in range(n_coins)], days),
+        'price_timestamp': np.tile(dates, n_coins),
+    }).head(rows)
+    df['price'] = rng.uniform(0.01, 60_000, len(df))
+    df['volume'] = rng.uniform(1e3, 1e10, len(df))
+    df['market_cap'] = rng.uniform(1e6, 1e12, len(df))
+    df['row_index'] = np.arange(len(df))
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=[100_000, 500_000])
+    parser.add_argument('--methods', nargs='+', default=['insert', 'copy'])
+    args = parser.parse_args()
+
+    engine = get_engine()
+    print(f"{'filas':>9} {'método':<8} {'segundos':>9} {'filas/s':>11}")
+    try:
+        for rows in args.rows:
+            df = synthetic_prices(rows)
+            for method in args.methods:
+                with engine.begin() as conn:
+                    conn.execute(text(f"DROP TABLE IF EXISTS {TABLE}"))
+                    conn.execute(text(DDL))
+                start = time.perf_counter()
+                write_frame(df, TABLE, engine, load_method=method)
+                elapsed = time.perf_counter() - start
+                print(f"{rows:>9} {method:<8} {elapsed:>9.2f} {rows / elapsed:>11,.0f}")
+    finally:
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP TABLE IF EXISTS {TABLE}"))
+
+
+if __name__ == "__main__":
+    main()
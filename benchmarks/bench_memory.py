@@ -0,0 +1,81 @@
+"""
+Pico de RSS de una ejecución histórica completa sin red ni base de datos:
+payloads `market_chart` sintéticos -> build_coin_frame -> concat -> clean_data ->
+calculate_kpis -> frames de carga serializados a CSV por chunks (lo que envía COPY).
+
+Cada variante corre en un subproceso con su propia configuración de tipos
+(LEAN_DTYPES / KPI_FLOAT_DTYPE) para aislar su pico de memoria.
+
+Uso:
+    python benchmarks/bench_memory.py --coins 1000 --days 1825
+"""
+import argparse
+import io
+import os
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+VARIANTS = {
+    'baseline': {'LEAN_DTYPES': 'false', 'KPI_FLOAT_DTYPE': 'float64'},
+    'lean': {'LEAN_DTYPES': 'true', 'KPI_FLOAT_DTYPE': 'float64'},
+    'lean+f32': {'LEAN_DTYPES': 'true', 'KPI_FLOAT_DTYPE': 'float32'},
+}
+
+
+def run_pipeline(coins, days):
+    import pandas as pd
+    from benchmarks.mock_coingecko import synthetic_series
+    from src.config import COPY_CHUNKSIZE
+    from src.etl.extract import build_coin_frame
+    from src.load.load_db import METRICS_COLUMNS, _prepare_prices_frame, _prepare_metrics_frame
+    from src.transform.clean import clean_data
+    from src.transform.dtypes import normalize_raw
+    from src.transform.kpis import calculate_kpis
+
+    start = time.perf_counter()
+    frames = [build_coin_frame(synthetic_series(f'coin-{i:05d}', days), f'coin-{i:05d}') for i in range(coins)]
+    # Igual que extract_all_coins
+    raw = normalize_raw(pd.concat(frames, ignore_index=True))
+    del frames
+    final = calculate_kpis(clean_data(raw), columns=METRICS_COLUMNS)
+    del raw
+    for frame in (_prepare_prices_frame(final), _prepare_metrics_frame(final)):
+        for offset in range(0, len(frame), COPY_CHUNKSIZE):
+            buffer = io.StringIO()
+            frame.iloc[offset:offset + COPY_CHUNKSIZE].to_csv(buffer, index=False, header=False)
+    elapsed = time.perf_counter() - start
+    frame_mb = final.memory_usage(deep=True).sum() / 1e6
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{len(final)},{elapsed:.2f},{frame_mb:.0f},{peak_mb:.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--coins', type=int, default=1000)
+    parser.add_argument('--days', type=int, default=1825)
+    parser.add_argument('--variants', nargs='+', default=list(VARIANTS))
+    parser.add_argument('--run', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_pipeline(args.coins, args.days)
+        return
+
+    print(f"{'variante':<10} {'filas':>11} {'segundos':>9} {'frame final MB':>15} {'pico RSS MB':>12}")
+    for variant in args.variants:
+        env = dict(os.environ, **VARIANTS[variant])
+        out = subprocess.run([sys.executable, __file__, '--run', '--coins', str(args.coins), '--days', str(args.days)],
+                             capture_output=True, text=True, env=env)
+        if out.returncode != 0:
+            print(f"{variant:<10} falló: {out.stderr.strip().splitlines()[-1:]}")
+            continue
+        rows, secs, frame_mb, peak = out.stdout.strip().splitlines()[-1].split(',')
+        print(f"{variant:<10} {int(rows):>11,} {float(secs):>9.2f} {int(frame_mb):>15,} {int(peak):>12,}")
+
+
+if __name__ == "__main__":
+    main()
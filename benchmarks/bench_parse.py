@@ -0,0 +1,68 @@
+"""
+Micro-benchmark del parseo de payloads `market_chart`: merge de 3 DataFrames (legado)
+vs construcción columnar directa (`build_coin_frame`).
+
+Mide tiempo medio por moneda y memoria pico (tracemalloc) sobre payloads sintéticos
+de 365 días en granularidad diaria y horaria.
+
+Uso:
+    python benchmarks/bench_parse.py --repeat 200
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.mock_coingecko import synthetic_series
+from src.etl.extract import build_coin_frame
+
+HOUR_MS = 3_600_000
+
+
+def legacy_frame(data, coin_id):
+    df = pd.DataFrame(data['prices'], columns=['timestamp', 'price'])
+    volumes = pd.DataFrame(data['total_volumes'], columns=['timestamp', 'volume'])
+    market_caps = pd.DataFrame(data['market_caps'], columns=['timestamp', 'market_cap'])
+    df = df.merge(volumes, on='timestamp', how='left')
+    df = df.merge(market_caps, on='timestamp', how='left')
+    df['coin_id'] = coin_id
+    return df
+
+
+def measure(func, data, repeat):
+    func(data, 'bitcoin')  # calentamiento
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(data, 'bitcoin')
+    per_call_ms = (time.perf_counter() - start) / repeat * 1000
+
+    tracemalloc.start()
+    func(data, 'bitcoin')
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return per_call_ms, peak / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    payloads = {
+        '365d diario': synthetic_series('bitcoin', 365),
+        '365d horario': synthetic_series('bitcoin', 365, step_ms=HOUR_MS),
+    }
+    print(f"{'payload':<14} {'puntos':>7} {'método':<10} {'ms/moneda':>10} {'pico KiB':>10}")
+    for name, data in payloads.items():
+        for label, func in (('merge', legacy_frame), ('columnar', build_coin_frame)):
+            ms, peak_kib = measure(func, data, args.repeat)
+            print(f"{name:<14} {len(data['prices']):>7} {label:<10} {ms:>10.3f} {peak_kib:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
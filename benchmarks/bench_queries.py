@@ -0,0 +1,139 @@
+"""
+Benchmark de las consultas de sql/queries_analiticas.sql: tabla plana (esquema actual,
+B-tree sobre price_timestamp) vs tabla particionada por mes con BRIN y clave primaria
+cubriente (src/db/partitions.py).
+
+Necesita un PostgreSQL accesible vía DATABASE_URL. Crea sus propias tablas
+`bench_prices_flat` y `bench_prices_part`, que se eliminan al terminar.
+
+Uso:
+    python benchmarks/bench_queries.py --rows 3000000 --repeat 3
+"""
+import argparse
+import os
+import re
+import statistics
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.db.connection import get_engine
+from src.db.partitions import partitioned_table_sql, create_missing_partitions
+from src.load.load_db import copy_frame
+
+QUERIES_PATH = os.path.join(os.path.dirname(__file__), '..', 'sql', 'queries_analiticas.sql')
+FLAT, PART = 'bench_prices_flat', 'bench_prices_part'
+FLAT_DDL = [
+    f"""CREATE TABLE {FLAT} (
+    row_index BIGINT,
+    coin TEXT NOT NULL,
+    price_timestamp TIMESTAMP NOT NULL,
+    price NUMERIC,
+    volume NUMERIC,
+    market_cap NUMERIC,
+    PRIMARY KEY (coin, price_timestamp)
+)""",
+    f"CREATE INDEX {FLAT}_date ON {FLAT}(price_timestamp)",
+]
+
+
+def load_queries():
+    """
+    Consultas del archivo sobre cryptocurrency_prices, separadas por ';', con su título
+    (primer comentario numerado).
+    """
+    with open(QUERIES_PATH, encoding='utf-8') as f:
+        sql = f.read()
+    queries = []
+    for statement in sql.split(';'):
+        # Solo las consultas sobre la tabla de hechos (las de rollups no dependen del esquema)
+        if 'cryptocurrency_prices' not in statement:
+            continue
+        title = re.search(r'--\s*(\d+\..*)', statement)
+        queries.append((title.group(1).strip() if title else statement.strip()[:40], statement))
+    return queries
+
+
+def synthetic_prices(rows, days):
+    """
+    Serie diaria por moneda que termina hoy (para que "últimos 30 días" tenga datos).
+    """
+    n_coins = max(1, -(-rows // days))
+    end = pd.Timestamp.now().normalize()
+    dates = pd.date_range(end=end, periods=days, freq='D')
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        'row_index': np.arange(n_coins * days),
+        'coin': np.repeat([f'coin-{i}' for i in range(n_coins)], days),
+        'price_timestamp': np.tile(dates, n_coins),
+    }).head(rows)
+    # Paseo aleatorio con saltos ocasionales (> 10 %) para la consulta de "pump days"
+    df['price'] = 100 * np.exp(np.cumsum(rng.normal(0, 0.04, len(df))))
+    df['volume'] = rng.uniform(1e3, 1e10, len(df))
+    df['market_cap'] = df['price'] * 1e6
+    # Orden de llegada del pipeline: por fecha, no por moneda (importa para BRIN)
+    return df.sort_values(['price_timestamp', 'coin'], kind='stable')
+
+
+def timed(conn, sql, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        conn.execute(text(sql)).fetchall()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=3_000_000)
+    parser.add_argument('--days', type=int, default=1825)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    engine = get_engine()
+    df = synthetic_prices(args.rows, args.days)
+    print(f"{len(df):,} filas, {df['coin'].nunique()} monedas, {args.days} días")
+    try:
+        with engine.begin() as conn:
+            for table in (FLAT, PART):
+                conn.execute(text(f"DROP TABLE IF EXISTS {table} CASCADE"))
+            for statement in FLAT_DDL + partitioned_table_sql(PART):
+                conn.execute(text(statement))
+            create_missing_partitions(conn, PART, df['price_timestamp'].min(), df['price_timestamp'].max())
+
+        for table in (FLAT, PART):
+            start = time.perf_counter()
+            copy_frame(df, table, engine)
+            with engine.begin() as conn:
+                conn.execute(text(f"ANALYZE {table}"))
+            print(f"carga {table}: {time.perf_counter() - start:.1f}s")
+
+        with engine.connect() as conn:
+            # pg_total_relation_size del padre particionado es 0: se suman sus particiones
+            relations = {FLAT: f"SELECT '{FLAT}'::regclass",
+                         PART: f"SELECT inhrelid FROM pg_inherits WHERE inhparent = '{PART}'::regclass"}
+            for table, relids in relations.items():
+                total, indexes = conn.execute(text(
+                    f"SELECT pg_size_pretty(SUM(pg_total_relation_size(r))), pg_size_pretty(SUM(pg_indexes_size(r))) "
+                    f"FROM ({relids}) AS t(r)")).one()
+                print(f"tamaño {table}: {total} (índices {indexes})")
+
+            print(f"\n{'consulta':<48} {'plana (s)':>10} {'particionada (s)':>17} {'speedup':>8}")
+            for title, sql in load_queries():
+                flat = timed(conn, sql.replace('cryptocurrency_prices', FLAT), args.repeat)
+                part = timed(conn, sql.replace('cryptocurrency_prices', PART), args.repeat)
+                print(f"{title[:48]:<48} {flat:>10.3f} {part:>17.3f} {flat / part:>7.2f}x")
+    finally:
+        with engine.begin() as conn:
+            for table in (FLAT, PART):
+                conn.execute(text(f"DROP TABLE IF EXISTS {table} CASCADE"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Benchmark de escalado de la transformación (clean_data + calculate_kpis) en paralelo
+por moneda con ProcessPoolExecutor (src/transform/parallel.py) vs secuencial.
+
+Genera un universo de monedas con historia horaria, en el formato crudo de
+extract_all_coins. El speedup está acotado por los núcleos disponibles
+(os.cpu_count()); con más workers que núcleos solo se añade overhead.
+
+Uso:
+    python benchmarks/bench_transform.py --coins 200 --periods 8760 --workers 1 2 4 8
+    python benchmarks/bench_transform.py --coins 2000 --periods 1825 --freq D
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.load.load_db import METRICS_COLUMNS
+from src.transform.clean import clean_data
+from src.transform.kpis import calculate_kpis
+from src.transform.parallel import transform_parallel
+
+
+def synthetic_raw(coins, periods, freq='h', seed=0):
+    """Frame crudo con una fila por moneda y periodo (clean_data normaliza a días)."""
+    rng = np.random.default_rng(seed)
+    n = coins * periods
+    price = 100 * np.cumprod(1 + rng.normal(0, 0.005, n))
+    return pd.DataFrame({
+        'timestamp': np.tile(pd.date_range('2022-01-01', periods=periods, freq=freq).as_unit('ms').asi8, coins),
+        'price': price,
+        'volume': rng.uniform(1e6, 1e9, n),
+        'market_cap': price * 1e6,
+        'coin_id': np.repeat([f'coin-{i:05d}' for i in range(coins)], periods),
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--coins', type=int, default=200)
+    parser.add_argument('--periods', type=int, default=8760)
+    parser.add_argument('--freq', default='h', help="Frecuencia de los datos crudos ('h' horaria, 'D' diaria)")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    raw = synthetic_raw(args.coins, args.periods, args.freq)
+    print(f"{len(raw):,} filas crudas, {args.coins} monedas, {os.cpu_count()} CPU(s)")
+
+    start = time.perf_counter()
+    expected = calculate_kpis(clean_data(raw.copy()), columns=METRICS_COLUMNS).reset_index(drop=True)
+    serial = time.perf_counter() - start
+    print(f"{'workers':>8} {'segundos':>9} {'speedup':>8}")
+    print(f"{'serial':>8} {serial:>9.2f} {1.0:>8.2f}")
+
+    for workers in args.workers:
+        start = time.perf_counter()
+        result = transform_parallel(raw, max_workers=workers, columns=METRICS_COLUMNS)
+        elapsed = time.perf_counter() - start
+        pd.testing.assert_frame_equal(result, expected)
+        print(f"{workers:>8} {elapsed:>9.2f} {serial / elapsed:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Servidor HTTP mínimo que imita los endpoints de CoinGecko usados por el ETL
+(`/coins/<id>/market_chart` y `/simple/price`).
+
+Genera series y cotizaciones sintéticas deterministas por moneda (la hora de las
+cotizaciones sale de `server.clock`, sustituible por un reloj simulado), simula
+latencia de red y aplica su propio límite de tasa devolviendo HTTP 429 (cuerpo JSON,
+igual que la API real) cuando se supera.
+
+Uso:
+    python benchmarks/mock_coingecko.py --port 8765 --latency 0.2 --rate-limit 50
+"""
+import argparse
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+DAY_MS = 86_400_000
+
+
+def synthetic_series(coin_id, days, end_ms=None, step_ms=DAY_MS):
+    """
+    Devuelve un payload `market_chart` con `days` días de puntos espaciados `step_ms`.
+    """
+    seed = int(hashlib.md5(coin_id.encode()).hexdigest()[:8], 16)
+    end_ms = end_ms if end_ms is not None else int(time.time() * 1000) // DAY_MS * DAY_MS
+    n = max(1, int(days * DAY_MS // step_ms))
+    base = 1 + seed % 50_000
+    prices, volumes, caps = [], [], []
+    for i in range(n + 1):
+        ts = end_ms - (n - i) * step_ms
+        price = base * (1 + 0.05 * ((seed >> (i % 16)) % 7 - 3) / 3) * (1 + i / (10 * n))
+        prices.append([ts, price])
+        volumes.append([ts, price * 1_000 + i])
+        caps.append([ts, price * 1_000_000])
+    return {'prices': prices, 'total_volumes': volumes, 'market_caps': caps}
+
+
+def synthetic_quotes(coin_ids, now, vs_currency='usd', update_seconds=30):
+    """
+    Payload `/simple/price` en el instante `now` (segundos epoch): cada moneda cotiza un
+    precio que se actualiza cada `update_seconds` (como el `last_updated_at` de la API).
+    """
+    updated = int(now) // update_seconds * update_seconds
+    quotes = {}
+    for coin_id in coin_ids:
+        seed = int(hashlib.md5(coin_id.encode()).hexdigest()[:8], 16)
+        price = (1 + seed % 50_000) * (1 + 0.01 * ((updated // update_seconds + seed) % 11 - 5) / 5)
+        quotes[coin_id] = {vs_currency: price, f'{vs_currency}_market_cap': price * 1_000_000,
+                           f'{vs_currency}_24h_vol': price * 1_000, 'last_updated_at': updated}
+    return quotes
+
+
+class _ServerLimiter:
+    def __init__(self, per_second):
+        self.per_second = per_second
+        self.window_start = time.monotonic()
+        self.count = 0
+        self.lock = threading.Lock()
+        self.rejected = 0
+        self.served = 0
+
+    def allow(self):
+        if not self.per_second:
+            return True
+        with self.lock:
+            now = time.monotonic()
+            if now - self.window_start >= 1:
+                self.window_start, self.count = now, 0
+            self.count += 1
+            if self.count > self.per_second:
+                self.rejected += 1
+                return False
+            self.served += 1
+            return True
+
+
+class MockCoinGeckoHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        time.sleep(server.latency)
+        if not server.limiter.allow():
+            self._send_json(429, {'status': {'error_code': 429, 'error_message': 'Rate limit exceeded'}})
+            return
+
+        url = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        parts = [p for p in url.path.split('/') if p]
+        # /api/v3/coins/<id>/market_chart
+        if len(parts) >= 5 and parts[-3] == 'coins' and parts[-1] == 'market_chart':
+            self._send_json(200, synthetic_series(parts[-2], float(params.get('days', 1))))
+            return
+        # /api/v3/simple/price?ids=a,b&vs_currencies=usd
+        if parts[-2:] == ['simple', 'price']:
+            self._send_json(200, synthetic_quotes(params.get('ids', '').split(','), server.clock(),
+                                                  params.get('vs_currencies', 'usd')))
+            return
+        self._send_json(404, {'error': f'endpoint no soportado: {url.path}'})
+
+
+def start_mock_server(port=0, latency=0.0, rate_limit_per_second=0, clock=time.time):
+    """
+    Arranca el servidor en un hilo daemon. Devuelve (server, base_url).
+    `clock` da la hora (segundos epoch) de las cotizaciones de `/simple/price`.
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', port), MockCoinGeckoHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.clock = clock
+    server.limiter = _ServerLimiter(rate_limit_per_second)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/api/v3/"
+    return server, base_url
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.2)
+    parser.add_argument('--rate-limit', type=int, default=0, help='Peticiones/segundo antes de responder 429 (0 = sin límite)')
+    args = parser.parse_args()
+    server, url = start_mock_server(args.port, args.latency, args.rate_limit)
+    print(f"Mock CoinGecko escuchando en {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -2,7 +2,6 @@ import logging
 from datetime import datetime, timedelta
 import os
 import sys
-import pandas as pd
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -12,15 +11,25 @@ logger = logging.getLogger(__name__)
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from airflow import DAG
-from airflow.operators.python import PythonOperator
+from airflow.decorators import task, task_group
+from airflow.operators.python import PythonOperator, get_current_context
+from airflow.utils.trigger_rule import TriggerRule
 from airflow.providers.postgres.hooks.postgres import PostgresHook
 from airflow.sensors.sql import SqlSensor
 
-from src.etl.extract import extract_all_coins
+from src.config import (COINS, COIN_SHARD_SIZE, API_RATE_LIMIT_PER_MINUTE, DQ_SCOPE, GAP_FILL_ENABLED,
+                        KPI_LOOKBACK_DAYS, VALIDATION_MODE)
+from src.etl.extract import extract_all_coins, shard_coins
+from src.etl.gaps import scan_and_fill
+from src.etl.rate_limit import TokenBucket
 from src.transform.clean import clean_data
 from src.transform.kpis import calculate_kpis
-from src.load.load_db import load_data_to_supabase
+from src.transform.validate import split_nulls, validate_batch
+from src.load.load_db import load_data_to_supabase, get_latest_dates_by_coin, METRICS_COLUMNS
 from src.db.connection import get_engine
+from src.data_quality import CONFIRMATION_CHECKS, run_all_checks, recent_scope
+from src.utils.intermediate_store import IntermediateStore
+from src.utils.metrics import stage, write_textfile
 
 # Default arguments for the DAG
 default_args = {
@@ -43,168 +52,193 @@ with DAG(
     tags=['crypto', 'etl', 'supabase'],
 ) as dag:
 
-    def extract_cryptos(**context):
+    @task
+    def plan_shards():
         """
-        Extracts data from CoinGecko API and saves to temporary storage.
+        Splits COINS into shards of COIN_SHARD_SIZE coins; one mapped task group runs per shard.
         """
-        logger.info("Starting extraction task...")
-        df = extract_all_coins()
+        shards = shard_coins(COINS, COIN_SHARD_SIZE)
+        logger.info(f"Planned {len(shards)} shards of up to {COIN_SHARD_SIZE} coins: {shards}")
+        return shards
+
+    def _shard_name(prefix):
+        # map_index is stable across retries, so a retried task finds its shard's datasets
+        return f"{prefix}_shard_{get_current_context()['ti'].map_index}"
+
+    @task
+    def extract_cryptos(coins):
+        """
+        Extracts one shard's coins from CoinGecko API and saves them to temporary storage.
+        """
+        logger.info(f"Starting extraction task for {coins}...")
+        # Incremental: only fetch the days after each coin's watermark (+ KPI lookback)
+        watermarks = get_latest_dates_by_coin(get_engine())
+        # Shards may run concurrently on different workers: split the API quota between them
+        n_shards = len(shard_coins(COINS, COIN_SHARD_SIZE))
+        limiter = TokenBucket(rate_per_minute=API_RATE_LIMIT_PER_MINUTE / n_shards)
+        with stage('extract') as m:
+            df = extract_all_coins(coins=coins, watermarks=watermarks, limiter=limiter)
+            m.rows_out = len(df)
+        write_textfile(_shard_name('extract'))
         if df.empty:
-            logger.error("No data extracted from CoinGecko.")
-            raise ValueError("No data extracted from CoinGecko.")
+            logger.error(f"No data extracted from CoinGecko for {coins}.")
+            raise ValueError(f"No data extracted from CoinGecko for {coins}.")
         
-        # Save to XCom or file (Using file for DataFrame is better)
-        output_path = '/tmp/crypto_raw.pkl'
-        df.to_pickle(output_path)
+        # Run-scoped Arrow/Parquet dataset (concurrent runs/backfills don't overwrite each other)
+        name = _shard_name('raw')
+        output_path = IntermediateStore(get_current_context()['run_id']).write(name, df)
         logger.info(f"Extraction complete. Saved {len(df)} rows to {output_path}")
-        return output_path
+        return name
 
-    def transform_prices_and_metrics(**context):
+    @task
+    def transform_prices_and_metrics(raw_name):
         """
-        Reads raw data, cleans it, calculates KPIs, and saves processed data.
+        Reads a shard's raw data, cleans it, calculates KPIs, and saves processed data.
         """
         logger.info("Starting transformation task...")
-        input_path = context['ti'].xcom_pull(task_ids='extract_cryptos')
-        logger.info(f"Reading raw data from {input_path}...")
-        raw_df = pd.read_pickle(input_path)
+        store = IntermediateStore(get_current_context()['run_id'])
+        logger.info(f"Reading raw data from {store.path(raw_name)}...")
+        raw_df = store.read(raw_name)
         
+        # Rows with NULLs are set aside before cleaning drops them (or the KPIs fill them with 0)
+        raw_df, nulls = split_nulls(raw_df)
+
         logger.info("Cleaning data...")
-        clean_df = clean_data(raw_df)
-        
-        logger.info("Calculating KPIs...")
-        final_df = calculate_kpis(clean_df)
-        
-        output_path = '/tmp/crypto_processed.pkl'
-        final_df.to_pickle(output_path)
+        with stage('transform', rows_in=len(raw_df)) as m:
+            clean_df = clean_data(raw_df)
+
+            logger.info("Calculating KPIs...")
+            final_df = calculate_kpis(clean_df, columns=METRICS_COLUMNS)
+            m.rows_out = len(final_df)
+
+        # Pre-load validation: bad rows are quarantined (or the shard fails) before the load task.
+        # Only the rows the incremental load will write are validated; the KPI lookback rows
+        # already in the DB are context for the spike check.
+        logger.info("Validating batch...")
+        with stage('validate', rows_in=len(final_df)) as m:
+            final_df, report = validate_batch(final_df, watermarks=get_latest_dates_by_coin(get_engine()),
+                                              nulls=nulls)
+            m.rows_out = len(final_df)
+        logger.info(f"Validation report: {report.to_dict()}")
+        write_textfile(_shard_name('transform'))
+
+        name = _shard_name('processed')
+        output_path = store.write(name, final_df)
         logger.info(f"Transformation complete. Saved {len(final_df)} rows to {output_path}")
-        return output_path
+        return name
 
-    def load_to_supabase_task(**context):
+    @task
+    def load_to_supabase(processed_name):
         """
-        Loads processed data into Supabase using incremental logic.
+        Loads a shard's processed data into Supabase using incremental logic.
         """
         logger.info("Starting load task...")
-        input_path = context['ti'].xcom_pull(task_ids='transform_prices_and_metrics')
-        logger.info(f"Reading processed data from {input_path}...")
-        df = pd.read_pickle(input_path)
+        store = IntermediateStore(get_current_context()['run_id'])
+        logger.info(f"Reading processed data from {store.path(processed_name)}...")
+        # Only the columns the prices/metrics tables persist
+        df = store.read(processed_name,
+                        columns=['coin_id', 'date', 'price', 'volume', 'market_cap'] + METRICS_COLUMNS)
         
         logger.info("Loading to Supabase (Incremental Mode)...")
-        # We use our existing load function
+        # We use our existing load function. Shards hold disjoint coins, so their
+        # per-coin incremental loads don't conflict when they run concurrently.
         try:
-            load_data_to_supabase(df, incremental=True)
+            with stage('load', rows_in=len(df)):
+                load_data_to_supabase(df, incremental=True)
             logger.info("Load complete.")
         except Exception as e:
             logger.error(f"Load failed: {e}")
             raise e
+        finally:
+            write_textfile(_shard_name('load'))
+
+    @task_group(group_id='shard')
+    def process_shard(coins):
+        """
+        Extract -> transform -> load for one shard. Each shard runs (and retries) on its own.
+        """
+        load_to_supabase(transform_prices_and_metrics(extract_cryptos(coins)))
+
+    def fill_series_gaps(**context):
+        """
+        Finds missing bars inside each coin's series with one window-function query and
+        refetches only those ranges, recomputing the KPI rows whose windows cover them.
+        """
+        if not GAP_FILL_ENABLED:
+            logger.info("Gap filling disabled (GAP_FILL_ENABLED=false).")
+            return None
+        try:
+            with stage('gap_scan'):
+                summary = scan_and_fill(get_engine())
+        finally:
+            write_textfile('gap_fill')
+        if summary['failed']:
+            logger.warning(f"{len(summary['failed'])} gaps could not be filled; they will be retried next run.")
+        return {'gaps': summary['gaps'], 'filled': summary['filled'], 'rows': summary['rows']}
 
     def check_data_quality(**context):
         """
-        Validates data in Supabase with multiple quality checks.
+        Validates data in Supabase with the shared declarative checks (src/data_quality.py).
+        All metrics come from a single aggregated scan; with DQ_SCOPE=batch the scan is
+        limited to the shards' coins over the last days, which is what this run loaded.
+        Shards were already validated in memory before loading, so in that case only the
+        cheap confirmation checks run here.
         """
         try:
             # Try Airflow Connection first
-            pg_hook = PostgresHook(postgres_conn_id='supabase_conn')
-            conn = pg_hook.get_conn()
-            cursor = conn.cursor()
-        except:
+            engine = PostgresHook(postgres_conn_id='supabase_conn').get_sqlalchemy_engine()
+        except Exception:
             logger.warning("Airflow Connection 'supabase_conn' not found. Using local config.")
             engine = get_engine()
-            conn = engine.raw_connection()
-            cursor = conn.cursor()
-
-        logger.info("--- Running Data Quality Checks ---")
-
-        # Check 1: Count rows
-        cursor.execute("SELECT COUNT(*) FROM cryptocurrency_prices")
-        count = cursor.fetchone()[0]
-        logger.info(f"Check 1 - Total rows: {count}")
-        if count == 0:
-            logger.error("DQ Failed: Table 'cryptocurrency_prices' is empty.")
-            raise ValueError("DQ Failed: Table 'cryptocurrency_prices' is empty.")
-            
-        # Check 2: Freshness (Data within last 48 hours)
-        cursor.execute("SELECT MAX(price_timestamp) FROM cryptocurrency_prices")
-        max_date = cursor.fetchone()[0]
-        logger.info(f"Check 2 - Latest date in DB: {max_date}")
-        
-        if max_date:
-            # Convert to datetime if it's a string or date object
-            if isinstance(max_date, str):
-                max_date = datetime.strptime(max_date, '%Y-%m-%d %H:%M:%S') # Adjust format as needed
-            elif hasattr(max_date, 'to_pydatetime'): # Pandas timestamp
-                max_date = max_date.to_pydatetime()
-            # If it's datetime.date, convert to datetime
-            if type(max_date).__name__ == 'date':
-                max_date = datetime.combine(max_date, datetime.min.time())
-
-            days_diff = (datetime.now() - max_date).days
-            if days_diff > 2:
-                logger.error(f"DQ Failed: Data is too old. Latest date: {max_date}, Current: {datetime.now()}")
-                raise ValueError(f"DQ Failed: Data is {days_diff} days old (Threshold: 2 days).")
-        
-        # Check 3: Null Values in Critical Columns
-        cursor.execute("""
-            SELECT COUNT(*) 
-            FROM cryptocurrency_prices 
-            WHERE price IS NULL OR volume IS NULL OR market_cap IS NULL
-        """)
-        null_count = cursor.fetchone()[0]
-        logger.info(f"Check 3 - Null critical values: {null_count}")
-        if null_count > 0:
-             logger.error("DQ Failed: Found null values in critical columns (price/volume/market_cap).")
-             raise ValueError(f"DQ Failed: Found {null_count} rows with nulls in critical columns.")
-        
-        # Check 4: Duplicates (Coin + Date)
-        cursor.execute("""
-            SELECT COUNT(*) FROM (
-                SELECT coin, price_timestamp, COUNT(*) 
-                FROM cryptocurrency_prices 
-                GROUP BY coin, price_timestamp 
-                HAVING COUNT(*) > 1
-            ) sub
-        """)
-        dup_count = cursor.fetchone()[0]
-        logger.info(f"Check 4 - Duplicate (Coin+Date) groups: {dup_count}")
-        if dup_count > 0:
-            logger.error(f"DQ Failed: Found {dup_count} duplicate groups in 'cryptocurrency_prices'.")
-            raise ValueError(f"DQ Failed: Found {dup_count} duplicate groups in 'cryptocurrency_prices'.")
-
-        # Check 5: Symbol Consistency
-        cursor.execute("SELECT COUNT(DISTINCT coin) FROM cryptocurrency_prices")
-        unique_coins = cursor.fetchone()[0]
-        logger.info(f"Check 5 - Unique Coins Tracked: {unique_coins}")
-        if unique_coins < 5:
-            logger.warning("WARNING: Less than 5 coins tracked. Is extraction complete?")
-
-        logger.info("--- Data Quality Checks Completed Successfully ---")
-        
-        cursor.close()
-        conn.close()
+
+        scope = recent_scope(COINS, days=KPI_LOOKBACK_DAYS) if DQ_SCOPE == 'batch' else None
+        checks = CONFIRMATION_CHECKS if scope and VALIDATION_MODE != 'off' else None
+        try:
+            with stage('data_quality'):
+                report = run_all_checks(engine, scope=scope, checks=checks)
+        finally:
+            write_textfile('data_quality')
+        # Per-check results and timings for the task's XCom
+        return {
+            'scan_seconds': report.scan_seconds,
+            'checks': {r.name: {'passed': r.passed, 'severity': r.severity, 'seconds': r.seconds}
+                       for r in report.results},
+        }
+
+    def cleanup_intermediate(**context):
+        """
+        Removes this run's intermediate datasets once the data is loaded and validated.
+        """
+        IntermediateStore(context['run_id']).cleanup()
 
     # Define Tasks
-    t1 = PythonOperator(
-        task_id='extract_cryptos',
-        python_callable=extract_cryptos,
-        provide_context=True,
-    )
+    # Fan-out: one mapped task group per shard of COINS
+    shards = process_shard.expand(coins=plan_shards())
 
-    t2 = PythonOperator(
-        task_id='transform_prices_and_metrics',
-        python_callable=transform_prices_and_metrics,
+    # Gaps are filled once every shard has finished, before validating
+    gaps = PythonOperator(
+        task_id='fill_series_gaps',
+        python_callable=fill_series_gaps,
         provide_context=True,
+        trigger_rule=TriggerRule.ALL_DONE,
     )
 
-    t3 = PythonOperator(
-        task_id='load_to_supabase',
-        python_callable=load_to_supabase_task,
+    # Reduce: data quality runs once every shard has finished, even if some failed,
+    # so the loaded shards are still validated
+    dq = PythonOperator(
+        task_id='data_quality_checks',
+        python_callable=check_data_quality,
         provide_context=True,
+        trigger_rule=TriggerRule.ALL_DONE,
     )
 
-    t4 = PythonOperator(
-        task_id='data_quality_checks',
-        python_callable=check_data_quality,
+    # Datasets are kept if any shard failed, so its tasks can be cleared and retried
+    cleanup = PythonOperator(
+        task_id='cleanup_intermediate',
+        python_callable=cleanup_intermediate,
         provide_context=True,
     )
 
     # Define Dependencies
-    t1 >> t2 >> t3 >> t4
+    shards >> gaps >> dq
+    [shards, dq] >> cleanup
@@ -1,24 +1,29 @@
 -- Consultas Analíticas Avanzadas
--- Diseñadas para PostgreSQL (Supabase / Render / Railway)
+-- Diseñadas para PostgreSQL (Supabase / Render / Railway). También se ejecutan sin cambios
+-- sobre el backend embebido DuckDB y, con la resta de intervalos traducida, sobre SQLite
+-- (src/db/embedded.py: python -m src.db.embedded analytics)
 
 -- 1. Rankings de Volatilidad Mensual
--- Clasifica las monedas por su volatilidad en los últimos 30 días.
-WITH monthly_stats AS (
-    SELECT 
-        coin as coin_id, -- Ajuste a nombre de columna real si es necesario
-        STDDEV(price) / AVG(price) * 100 as volatility_coef_var, -- Coeficiente de variación como proxy simple si daily_return no está en columna
-        -- Nota: Si tienes daily_return precalculado en KPIs, úsalo.
-        -- Asumiendo tabla de métricas separada o join, aquí hacemos un ejemplo simple sobre precios.
-        AVG(price) as avg_price
-    FROM cryptocurrency_prices
-    WHERE price_timestamp > NOW() - INTERVAL '30 days'
-    GROUP BY coin
+-- Clasifica las monedas por su volatilidad en los últimos 30 días: la volatilidad móvil
+-- de 30 días (desviación estándar de los retornos diarios, %) al cierre de la semana más
+-- reciente de cryptocurrency_rollup_weekly. Lee una fila por moneda y semana en lugar
+-- de recorrer la tabla de precios completa.
+-- Última semana por moneda con ROW_NUMBER (portable: DISTINCT ON solo existe en PostgreSQL y DuckDB).
+WITH latest AS (
+    SELECT
+        coin as coin_id,
+        volatility_30d,
+        avg_daily_return * 100 as avg_daily_return_pct,
+        ROW_NUMBER() OVER (PARTITION BY coin ORDER BY period_start DESC) as rn
+    FROM cryptocurrency_rollup_weekly
 )
 SELECT 
     coin_id,
-    volatility_coef_var,
-    RANK() OVER (ORDER BY volatility_coef_var DESC) as risk_rank
-FROM monthly_stats
+    volatility_30d,
+    avg_daily_return_pct,
+    RANK() OVER (ORDER BY volatility_30d DESC) as risk_rank
+FROM latest
+WHERE rn = 1
 ORDER BY risk_rank ASC;
 
 -- 2. Detección de Días de Alto Crecimiento ("Pump Days")
@@ -36,10 +41,12 @@ WHERE (p1.price - p2.price) / p2.price > 0.10 -- Filtro de crecimiento > 10%
 ORDER BY daily_growth_pct DESC;
 
 -- 3. Volumen Acumulado Mensual
+-- Desde el rollup mensual (mantenido por la carga), no desde la tabla de hechos.
 SELECT 
     coin,
-    DATE_TRUNC('month', price_timestamp) as mes,
-    SUM(volume) as volumen_total_mes
-FROM cryptocurrency_prices
-GROUP BY coin, mes
+    period_start as mes,
+    volume as volumen_total_mes,
+    open, high, low, close,
+    period_return
+FROM cryptocurrency_rollup_monthly
 ORDER BY mes DESC, volumen_total_mes DESC;
@@ -0,0 +1,46 @@
+-- Esquema particionado (opcional) para PostgreSQL: una partición por mes sobre
+-- price_timestamp, índice BRIN temporal y clave primaria cubriente (coin, price_timestamp).
+-- Equivalente a `python -m src.db.partitions migrate` sobre una base vacía; ese comando
+-- además migra las tablas planas existentes y crea las particiones mensuales.
+-- Las particiones futuras se mantienen con `python -m src.db.partitions maintain`
+-- (o automáticamente al cargar con PARTITIONED_TABLES=true).
+
+CREATE TABLE IF NOT EXISTS cryptocurrency_prices (
+    row_index BIGINT,
+    coin TEXT NOT NULL,
+    price_timestamp TIMESTAMP NOT NULL,
+    price NUMERIC,
+    volume NUMERIC,
+    market_cap NUMERIC,
+    PRIMARY KEY (coin, price_timestamp) INCLUDE (price, volume, market_cap)
+) PARTITION BY RANGE (price_timestamp);
+
+CREATE TABLE IF NOT EXISTS cryptocurrency_prices_default PARTITION OF cryptocurrency_prices DEFAULT;
+
+CREATE INDEX IF NOT EXISTS cryptocurrency_prices_ts_brin ON cryptocurrency_prices USING BRIN (price_timestamp) WITH (pages_per_range = 32);
+
+CREATE TABLE IF NOT EXISTS cryptocurrency_metrics (
+    coin TEXT NOT NULL,
+    price_timestamp TIMESTAMP NOT NULL,
+    price_change_24h NUMERIC,
+    price_change_7d NUMERIC,
+    price_change_30d NUMERIC,
+    market_cap_change_24h NUMERIC,
+    market_cap_change_7d NUMERIC,
+    market_cap_change_30d NUMERIC,
+    volume_change_24h NUMERIC,
+    volume_change_7d NUMERIC,
+    volume_change_30d NUMERIC,
+    daily_return NUMERIC,
+    profitability_30d NUMERIC,
+    volatility_30d NUMERIC,
+    PRIMARY KEY (coin, price_timestamp)
+) PARTITION BY RANGE (price_timestamp);
+
+CREATE TABLE IF NOT EXISTS cryptocurrency_metrics_default PARTITION OF cryptocurrency_metrics DEFAULT;
+
+CREATE INDEX IF NOT EXISTS cryptocurrency_metrics_ts_brin ON cryptocurrency_metrics USING BRIN (price_timestamp) WITH (pages_per_range = 32);
+
+-- Ejemplo de partición mensual (las crea src/db/partitions.py)
+-- CREATE TABLE cryptocurrency_prices_p202401 PARTITION OF cryptocurrency_prices
+--     FOR VALUES FROM ('2024-01-01') TO ('2024-02-01');
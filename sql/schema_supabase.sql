@@ -27,9 +27,74 @@ CREATE TABLE IF NOT EXISTS cryptocurrency_metrics (
     volume_change_24h NUMERIC,
     volume_change_7d NUMERIC,
     volume_change_30d NUMERIC,
+    daily_return NUMERIC,
+    profitability_30d NUMERIC,
+    volatility_30d NUMERIC,
     PRIMARY KEY (coin, price_timestamp)
 );
 
+-- Migración para tablas creadas antes de persistir retorno diario, rentabilidad y volatilidad
+ALTER TABLE cryptocurrency_metrics ADD COLUMN IF NOT EXISTS daily_return NUMERIC;
+ALTER TABLE cryptocurrency_metrics ADD COLUMN IF NOT EXISTS profitability_30d NUMERIC;
+ALTER TABLE cryptocurrency_metrics ADD COLUMN IF NOT EXISTS volatility_30d NUMERIC;
+
 -- Índices para mejorar rendimiento de consultas por fecha
 CREATE INDEX IF NOT EXISTS idx_prices_date ON cryptocurrency_prices(price_timestamp);
 CREATE INDEX IF NOT EXISTS idx_metrics_date ON cryptocurrency_metrics(price_timestamp);
+
+-- Tablas: cryptocurrency_rollup_weekly / cryptocurrency_rollup_monthly
+-- Agregados por moneda y periodo (semana ISO / mes) que mantiene la carga para los
+-- periodos que toca cada lote (src/load/rollups.py). Pensadas para dashboards:
+-- unos cientos de filas en lugar de recorrer las tablas de hechos.
+CREATE TABLE IF NOT EXISTS cryptocurrency_rollup_weekly (
+    coin TEXT NOT NULL,
+    period_start TIMESTAMP NOT NULL,
+    open NUMERIC,
+    high NUMERIC,
+    low NUMERIC,
+    close NUMERIC,
+    volume NUMERIC,
+    n_bars INTEGER,
+    period_return NUMERIC,      -- % entre la primera y la última barra del periodo
+    avg_daily_return NUMERIC,   -- estadísticos de daily_return (fracción)
+    std_daily_return NUMERIC,
+    min_daily_return NUMERIC,
+    max_daily_return NUMERIC,
+    volatility_30d NUMERIC,     -- volatilidad móvil de 30 días al cierre del periodo (%)
+    PRIMARY KEY (coin, period_start)
+);
+CREATE TABLE IF NOT EXISTS cryptocurrency_rollup_monthly (LIKE cryptocurrency_rollup_weekly INCLUDING ALL);
+
+-- Tablas horarias (GRANULARITY=hourly): mismo esquema, barras de 1 hora.
+-- Se separan de las diarias para que las ventanas de KPIs y las consultas no mezclen granularidades.
+CREATE TABLE IF NOT EXISTS cryptocurrency_prices_hourly (LIKE cryptocurrency_prices INCLUDING ALL);
+CREATE TABLE IF NOT EXISTS cryptocurrency_metrics_hourly (LIKE cryptocurrency_metrics INCLUDING ALL);
+CREATE TABLE IF NOT EXISTS cryptocurrency_rollup_weekly_hourly (LIKE cryptocurrency_rollup_weekly INCLUDING ALL);
+CREATE TABLE IF NOT EXISTS cryptocurrency_rollup_monthly_hourly (LIKE cryptocurrency_rollup_weekly INCLUDING ALL);
+
+-- Tabla: etl_backfill_checkpoint
+-- Unidades (moneda, ventana) ya cargadas por el backfill histórico (src/etl/backfill.py);
+-- al relanzarlo solo se procesan las que no aparecen aquí.
+CREATE TABLE IF NOT EXISTS etl_backfill_checkpoint (
+    coin VARCHAR(50) NOT NULL,
+    granularity VARCHAR(10) NOT NULL,
+    window_start TIMESTAMP NOT NULL,
+    window_end TIMESTAMP NOT NULL,
+    rows_loaded INTEGER NOT NULL,
+    completed_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (coin, granularity, window_start)
+);
+
+-- Tabla: cryptocurrency_ticks
+-- Cotizaciones intradía que añade el servicio de micro-lotes (src/realtime.py), una fila
+-- por moneda y `last_updated_at` de CoinGecko; la barra en curso de las tablas de
+-- precios y métricas se actualiza en su sitio a partir de ellas.
+CREATE TABLE IF NOT EXISTS cryptocurrency_ticks (
+    coin VARCHAR(50) NOT NULL,
+    tick_timestamp TIMESTAMP NOT NULL,
+    price NUMERIC,
+    volume_24h NUMERIC,
+    market_cap NUMERIC,
+    received_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (coin, tick_timestamp)
+);
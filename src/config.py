@@ -1,4 +1,5 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -19,6 +20,84 @@ COINS = [
 # Configuraciones de API
 DAYS_TO_FETCH = 365  # Limitar a 365 días para el plan gratuito de la API
 VS_CURRENCY = 'usd'
+# Granularidad de las barras: 'daily' o 'hourly'. CoinGecko solo devuelve puntos horarios
+# (granularidad automática) para rangos de hasta 90 días, así que en modo horario se piden
+# como máximo HOURLY_MAX_DAYS días y se cargan en tablas *_hourly.
+GRANULARITY = os.getenv('GRANULARITY', 'daily')
+HOURLY_MAX_DAYS = 90
+# Monedas por chunk al procesar extract -> transform -> load (0 = todas juntas). Acota la
+# memoria en modo horario o con universos grandes.
+PROCESS_CHUNK_COINS = int(os.getenv('PROCESS_CHUNK_COINS', '0'))
+# Días de historia previos al watermark necesarios para las ventanas de calculate_kpis
+# (pct_change de 30 periodos + volatilidad móvil de 30 retornos).
+KPI_LOOKBACK_DAYS = 31
+# Modo de cálculo de KPIs: 'batch' (recalcula sobre toda la historia extraída) o
+# 'incremental' (avanza el estado persistido de ventanas móviles, ver src/transform/kpi_state.py)
+KPI_MODE = os.getenv('KPI_MODE', 'batch')
+KPI_STATE_PATH = os.getenv('KPI_STATE_PATH', os.path.join('data', 'kpi_state.json'))
+# Permite apuntar a un servidor mock local (benchmarks/tests). Vacío = API pública.
+COINGECKO_API_URL = os.getenv('COINGECKO_API_URL')
+
+# Extracción concurrente
+# El plan gratuito de CoinGecko admite ~30 llamadas/minuto.
+EXTRACT_MAX_WORKERS = int(os.getenv('EXTRACT_MAX_WORKERS', '4'))
+API_RATE_LIMIT_PER_MINUTE = float(os.getenv('API_RATE_LIMIT_PER_MINUTE', '30'))
+API_RATE_LIMIT_BURST = int(os.getenv('API_RATE_LIMIT_BURST', '5'))
+API_MAX_RETRIES = int(os.getenv('API_MAX_RETRIES', '5'))
+API_BACKOFF_BASE_SECONDS = float(os.getenv('API_BACKOFF_BASE_SECONDS', '2'))
+API_BACKOFF_MAX_SECONDS = float(os.getenv('API_BACKOFF_MAX_SECONDS', '60'))
+
+# Backfill histórico por (moneda, ventana) con checkpoint (src/etl/backfill.py):
+# días por unidad de trabajo (0 = 365 en diario, 30 en horario)
+BACKFILL_WINDOW_DAYS = int(os.getenv('BACKFILL_WINDOW_DAYS', '0'))
+
+# Detección y relleno de huecos en las series (src/etl/gaps.py) tras cada carga
+# incremental: solo se buscan en los últimos GAP_SCAN_DAYS días (0 = toda la historia)
+GAP_FILL_ENABLED = os.getenv('GAP_FILL_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+GAP_SCAN_DAYS = int(os.getenv('GAP_SCAN_DAYS', '365'))
+
+# Modo de run_pipeline: 'staged' (extract -> transform -> load por etapas, por chunks) o
+# 'streaming' (src/streaming.py: cada moneda fluye por las etapas con colas acotadas)
+PIPELINE_MODE = os.getenv('PIPELINE_MODE', 'staged')
+# Frames por cola entre etapas (acota la memoria en modo streaming)
+STREAM_QUEUE_DEPTH = int(os.getenv('STREAM_QUEUE_DEPTH', '4'))
+# Máximo de monedas que el hilo de carga agrupa en una sola carga
+STREAM_LOAD_BATCH_COINS = int(os.getenv('STREAM_LOAD_BATCH_COINS', '8'))
+
+# Servicio de micro-lotes (src/realtime.py): segundos entre consultas de precio actual
+REALTIME_POLL_SECONDS = float(os.getenv('REALTIME_POLL_SECONDS', '60'))
+
+# Tamaño de shard del DAG: cada grupo de COIN_SHARD_SIZE monedas se extrae, transforma
+# y carga en su propia instancia de tareas (dynamic task mapping)
+COIN_SHARD_SIZE = int(os.getenv('COIN_SHARD_SIZE', '3'))
+
+# Caché local de respuestas de CoinGecko (reintentos/backfills del mismo día sin gastar cuota)
+API_CACHE_ENABLED = os.getenv('API_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+API_CACHE_DIR = os.getenv('API_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'crypto_etl_cache'))
+API_CACHE_TTL_SECONDS = int(os.getenv('API_CACHE_TTL_SECONDS', str(12 * 3600)))
+API_CACHE_MAX_BYTES = int(os.getenv('API_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+
+# Tipos compactos en todo el pipeline (src/transform/dtypes.py): coin_id categórico y
+# fechas datetime64[s]. KPI_FLOAT_DTYPE='float32' reduce a la mitad las columnas de KPIs
+# en porcentaje (≈7 cifras significativas, suficiente para cambios porcentuales).
+LEAN_DTYPES = os.getenv('LEAN_DTYPES', 'true').lower() in ('1', 'true', 'yes')
+KPI_FLOAT_DTYPE = os.getenv('KPI_FLOAT_DTYPE', 'float64')
+
+# Procesos para clean_data + calculate_kpis repartidos por moneda (src/transform/parallel.py).
+# 1 = secuencial en el proceso principal.
+TRANSFORM_MAX_WORKERS = int(os.getenv('TRANSFORM_MAX_WORKERS', '1'))
+
+# Almacén intermedio entre tareas del DAG (src/utils/intermediate_store.py):
+# un directorio por ejecución, particionado por moneda
+INTERMEDIATE_DIR = os.getenv('INTERMEDIATE_DIR', os.path.join(tempfile.gettempdir(), 'crypto_etl_runs'))
+# 'arrow' (IPC sin comprimir, lectura memory-map casi sin copia) o 'parquet' (comprimido, más lento)
+INTERMEDIATE_FORMAT = os.getenv('INTERMEDIATE_FORMAT', 'arrow')
+
+# Instrumentación por etapa (src/utils/metrics.py): tiempos, CPU, memoria pico, filas y
+# llamadas a API/base como líneas de log JSON. Si METRICS_TEXTFILE_DIR está definido se
+# escribe además un .prom por ejecución para el collector textfile de node_exporter.
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+METRICS_TEXTFILE_DIR = os.getenv('METRICS_TEXTFILE_DIR', '')
 
 # Configuraciones de Base de Datos
 # Prioridad: 
@@ -39,3 +118,51 @@ if not DATABASE_URL:
 # Asegurar que usamos el driver correcto para SQLAlchemy si no se especifica
 if DATABASE_URL and DATABASE_URL.startswith('postgres://'):
     DATABASE_URL = DATABASE_URL.replace('postgres://', 'postgresql://', 1)
+
+# Backend de almacenamiento: 'postgres' (DATABASE_URL) o embebido, sin servidor
+# (src/db/embedded.py): 'duckdb' (cae a SQLite si DuckDB no está instalado) o 'sqlite'
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'postgres')
+EMBEDDED_DB_PATH = os.getenv('EMBEDDED_DB_PATH', os.path.join('data', 'crypto.duckdb'))
+
+# Tablas particionadas por mes sobre price_timestamp (sql/schema_partitioned.sql,
+# src/db/partitions.py). Si está activo, la carga crea antes las particiones que necesite.
+PARTITIONED_TABLES = os.getenv('PARTITIONED_TABLES', 'false').lower() in ('1', 'true', 'yes')
+# Meses futuros que el mantenimiento deja creados por adelantado
+PARTITION_MONTHS_AHEAD = int(os.getenv('PARTITION_MONTHS_AHEAD', '3'))
+
+# Método de carga: 'copy' (COPY FROM STDIN, solo PostgreSQL) o 'insert' (to_sql con INSERTs)
+LOAD_METHOD = os.getenv('LOAD_METHOD', 'copy')
+COPY_CHUNKSIZE = int(os.getenv('COPY_CHUNKSIZE', '100000'))
+# Modo de escritura: 'append' (INSERT, falla con claves existentes) o
+# 'upsert' (staging + INSERT ... ON CONFLICT DO UPDATE, idempotente)
+WRITE_MODE = os.getenv('WRITE_MODE', 'append')
+# Carga paralela: prices y metrics se copian a staging en conexiones distintas y se
+# fusionan en una única transacción (solo PostgreSQL)
+LOAD_PARALLEL = os.getenv('LOAD_PARALLEL', 'false').lower() in ('1', 'true', 'yes')
+
+# Rollups semanales/mensuales por moneda (src/load/rollups.py) que la carga mantiene
+# para los periodos que toca cada lote
+ROLLUPS_ENABLED = os.getenv('ROLLUPS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+
+# Validación en memoria de cada lote antes de la carga (src/transform/validate.py):
+# 'quarantine' aparta las filas con problemas a QUARANTINE_DIR y carga el resto,
+# 'reject' falla el lote sin tocar la base, 'off' no valida.
+VALIDATION_MODE = os.getenv('VALIDATION_MODE', 'quarantine')
+# Umbral del z-score robusto (mediana/MAD de los retornos) para picos de precio/volumen
+VALIDATION_ZSCORE = float(os.getenv('VALIDATION_ZSCORE', '8'))
+# Barras de retraso respecto al resto del lote a partir de las que una moneda se avisa como desactualizada
+VALIDATION_STALE_BARS = int(os.getenv('VALIDATION_STALE_BARS', '2'))
+QUARANTINE_DIR = os.getenv('QUARANTINE_DIR', os.path.join('data', 'quarantine'))
+
+# Checks de calidad (src/data_quality.py): retraso máximo en días, monedas mínimas
+# esperadas (solo aviso) y alcance: 'batch' (rango de claves del lote cargado) o
+# 'full' (toda la tabla, en un solo scan)
+DQ_MAX_DAYS_LAG = int(os.getenv('DQ_MAX_DAYS_LAG', '2'))
+DQ_MIN_COINS = int(os.getenv('DQ_MIN_COINS', '5'))
+DQ_SCOPE = os.getenv('DQ_SCOPE', 'batch')
+
+# Pool de conexiones compartido (src/db/connection.py)
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '5'))
+DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes')
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', '0'))  # 0 = sin límite
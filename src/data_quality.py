@@ -1,103 +1,226 @@
-from sqlalchemy import text
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable
+
+import pandas as pd
+from sqlalchemy import DateTime, bindparam, text
+from src.config import COINS, DQ_MAX_DAYS_LAG, DQ_MIN_COINS, GRANULARITY
+from src.load.load_db import table_names
 from src.utils.logger import setup_logger
-from datetime import datetime, timedelta
 
 logger = setup_logger("data_quality")
 
-def check_no_nulls(engine):
+# Métricas que necesitan los checks, como expresiones de agregación sobre la tabla de
+# precios. Todas se calculan en una única consulta (un solo recorrido de la tabla o del
+# rango de claves del lote). Los duplicados se detectan comparando cada fila con la
+# anterior en orden (coin, price_timestamp): en PostgreSQL ese orden sale del índice de
+# la clave primaria, sin el sort que necesitaría COUNT(DISTINCT (coin, price_timestamp)).
+METRICS = {
+    'row_count': "COUNT(*)",
+    'max_timestamp': "MAX(price_timestamp)",
+    'null_key_rows': "SUM(CASE WHEN coin IS NULL OR price_timestamp IS NULL OR price IS NULL THEN 1 ELSE 0 END)",
+    'null_value_rows': "SUM(CASE WHEN volume IS NULL OR market_cap IS NULL THEN 1 ELSE 0 END)",
+    'distinct_coins': "COUNT(DISTINCT coin)",
+    'duplicate_keys': "SUM(CASE WHEN coin = prev_coin AND price_timestamp = prev_timestamp THEN 1 ELSE 0 END)",
+}
+# Métricas que necesitan la fila anterior (columnas prev_*)
+WINDOW_METRICS = {'duplicate_keys'}
+
+
+@dataclass(frozen=True)
+class QualityCheck:
     """
-    Verifica que no existan valores NULL en columnas críticas: coin, price_timestamp, price.
+    Check declarativo: `passes(metrics)` recibe el dict de métricas calculadas y
+    `message` se formatea con ellas. Los de `severity='warning'` solo se registran.
     """
-    logger.info("Ejecutando check: No hay NULLs en columnas críticas...")
-    
-    query = """
-    SELECT COUNT(*) 
-    FROM cryptocurrency_prices 
-    WHERE coin IS NULL 
-       OR price_timestamp IS NULL 
-       OR price IS NULL;
+    name: str
+    metrics: tuple
+    passes: Callable
+    message: str
+    severity: str = 'error'
+
+
+@dataclass
+class CheckResult:
+    name: str
+    passed: bool
+    severity: str
+    message: str
+    seconds: float
+
+
+def _lag_days(max_timestamp, today=None):
     """
-    
-    with engine.connect() as conn:
-        count = conn.execute(text(query)).scalar()
-        
-    if count > 0:
-        msg = f"FALLÓ Data Quality Check: Se encontraron {count} filas con NULLs en coin/date/price."
-        logger.error(msg)
-        raise ValueError(msg)
-    
-    logger.info("PASÓ: No se encontraron valores NULL.")
+    Días entre la última fecha cargada y hoy (None si la tabla o el rango están vacíos).
+    """
+    if max_timestamp is None:
+        return None
+    today = today or datetime.now().date()
+    return (today - pd.Timestamp(max_timestamp).date()).days
 
-def check_duplicates(engine):
+
+# Checks compartidos por src/main.py y el DAG (check_data_quality)
+CHECKS = [
+    QualityCheck('not_empty', ('row_count',), lambda m: m['row_count'] > 0,
+                 "Filas: {row_count}"),
+    QualityCheck('no_null_keys', ('null_key_rows',), lambda m: m['null_key_rows'] == 0,
+                 "Filas con NULLs en coin/date/price: {null_key_rows}"),
+    QualityCheck('no_null_values', ('null_value_rows',), lambda m: m['null_value_rows'] == 0,
+                 "Filas con NULLs en volume/market_cap: {null_value_rows}"),
+    QualityCheck('no_duplicates', ('duplicate_keys',), lambda m: m['duplicate_keys'] == 0,
+                 "Filas con (coin, fecha) repetidos: {duplicate_keys}"),
+    QualityCheck('freshness', ('max_timestamp',),
+                 lambda m: m['max_timestamp'] is None or _lag_days(m['max_timestamp']) <= DQ_MAX_DAYS_LAG,
+                 "Última fecha: {max_timestamp} (máximo {lag_limit} días de retraso)"),
+    QualityCheck('coin_coverage', ('distinct_coins',), lambda m: m['distinct_coins'] >= m['min_coins'],
+                 "Monedas: {distinct_coins} (mínimo esperado {min_coins})", severity='warning'),
+]
+# Confirmación barata tras un lote que pasó la validación en memoria (src/transform/validate.py):
+# NULLs y duplicados ya se comprobaron sobre el DataFrame, así que basta con confirmar que
+# las filas llegaron a la tabla y están al día (sin la ventana LAG de los duplicados).
+CONFIRMATION_CHECKS = [c for c in CHECKS if c.name in ('not_empty', 'freshness', 'coin_coverage')]
+
+
+@dataclass
+class QualityReport:
+    results: list
+    scan_seconds: float
+    metrics: dict
+
+    @property
+    def failures(self):
+        return [r for r in self.results if not r.passed and r.severity == 'error']
+
+    def log(self):
+        logger.info(f"Scan de métricas: {self.scan_seconds:.3f}s")
+        for r in self.results:
+            status = 'PASÓ' if r.passed else ('FALLÓ' if r.severity == 'error' else 'AVISO')
+            log = logger.info if r.passed else (logger.error if r.severity == 'error' else logger.warning)
+            log(f"{status} {r.name} ({r.seconds * 1000:.2f} ms): {r.message}")
+
+
+def batch_scope(df):
     """
-    Verifica que no haya duplicados para la combinación (coin, price_timestamp).
+    Rango de claves de un lote recién cargado (salida del transform): sus monedas y
+    su intervalo de fechas. Limita los checks a esas filas en lugar de a toda la tabla.
     """
-    logger.info("Ejecutando check: No hay fechas duplicadas por symbol...")
-    
-    query = """
-    SELECT coin, price_timestamp, COUNT(*)
-    FROM cryptocurrency_prices
-    GROUP BY coin, price_timestamp
-    HAVING COUNT(*) > 1
-    LIMIT 5;
+    if df.empty:
+        return None
+    return {
+        'coins': sorted(str(c) for c in df['coin_id'].unique()),
+        'start': pd.Timestamp(df['date'].min()).to_pydatetime(),
+        'end': pd.Timestamp(df['date'].max()).to_pydatetime(),
+    }
+
+
+def merge_scopes(scopes):
     """
-    
-    with engine.connect() as conn:
-        results = conn.execute(text(query)).fetchall()
-        
-    if results:
-        msg = f"FALLÓ Data Quality Check: Se encontraron duplicados (ejemplo: {results})"
-        logger.error(msg)
-        raise ValueError("Se encontraron registros duplicados para el mismo coin y fecha.")
-        
-    logger.info("PASÓ: No se encontraron duplicados.")
+    Une varios rangos de claves (p. ej. uno por chunk de monedas) en uno solo.
+    """
+    scopes = [s for s in scopes if s]
+    if not scopes:
+        return None
+    return {
+        'coins': sorted({coin for s in scopes for coin in s['coins']}),
+        'start': min(s['start'] for s in scopes),
+        'end': max(s['end'] for s in scopes),
+    }
+
+
+def recent_scope(coins=None, days=DQ_MAX_DAYS_LAG + 1, today=None):
+    """
+    Rango de claves de los últimos `days` días para `coins` (por defecto COINS), para
+    validar cargas incrementales cuando no se tiene el lote a mano (p. ej. en el DAG).
+    """
+    today = pd.Timestamp(today or datetime.now().date())
+    return {'coins': list(COINS if coins is None else coins), 'start': (today - pd.Timedelta(days=days)).to_pydatetime()}
+
+
+def metrics_query(names, table, scope=None):
+    """
+    Consulta única que calcula las métricas `names` sobre `table`, opcionalmente
+    restringida al rango de claves `scope` ({coins, start, end}).
+    """
+    select = ',\n    '.join(f"{METRICS[n]} AS {n}" for n in names)
+    where, params = [], {}
+    if scope:
+        if scope.get('coins') is not None:
+            where.append("coin IN :coins")
+            params['coins'] = list(scope['coins'])
+        for bound, op in (('start', '>='), ('end', '<=')):
+            if scope.get(bound) is not None:
+                where.append(f"price_timestamp {op} :{bound}")
+                params[bound] = scope[bound]
+    source = table + (f" WHERE {' AND '.join(where)}" if where else '')
+    if WINDOW_METRICS.intersection(names):
+        source = (f"(SELECT *, LAG(coin) OVER w AS prev_coin, LAG(price_timestamp) OVER w AS prev_timestamp "
+                  f"FROM {source} WINDOW w AS (ORDER BY coin, price_timestamp)) AS scanned")
+    sql = f"SELECT\n    {select}\nFROM {source}"
+    # Tipos explícitos: SQLite compara las fechas como texto con el formato de SQLAlchemy
+    binds = [bindparam(b, type_=DateTime()) for b in ('start', 'end') if b in params]
+    if 'coins' in params:
+        binds.append(bindparam('coins', expanding=True))
+    return text(sql).bindparams(*binds), params
 
-def check_data_freshness(engine, max_days_lag=2):
+
+def _compute_metrics(conn, names, table, scope):
+    query, params = metrics_query(names, table, scope)
+    row = conn.execute(query, params).one()
+    # SUM() sobre un rango vacío devuelve NULL
+    return {n: (v if v is not None or n == 'max_timestamp' else 0) for n, v in zip(names, row)}
+
+
+def run_checks(engine, checks=None, scope=None, granularity=GRANULARITY, single_scan=True, table=None):
     """
-    Confirma que la fecha máxima en la base de datos sea reciente (cercana a hoy).
+    Ejecuta los checks declarativos sobre la tabla de precios y devuelve un QualityReport.
+
+    Con `single_scan=True` todas las métricas se calculan en una sola consulta agregada
+    y cada check solo evalúa su condición; con `False` cada check lanza su propia
+    consulta (útil para comparar tiempos). `scope` (ver `batch_scope`/`recent_scope`)
+    limita el recorrido al rango de claves del lote. `table` sustituye a la tabla de
+    precios de `granularity` (benchmarks).
     """
-    logger.info("Ejecutando check: Frescura de datos...")
-    
-    query = "SELECT MAX(price_timestamp) FROM cryptocurrency_prices;"
-    
+    checks = CHECKS if checks is None else checks
+    table = table or table_names(granularity)[0]
+    context = {'min_coins': min(DQ_MIN_COINS, len(scope['coins'])) if scope and scope.get('coins') else DQ_MIN_COINS,
+               'lag_limit': DQ_MAX_DAYS_LAG}
+    names = list(dict.fromkeys(n for check in checks for n in check.metrics))
+
+    results = []
+    scan_seconds = 0.0
+    metrics = {}
     with engine.connect() as conn:
-        max_date = conn.execute(text(query)).scalar()
-        
-    if not max_date:
-        logger.warning("Data Quality Warning: La tabla está vacía, no se puede verificar frescura.")
-        return
-
-    # Convertir a datetime si es string (depende del driver/tipo en DB, sqlalchemy suele devolver datetime)
-    if isinstance(max_date, str):
-        max_date = datetime.fromisoformat(max_date)
-
-    now = datetime.now().date()
-    # Si max_date es datetime, extraer date. Si es date, usarlo directo.
-    if isinstance(max_date, datetime):
-        max_date = max_date.date()
-    elif isinstance(max_date, str):
-        # Fallback si viene como string
-        max_date = datetime.fromisoformat(max_date).date()
-    
-    diff = now - max_date
-    
-    if diff.days > max_days_lag:
-        msg = f"FALLÓ Data Quality Check: Los datos están desactualizados. Última fecha: {max_date}. Retraso: {diff.days} días."
-        logger.error(msg)
-        raise ValueError(msg)
-        
-    logger.info(f"PASÓ: Datos frescos. Última fecha: {max_date}")
+        if single_scan:
+            start = time.perf_counter()
+            metrics = _compute_metrics(conn, names, table, scope)
+            scan_seconds = time.perf_counter() - start
+        for check in checks:
+            start = time.perf_counter()
+            if not single_scan:
+                metrics.update(_compute_metrics(conn, list(check.metrics), table, scope))
+            values = {**metrics, **context}
+            passed = bool(check.passes(values))
+            results.append(CheckResult(check.name, passed, check.severity, check.message.format(**values),
+                                       time.perf_counter() - start))
+    if not single_scan:
+        scan_seconds = sum(r.seconds for r in results)
+    return QualityReport(results, scan_seconds, metrics)
+
 
-def run_all_checks(engine):
+def run_all_checks(engine, scope=None, granularity=GRANULARITY, checks=None):
     """
-    Ejecuta todas las validaciones de calidad de datos.
+    Ejecuta las validaciones de calidad de datos (por defecto CHECKS) en un solo scan
+    y lanza ValueError si falla algún check de severidad 'error'.
     """
     logger.info("--- Iniciando Checks de Calidad de Datos ---")
-    try:
-        check_no_nulls(engine)
-        check_duplicates(engine)
-        check_data_freshness(engine)
-        logger.info("--- Todos los Checks de Calidad PASARON exitosamente ---")
-    except Exception as e:
-        logger.error(f"Data Quality Check FALLÓ: {e}")
-        raise e
+    if scope:
+        logger.info(f"Rango validado: {len(scope.get('coins') or [])} monedas desde {scope.get('start')}")
+    report = run_checks(engine, checks=checks, scope=scope, granularity=granularity)
+    report.log()
+    if report.failures:
+        msg = "Data Quality Check FALLÓ: " + '; '.join(f"{r.name} ({r.message})" for r in report.failures)
+        logger.error(msg)
+        raise ValueError(msg)
+    logger.info("--- Todos los Checks de Calidad PASARON exitosamente ---")
+    return report
@@ -1,13 +1,43 @@
 import os
+import threading
 from dotenv import load_dotenv
 from sqlalchemy import create_engine
+from src.config import (DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_PRE_PING, DB_STATEMENT_TIMEOUT_MS, METRICS_ENABLED,
+                        STORAGE_BACKEND)
+from src.utils.metrics import instrument_engine
 
 load_dotenv()
 
-def get_engine():
+_engine = None
+_engine_pid = None
+_engine_lock = threading.Lock()
+
+def _engine_options(database_url):
+    """
+    Opciones de pool/conexión según el motor. SQLite y DuckDB no usan QueuePool ni statement_timeout.
+    """
+    if database_url.startswith(('sqlite', 'duckdb')):
+        return {}
+
+    options = {
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_pre_ping': DB_POOL_PRE_PING,
+    }
+    if database_url.startswith('postgresql') and DB_STATEMENT_TIMEOUT_MS > 0:
+        options['connect_args'] = {'options': f'-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}'}
+    return options
+
+def create_db_engine():
     """
-    Crea y devuelve un motor SQLAlchemy usando la variable de entorno DATABASE_URL.
+    Crea un motor SQLAlchemy nuevo usando la variable de entorno DATABASE_URL, o la base
+    embebida (src/db/embedded.py) con STORAGE_BACKEND=duckdb|sqlite.
     """
+    if STORAGE_BACKEND != 'postgres':
+        # Import diferido: solo hace falta con el backend embebido
+        from src.db.embedded import create_embedded_engine
+        return create_embedded_engine()
+
     database_url = os.getenv('DATABASE_URL')
     
     if not database_url:
@@ -18,8 +48,37 @@ def get_engine():
         database_url = database_url.replace("postgres://", "postgresql://", 1)
 
     try:
-        engine = create_engine(database_url)
+        engine = create_engine(database_url, **_engine_options(database_url))
         return engine
     except Exception as e:
         print(f"Error creando el motor de base de datos: {e}")
         raise e
+
+def get_engine():
+    """
+    Devuelve el motor SQLAlchemy compartido por todo el proceso.
+
+    Se crea una única vez (pool de DB_POOL_SIZE conexiones con pre-ping y
+    statement_timeout) y lo reutilizan truncate, carga y checks de calidad.
+    Tras un fork (workers de Airflow/multiprocessing) se crea un motor nuevo,
+    ya que las conexiones del pool no pueden compartirse entre procesos.
+    """
+    global _engine, _engine_pid
+    with _engine_lock:
+        if _engine is None or _engine_pid != os.getpid():
+            _engine = create_db_engine()
+            _engine_pid = os.getpid()
+            if METRICS_ENABLED:
+                instrument_engine(_engine)
+        return _engine
+
+def dispose_engine():
+    """
+    Cierra las conexiones del pool compartido (p. ej. al final de un proceso).
+    """
+    global _engine, _engine_pid
+    with _engine_lock:
+        if _engine is not None and _engine_pid == os.getpid():
+            _engine.dispose()
+        _engine = None
+        _engine_pid = None
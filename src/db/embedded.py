@@ -0,0 +1,267 @@
+"""
+Backend de almacenamiento embebido: DuckDB (columnar, con acceso directo a Parquet) o,
+si DuckDB no está instalado, SQLite. No necesita servidor ni red.
+
+Con STORAGE_BACKEND=duckdb|sqlite, `get_engine()` devuelve un motor sobre el archivo
+EMBEDDED_DB_PATH con el esquema de sql/schema_supabase.sql ya creado, así que la carga,
+los checks de calidad, los rollups y las consultas de sql/queries_analiticas.sql
+funcionan sin cambios. Además:
+
+- `export_parquet` vuelca las tablas de cualquier backend (también PostgreSQL) a
+  archivos Parquet, y `parquet_engine` abre un DuckDB en memoria con una vista por
+  archivo: consultas analíticas sobre una copia local, sin red.
+- `run_analytic_queries` ejecuta las consultas de sql/queries_analiticas.sql sobre
+  cualquier motor.
+
+Uso:
+    python -m src.db.embedded init
+    python -m src.db.embedded export --to data/parquet
+    python -m src.db.embedded analytics [--parquet data/parquet]
+"""
+import argparse
+import glob
+import importlib.util
+import os
+import re
+import sys
+
+import pandas as pd
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.pool import StaticPool
+
+from src.config import EMBEDDED_DB_PATH, STORAGE_BACKEND
+from src.utils.logger import setup_logger
+
+logger = setup_logger("embedded_db")
+
+STORAGE_BACKENDS = ('postgres', 'duckdb', 'sqlite')
+_SQL_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'sql')
+SCHEMA_PATH = os.path.join(_SQL_DIR, 'schema_supabase.sql')
+ANALYTICS_PATH = os.path.join(_SQL_DIR, 'queries_analiticas.sql')
+
+
+def duckdb_available():
+    # duckdb_engine aporta el dialecto de SQLAlchemy (duckdb:///...)
+    return all(importlib.util.find_spec(m) is not None for m in ('duckdb', 'duckdb_engine'))
+
+
+def embedded_backend(backend=STORAGE_BACKEND):
+    """
+    Backend embebido efectivo: 'duckdb' cae a 'sqlite' (con aviso) si DuckDB no está instalado.
+    """
+    if backend not in STORAGE_BACKENDS[1:]:
+        raise ValueError(f"STORAGE_BACKEND embebido no soportado: {backend}. Opciones: {STORAGE_BACKENDS[1:]}")
+    if backend == 'duckdb' and not duckdb_available():
+        logger.warning("DuckDB no está instalado (pip install duckdb duckdb-engine); se usa SQLite.")
+        return 'sqlite'
+    return backend
+
+
+def embedded_url(backend=STORAGE_BACKEND, path=EMBEDDED_DB_PATH):
+    """
+    URL de SQLAlchemy del archivo embebido. Con el fallback a SQLite el archivo cambia
+    de extensión (.sqlite) para no abrir un archivo DuckDB con SQLite.
+    """
+    backend = embedded_backend(backend)
+    if backend == 'sqlite' and path.endswith('.duckdb'):
+        path = path[:-len('.duckdb')] + '.sqlite'
+    return f"{backend}:///{path}"
+
+
+def schema_statements(dialect, path=SCHEMA_PATH):
+    """
+    Sentencias de sql/schema_supabase.sql adaptadas a un motor embebido:
+    - `CREATE TABLE x (LIKE y INCLUDING ALL)` se expande con las columnas de `y`;
+    - se omiten las migraciones `ALTER TABLE ... ADD COLUMN IF NOT EXISTS` (las tablas
+      nuevas ya tienen esas columnas);
+    - en DuckDB NUMERIC pasa a DOUBLE (su NUMERIC sin precisión es DECIMAL(18,3)).
+    """
+    with open(path, encoding='utf-8') as f:
+        sql = re.sub(r'--[^\n]*', '', f.read())
+    bodies, statements = {}, []
+    for statement in (s.strip() for s in sql.split(';')):
+        if not statement or statement.upper().startswith('ALTER TABLE'):
+            continue
+        like = re.match(r'CREATE TABLE IF NOT EXISTS (\w+) \(LIKE (\w+) INCLUDING ALL\)', statement)
+        if like:
+            statement = f"CREATE TABLE IF NOT EXISTS {like.group(1)} {bodies[like.group(2)]}"
+        table = re.match(r'CREATE TABLE IF NOT EXISTS (\w+) (\(.*\))$', statement, re.S)
+        if table:
+            bodies[table.group(1)] = table.group(2)
+        if dialect == 'duckdb':
+            statement = re.sub(r'\bNUMERIC\b', 'DOUBLE', statement)
+        statements.append(statement)
+    return statements
+
+
+def create_embedded_schema(engine):
+    """Crea (si faltan) las tablas e índices del esquema en el motor embebido."""
+    with engine.begin() as conn:
+        for statement in schema_statements(engine.dialect.name):
+            conn.execute(text(statement))
+
+
+def _sqlite_pragmas(dbapi_conn, connection_record):
+    # WAL: lectores y un escritor a la vez (carga en paralelo con checks / servicio en tiempo real)
+    cursor = dbapi_conn.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
+
+def create_embedded_engine(backend=STORAGE_BACKEND, path=EMBEDDED_DB_PATH):
+    """
+    Motor SQLAlchemy sobre el archivo embebido, con el esquema creado.
+    """
+    url = embedded_url(backend, path)
+    directory = os.path.dirname(url.split(':///', 1)[1])
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    if url.startswith('sqlite'):
+        # timeout: espera (en lugar de fallar) si otro hilo tiene el lock de escritura
+        engine = create_engine(url, connect_args={'timeout': 30})
+        event.listen(engine, 'connect', _sqlite_pragmas)
+    else:
+        engine = create_engine(url)
+    create_embedded_schema(engine)
+    logger.info(f"Base embebida {engine.dialect.name}: {url.split(':///', 1)[1]}")
+    return engine
+
+
+def schema_tables(path=SCHEMA_PATH):
+    """Tablas del esquema, en orden."""
+    return [re.match(r'CREATE TABLE IF NOT EXISTS (\w+)', s).group(1)
+            for s in schema_statements('sqlite', path) if s.startswith('CREATE TABLE')]
+
+
+def export_parquet(engine, directory, tables=None, chunksize=500_000):
+    """
+    Vuelca cada tabla a `<directory>/<tabla>.parquet` (las que no existen se omiten).
+    En DuckDB lo hace el propio motor con COPY; en el resto se lee por lotes de
+    `chunksize` filas. Devuelve {tabla: filas}.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    from sqlalchemy import inspect
+
+    os.makedirs(directory, exist_ok=True)
+    existing = set(inspect(engine).get_table_names())
+    exported = {}
+    for table in tables or schema_tables():
+        if table not in existing:
+            continue
+        path = os.path.join(directory, f"{table}.parquet")
+        if engine.dialect.name == 'duckdb':
+            with engine.begin() as conn:
+                conn.execute(text(f"COPY {table} TO '{path}' (FORMAT PARQUET)"))
+                exported[table] = conn.execute(text(f"SELECT COUNT(*) FROM {table}")).scalar()
+            continue
+        writer, rows = None, 0
+        with engine.connect() as conn:
+            for chunk in pd.read_sql(text(f"SELECT * FROM {table}"), conn, chunksize=chunksize):
+                chunk = _coerce_types(chunk)
+                batch = pa.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(path, batch.schema)
+                writer.write_table(batch.cast(writer.schema))
+                rows += len(chunk)
+        if writer is not None:
+            writer.close()
+            exported[table] = rows
+        logger.info(f"{table}: {rows} filas -> {path}")
+    return exported
+
+
+def _coerce_types(df):
+    # NUMERIC llega como Decimal (PostgreSQL) o texto (fechas en SQLite): tipos columnares
+    for column in df.columns:
+        if column.endswith(('timestamp', '_at', '_start', '_end')):
+            df[column] = pd.to_datetime(df[column])
+        elif df[column].dtype == object and column not in ('coin', 'granularity'):
+            df[column] = pd.to_numeric(df[column], errors='coerce').astype('float64')
+    return df
+
+
+def parquet_engine(directory):
+    """
+    DuckDB en memoria con una vista por archivo `<tabla>.parquet` de `directory`: las
+    consultas leen los Parquet directamente (columnar, sin red ni servidor).
+    """
+    if not duckdb_available():
+        raise ImportError("Las consultas sobre Parquet necesitan DuckDB: pip install duckdb duckdb-engine")
+    # StaticPool: una sola conexión, si no cada conexión abriría otra base en memoria sin las vistas
+    engine = create_engine('duckdb:///:memory:', poolclass=StaticPool)
+    with engine.begin() as conn:
+        for path in sorted(glob.glob(os.path.join(directory, '*.parquet'))):
+            table = os.path.splitext(os.path.basename(path))[0]
+            conn.execute(text(f"CREATE VIEW {table} AS SELECT * FROM read_parquet('{path}')"))
+    return engine
+
+
+def load_analytic_queries(path=ANALYTICS_PATH):
+    """
+    Consultas de sql/queries_analiticas.sql como lista de (título, sql); el título es
+    el primer comentario numerado de cada consulta.
+    """
+    with open(path, encoding='utf-8') as f:
+        # Cada consulta termina en ';' al final de una línea (los comentarios pueden contener ';')
+        statements = [s for s in re.split(r';[ \t]*(?:\n|$)', f.read()) if re.sub(r'--[^\n]*', '', s).strip()]
+    queries = []
+    for statement in statements:
+        title = re.search(r'--\s*(\d+\..*)', statement)
+        queries.append((title.group(1).strip() if title else statement.strip()[:40], statement.strip()))
+    return queries
+
+
+def adapt_sql(sql, dialect):
+    """
+    Traduce a SQLite la única construcción no portable de las consultas analíticas,
+    la resta de intervalos (`ts - INTERVAL '1 day'`), a `strftime(..., ts, '-1 day')`
+    con el formato de texto en que SQLAlchemy guarda los TIMESTAMP en SQLite
+    ('YYYY-MM-DD HH:MM:SS.ffffff'), para que las comparaciones de igualdad funcionen.
+    PostgreSQL y DuckDB las ejecutan tal cual.
+    """
+    if dialect != 'sqlite':
+        return sql
+    return re.sub(r"([\w.]+)\s*-\s*INTERVAL\s+'(\d+)\s+(\w+)'",
+                  r"strftime('%Y-%m-%d %H:%M:%f000', \1, '-\2 \3')", sql)
+
+
+def run_analytic_queries(engine, queries=None):
+    """Ejecuta las consultas analíticas y devuelve {título: DataFrame}."""
+    results = {}
+    with engine.connect() as conn:
+        for title, sql in queries or load_analytic_queries():
+            results[title] = pd.read_sql(text(adapt_sql(sql, engine.dialect.name)), conn)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backend embebido (DuckDB / SQLite) y exportación a Parquet.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('init', help="Crear el esquema en la base embebida (EMBEDDED_DB_PATH)")
+    export = sub.add_parser('export', help="Volcar las tablas de la base configurada a Parquet")
+    export.add_argument('--to', required=True, help="Directorio de salida")
+    analytics = sub.add_parser('analytics', help="Ejecutar sql/queries_analiticas.sql")
+    analytics.add_argument('--parquet', help="Directorio Parquet (DuckDB en memoria) en lugar de la base")
+    args = parser.parse_args(argv)
+
+    if args.command == 'init':
+        create_embedded_engine('duckdb' if STORAGE_BACKEND == 'postgres' else STORAGE_BACKEND)
+        return 0
+
+    from src.db.connection import get_engine
+    if args.command == 'export':
+        exported = export_parquet(get_engine(), args.to)
+        logger.info(f"Exportadas {len(exported)} tablas a {args.to}")
+        return 0
+
+    engine = parquet_engine(args.parquet) if args.parquet else get_engine()
+    for title, df in run_analytic_queries(engine).items():
+        print(f"\n-- {title} ({len(df)} filas)")
+        print(df.head(20).to_string(index=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
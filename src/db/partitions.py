@@ -0,0 +1,259 @@
+"""
+Esquema particionado por mes sobre price_timestamp y mantenimiento de particiones.
+
+Cada tabla (prices / metrics, diaria u horaria) pasa a ser una tabla padre
+`PARTITION BY RANGE (price_timestamp)` con:
+- una partición por mes calendario (`<tabla>_pYYYYMM`) más una `<tabla>_default`
+  para filas fuera de rango,
+- un índice BRIN sobre price_timestamp (pocos KB por partición; las filas llegan en
+  orden temporal, así que los rangos de bloques están muy correlacionados),
+- la clave primaria (coin, price_timestamp), que en prices incluye price, volume y
+  market_cap para resolver las consultas por moneda con index-only scans.
+
+Las consultas con filtro de fecha ("últimos 30 días") solo leen las particiones del
+rango (partition pruning) en lugar de la tabla completa.
+
+Uso:
+    python -m src.db.partitions migrate [--granularity hourly] [--drop-legacy]
+    python -m src.db.partitions maintain [--months-ahead 3]
+"""
+import argparse
+
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError, ProgrammingError
+
+from src.config import GRANULARITY, PARTITION_MONTHS_AHEAD
+from src.db.connection import get_engine
+from src.load.load_db import METRICS_COLUMNS, PRIMARY_KEY, TABLES, table_names
+from src.utils.logger import setup_logger
+
+logger = setup_logger("partitions")
+
+_PRICES_COLUMNS = [
+    ('row_index', 'BIGINT'),
+    ('coin', 'TEXT NOT NULL'),
+    ('price_timestamp', 'TIMESTAMP NOT NULL'),
+    ('price', 'NUMERIC'),
+    ('volume', 'NUMERIC'),
+    ('market_cap', 'NUMERIC'),
+]
+_METRICS_COLUMNS = [('coin', 'TEXT NOT NULL'), ('price_timestamp', 'TIMESTAMP NOT NULL')] + [
+    (column, 'NUMERIC') for column in METRICS_COLUMNS
+]
+# Columnas incluidas en la clave primaria de prices (índice cubriente)
+_PRICES_INCLUDE = ('price', 'volume', 'market_cap')
+# SQLSTATE de PostgreSQL de una partición creada a la vez por otra sesión: "relation already
+# exists" o, si ambas crean el tipo de fila a la vez, unique_violation en pg_type
+_DUPLICATE_TABLE = ('42P07', '23505')
+# Bloques por rango BRIN: más pequeño que el valor por defecto (128) porque una
+# partición mensual diaria ocupa pocas páginas
+BRIN_PAGES_PER_RANGE = 32
+
+
+def month_start(value):
+    """
+    Primer instante del mes de `value`.
+    """
+    return pd.Timestamp(value).to_period('M').to_timestamp()
+
+
+def month_range(start, end):
+    """
+    Inicios de mes que cubren [start, end] (ambos incluidos).
+    """
+    return list(pd.date_range(month_start(start), month_start(end), freq='MS'))
+
+
+def partition_name(table, month):
+    return f"{table}_p{pd.Timestamp(month):%Y%m}"
+
+
+def partitioned_table_sql(table, metrics=False):
+    """
+    Sentencias DDL de una tabla padre particionada (prices o, con `metrics=True`, metrics),
+    su partición default y su índice BRIN.
+    """
+    columns = _METRICS_COLUMNS if metrics else _PRICES_COLUMNS
+    definitions = ',\n    '.join(f"{name} {sql_type}" for name, sql_type in columns)
+    include = '' if metrics else f" INCLUDE ({', '.join(_PRICES_INCLUDE)})"
+    return [
+        f"CREATE TABLE IF NOT EXISTS {table} (\n    {definitions},\n"
+        f"    PRIMARY KEY ({', '.join(PRIMARY_KEY)}){include}\n"
+        f") PARTITION BY RANGE (price_timestamp)",
+        f"CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT",
+        f"CREATE INDEX IF NOT EXISTS {table}_ts_brin ON {table} "
+        f"USING BRIN (price_timestamp) WITH (pages_per_range = {BRIN_PAGES_PER_RANGE})",
+    ]
+
+
+def partitioned_schema_sql(granularity=GRANULARITY):
+    """
+    Sentencias DDL del esquema particionado (sin particiones mensuales) para la granularidad dada.
+    """
+    prices_table, metrics_table = table_names(granularity)
+    return partitioned_table_sql(prices_table) + partitioned_table_sql(metrics_table, metrics=True)
+
+
+def is_partitioned(conn, table):
+    query = text("SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:t))")
+    return bool(conn.execute(query, {'t': table}).scalar())
+
+
+def existing_partitions(conn, table):
+    query = text("SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+                 "WHERE i.inhparent = to_regclass(:t)")
+    return {row[0] for row in conn.execute(query, {'t': table})}
+
+
+def _create_month_partition(conn, table, month):
+    """
+    Crea la partición del mes moviendo antes las filas de ese rango que hubieran caído
+    en la partición default (si no, ATTACH PARTITION fallaría).
+    """
+    name = partition_name(table, month)
+    lower, upper = pd.Timestamp(month), pd.Timestamp(month) + pd.offsets.MonthBegin(1)
+    bounds = {'lower': lower.to_pydatetime(), 'upper': upper.to_pydatetime()}
+    conn.execute(text(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    conn.execute(text(f"WITH moved AS (DELETE FROM {table}_default WHERE price_timestamp >= :lower "
+                      f"AND price_timestamp < :upper RETURNING *) INSERT INTO {name} SELECT * FROM moved"), bounds)
+    conn.execute(text(f"ALTER TABLE {table} ATTACH PARTITION {name} "
+                      f"FOR VALUES FROM ('{lower:%Y-%m-%d}') TO ('{upper:%Y-%m-%d}')"))
+    return name
+
+
+def _lock_partitions(conn, table):
+    """
+    Serializa la creación de particiones de `table` entre procesos (shards del DAG,
+    unidades de backfill en paralelo): lock consultivo hasta el fin de la transacción.
+    """
+    conn.execute(text("SELECT pg_advisory_xact_lock(hashtext(:t))"), {'t': f"partitions:{table}"})
+
+
+def _create_if_missing(conn, table, month):
+    """
+    Crea la partición en un savepoint; si otra sesión sin el lock ya la creó
+    ("relation already exists") cuenta como hecha. Devuelve el nombre o None.
+    """
+    try:
+        with conn.begin_nested():
+            return _create_month_partition(conn, table, month)
+    except (ProgrammingError, IntegrityError) as e:
+        if getattr(e.orig, 'pgcode', None) not in _DUPLICATE_TABLE:
+            raise
+        logger.info(f"{partition_name(table, month)} ya existía (creada por otra sesión).")
+        return None
+
+
+def create_missing_partitions(conn, table, start, end):
+    """
+    Crea en `table` las particiones mensuales de [start, end] que aún no existen.
+    Si falta alguna, toma el lock de particiones de la tabla y vuelve a comprobar antes
+    de crear, para que dos cargas concurrentes del mismo mes no choquen.
+    """
+    months = month_range(start, end)
+    existing = existing_partitions(conn, table)
+    if all(partition_name(table, month) in existing for month in months):
+        return []
+    _lock_partitions(conn, table)
+    existing = existing_partitions(conn, table)
+    created = [_create_if_missing(conn, table, month) for month in months
+               if partition_name(table, month) not in existing]
+    return [name for name in created if name]
+
+
+def ensure_partitions(engine, start=None, end=None, months_ahead=PARTITION_MONTHS_AHEAD,
+                      granularity=GRANULARITY):
+    """
+    Crea las particiones mensuales que falten entre `start` (por defecto, el mes actual)
+    y max(`end`, hoy + `months_ahead` meses). Las tablas no particionadas se ignoran.
+    Devuelve los nombres de las particiones creadas.
+    """
+    today = pd.Timestamp.now(tz='UTC').tz_localize(None)
+    horizon = today + pd.DateOffset(months=months_ahead)
+    start = pd.Timestamp(start) if start is not None else today
+    end = max(pd.Timestamp(end), horizon) if end is not None else horizon
+
+    created = []
+    with engine.begin() as conn:
+        for table in table_names(granularity):
+            if not is_partitioned(conn, table):
+                logger.warning(f"{table} no está particionada; ejecuta `python -m src.db.partitions migrate`.")
+                continue
+            created += create_missing_partitions(conn, table, start, end)
+    if created:
+        logger.info(f"Particiones creadas: {', '.join(created)}")
+    return created
+
+
+def _rename_primary_key(conn, table):
+    """
+    La PK conserva su nombre (<tabla>_pkey) al renombrar la tabla; se renombra para
+    que la tabla nueva pueda crear la suya.
+    """
+    query = text("SELECT conname FROM pg_constraint WHERE conrelid = to_regclass(:t) AND contype = 'p'")
+    name = conn.execute(query, {'t': table}).scalar()
+    if name:
+        conn.execute(text(f"ALTER TABLE {table} RENAME CONSTRAINT {name} TO {table}_pkey"))
+
+
+def migrate_to_partitioned(engine, granularity=GRANULARITY, drop_legacy=False,
+                           months_ahead=PARTITION_MONTHS_AHEAD):
+    """
+    Convierte las tablas planas de la granularidad dada al esquema particionado en una
+    sola transacción: renombra cada tabla a `<tabla>_legacy`, crea la tabla padre, las
+    particiones que cubren sus datos (más `months_ahead` meses) y copia las filas.
+    Las tablas que no existen se crean vacías; las ya particionadas no se tocan.
+    """
+    with engine.begin() as conn:
+        legacy = {}
+        for table, columns in zip(table_names(granularity), (_PRICES_COLUMNS, _METRICS_COLUMNS)):
+            if is_partitioned(conn, table):
+                logger.info(f"{table} ya está particionada.")
+                continue
+            if conn.execute(text("SELECT to_regclass(:t)"), {'t': table}).scalar():
+                legacy[table] = (f"{table}_legacy", columns)
+                conn.execute(text(f"ALTER TABLE {table} RENAME TO {table}_legacy"))
+                _rename_primary_key(conn, f"{table}_legacy")
+
+        for statement in partitioned_schema_sql(granularity):
+            conn.execute(text(statement))
+
+        today = pd.Timestamp.now(tz='UTC').tz_localize(None)
+        for table, (old, columns) in legacy.items():
+            first, last = conn.execute(text(f"SELECT MIN(price_timestamp), MAX(price_timestamp) FROM {old}")).one()
+            months = month_range(first or today, max(pd.Timestamp(last or today), today)
+                                 + pd.DateOffset(months=months_ahead))
+            _lock_partitions(conn, table)
+            for month in months:
+                _create_month_partition(conn, table, month)
+            columns = ', '.join(name for name, _ in columns)
+            rows = conn.execute(text(f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {old}")).rowcount
+            logger.info(f"{table}: {rows} filas migradas a {len(months)} particiones mensuales.")
+            if drop_legacy:
+                conn.execute(text(f"DROP TABLE {old}"))
+        for table in table_names(granularity):
+            conn.execute(text(f"ANALYZE {table}"))
+
+    # Tablas nuevas (sin datos previos): solo las particiones a futuro
+    ensure_partitions(engine, months_ahead=months_ahead, granularity=granularity)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Migración y mantenimiento de particiones mensuales.")
+    parser.add_argument('command', choices=['migrate', 'maintain'])
+    parser.add_argument('--granularity', default=GRANULARITY, choices=sorted(TABLES))
+    parser.add_argument('--months-ahead', type=int, default=PARTITION_MONTHS_AHEAD)
+    parser.add_argument('--drop-legacy', action='store_true', help="Eliminar las tablas planas tras migrar")
+    args = parser.parse_args(argv)
+
+    engine = get_engine()
+    if args.command == 'migrate':
+        migrate_to_partitioned(engine, args.granularity, drop_legacy=args.drop_legacy,
+                               months_ahead=args.months_ahead)
+    else:
+        ensure_partitions(engine, months_ahead=args.months_ahead, granularity=args.granularity)
+
+
+if __name__ == "__main__":
+    main()
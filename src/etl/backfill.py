@@ -0,0 +1,238 @@
+"""
+Backfill histórico reanudable por unidades de trabajo (moneda, ventana de fechas).
+
+El rango [start, end) se parte en ventanas de `window_days` por moneda. Cada unidad
+pide su ventana (más el lookback de los KPIs) al endpoint de rango de CoinGecko
+(`/coins/{id}/market_chart/range`), limpia, calcula KPIs, valida y carga con upsert
+en cuanto termina, sin truncar nada. Las unidades completadas se registran en la
+tabla `etl_backfill_checkpoint`, así que si el proceso cae, volver a lanzarlo retoma
+solo las pendientes (una unidad a medio cargar se repite sin duplicar filas gracias
+al upsert).
+
+Las unidades se procesan en paralelo en un pool de hilos que comparte un TokenBucket
+(API_RATE_LIMIT_PER_MINUTE), igual que la extracción concurrente.
+
+Uso:
+    python -m src.etl.backfill --start 2019-01-01 [--end 2024-01-01] [--coins bitcoin,ethereum]
+                               [--window-days 365] [--workers 4] [--granularity daily]
+"""
+import argparse
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from datetime import datetime
+
+import pandas as pd
+from sqlalchemy import text
+
+from src.config import (API_RATE_LIMIT_PER_MINUTE, BACKFILL_WINDOW_DAYS, COINS, EXTRACT_MAX_WORKERS, GRANULARITY,
+                        HOURLY_MAX_DAYS, VS_CURRENCY)
+from src.db.connection import get_engine
+from src.etl.extract import build_coin_frame, get_coingecko_client
+from src.etl.rate_limit import TokenBucket, call_with_retries
+from src.load.load_db import METRICS_COLUMNS, TABLES, load_data_to_supabase
+from src.transform.clean import clean_data
+from src.transform.dtypes import normalize_raw
+from src.transform.granularity import bar_frequency
+from src.transform.kpis import calculate_kpis, kpi_lookback
+from src.transform.validate import split_nulls, validate_batch
+from src.utils.logger import setup_logger
+from src.utils.metrics import count_call, stage
+
+logger = setup_logger("backfill")
+
+CHECKPOINT_TABLE = 'etl_backfill_checkpoint'
+CHECKPOINT_DDL = f"""
+CREATE TABLE IF NOT EXISTS {CHECKPOINT_TABLE} (
+    coin VARCHAR(50) NOT NULL,
+    granularity VARCHAR(10) NOT NULL,
+    window_start TIMESTAMP NOT NULL,
+    window_end TIMESTAMP NOT NULL,
+    rows_loaded INTEGER NOT NULL,
+    completed_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (coin, granularity, window_start)
+)
+"""
+# Ventana por defecto: CoinGecko devuelve barras diarias para rangos de más de 90 días
+# y horarias para rangos de hasta 90 días (ventana + lookback de KPIs incluidos)
+DEFAULT_WINDOW_DAYS = {'daily': 365, 'hourly': 30}
+# Rango mínimo que se pide en modo diario para que la API no devuelva puntos horarios
+DAILY_MIN_RANGE_DAYS = 91
+
+
+@dataclass(frozen=True)
+class WorkUnit:
+    """Ventana [start, end) de una moneda."""
+    coin: str
+    start: pd.Timestamp
+    end: pd.Timestamp
+
+
+def plan_units(coins, start, end, window_days):
+    """
+    Parte [start, end) en ventanas consecutivas de `window_days` días para cada moneda
+    (la última puede ser más corta). Las unidades quedan ordenadas por ventana y luego
+    por moneda, así que todas las monedas avanzan a la par.
+    """
+    start, end = pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize()
+    if start >= end:
+        raise ValueError(f"Rango de backfill vacío: {start.date()} >= {end.date()}")
+    edges = list(pd.date_range(start, end, freq=f'{window_days}D'))
+    if edges[-1] < end:
+        edges.append(end)
+    return [WorkUnit(coin, lo, hi) for lo, hi in zip(edges[:-1], edges[1:]) for coin in coins]
+
+
+def fetch_lookback(granularity=GRANULARITY):
+    """
+    Historia previa a cada ventana que necesitan los KPIs que se cargan.
+    """
+    return pd.Timedelta(bar_frequency(granularity)) * kpi_lookback(METRICS_COLUMNS, granularity)
+
+
+def ensure_checkpoint_table(engine):
+    with engine.begin() as conn:
+        conn.execute(text(CHECKPOINT_DDL))
+
+
+def completed_units(engine, granularity=GRANULARITY):
+    """
+    Conjunto {(coin, window_start)} de unidades ya cargadas para `granularity`.
+    """
+    with engine.connect() as conn:
+        rows = conn.execute(text(f"SELECT coin, window_start FROM {CHECKPOINT_TABLE} WHERE granularity = :g"),
+                            {'g': granularity}).fetchall()
+    return {(coin, pd.Timestamp(window_start)) for coin, window_start in rows}
+
+
+def mark_completed(engine, unit, rows_loaded, granularity=GRANULARITY):
+    params = {'coin': unit.coin, 'g': granularity, 'start': unit.start.to_pydatetime(),
+              'end': unit.end.to_pydatetime(), 'rows': int(rows_loaded), 'now': datetime.now()}
+    with engine.begin() as conn:
+        conn.execute(text(f"DELETE FROM {CHECKPOINT_TABLE} "
+                          f"WHERE coin = :coin AND granularity = :g AND window_start = :start"), params)
+        conn.execute(text(f"INSERT INTO {CHECKPOINT_TABLE} "
+                          f"(coin, granularity, window_start, window_end, rows_loaded, completed_at) "
+                          f"VALUES (:coin, :g, :start, :end, :rows, :now)"), params)
+
+
+def fetch_range(coin_id, start, end, cg=None, limiter=None, vs_currency=VS_CURRENCY):
+    """
+    Datos crudos de `coin_id` entre `start` y `end` vía el endpoint de rango. A
+    diferencia de `fetch_coin_data`, los errores se propagan: una unidad que falla no
+    se marca como completada.
+    """
+    cg = cg or get_coingecko_client()
+    count_call('api_calls')
+    data = call_with_retries(cg.get_coin_market_chart_range_by_id, id=coin_id, vs_currency=vs_currency,
+                             from_timestamp=int(pd.Timestamp(start).timestamp()),
+                             to_timestamp=int(pd.Timestamp(end).timestamp()), limiter=limiter)
+    return normalize_raw(build_coin_frame(data, coin_id))
+
+
+def process_unit(unit, engine, granularity=GRANULARITY, cg=None, limiter=None):
+    """
+    Extrae, transforma, valida y carga (upsert) una unidad. Devuelve las filas cargadas.
+    Los errores de la API y de la escritura se propagan: la unidad no se marca como completada.
+    """
+    fetch_start = unit.start - fetch_lookback(granularity)
+    if granularity == 'daily':
+        fetch_start = min(fetch_start, unit.end - pd.Timedelta(days=DAILY_MIN_RANGE_DAYS))
+    raw_df = fetch_range(unit.coin, fetch_start, unit.end, cg=cg, limiter=limiter)
+    if raw_df.empty:
+        return 0
+
+    raw_df, nulls = split_nulls(raw_df)
+    full = calculate_kpis(clean_data(raw_df, granularity), columns=METRICS_COLUMNS, granularity=granularity)
+    # El lookback solo alimenta las ventanas (y la historia de los picos en la validación):
+    # se valida y carga únicamente la ventana de la unidad
+    df = full[(full['date'] >= unit.start) & (full['date'] < unit.end)]
+    nulls = nulls[(nulls['date'] >= unit.start) & (nulls['date'] < unit.end)]
+    df, _ = validate_batch(df, granularity, context=full, nulls=nulls)
+    if df.empty:
+        return 0
+    # Sin filtro de watermarks (incremental=False): la ventana puede ser anterior a lo ya cargado;
+    # con upsert y truncate=False se fusiona por clave sin vaciar las tablas
+    load_data_to_supabase(df, incremental=False, engine=engine, write_mode='upsert', truncate=False,
+                          parallel=False, granularity=granularity)
+    return len(df)
+
+
+def run_backfill(start, end=None, coins=None, window_days=BACKFILL_WINDOW_DAYS, max_workers=EXTRACT_MAX_WORKERS,
+                 granularity=GRANULARITY, engine=None, cg=None, limiter=None):
+    """
+    Ejecuta (o retoma) el backfill de [start, end) y devuelve un resumen
+    {'planned', 'skipped', 'completed', 'failed', 'rows'}. Las unidades que fallan se
+    registran y el resto sigue; se reintentan en la próxima ejecución.
+    """
+    if granularity not in TABLES:
+        raise ValueError(f"Granularidad no soportada: {granularity}. Opciones: {sorted(TABLES)}")
+    coins = COINS if coins is None else coins
+    end = pd.Timestamp(end or datetime.now().date())
+    window_days = window_days or DEFAULT_WINDOW_DAYS[granularity]
+    lookback_days = fetch_lookback(granularity) / pd.Timedelta(days=1)
+    if granularity == 'hourly' and window_days + lookback_days > HOURLY_MAX_DAYS:
+        raise ValueError(f"Con granularidad horaria la ventana más el lookback ({lookback_days:.0f} días) "
+                         f"no puede superar {HOURLY_MAX_DAYS} días; usar --window-days "
+                         f"{int(HOURLY_MAX_DAYS - lookback_days)} o menos.")
+
+    engine = engine or get_engine()
+    ensure_checkpoint_table(engine)
+    units = plan_units(coins, start, end, window_days)
+    done = completed_units(engine, granularity)
+    pending = [u for u in units if (u.coin, u.start) not in done]
+    logger.info(f"Backfill {granularity} {pd.Timestamp(start).date()} -> {end.date()}: {len(units)} unidades, "
+                f"{len(units) - len(pending)} ya completadas, {len(pending)} pendientes")
+
+    summary = {'planned': len(units), 'skipped': len(units) - len(pending), 'completed': 0, 'failed': [], 'rows': 0}
+    if not pending:
+        return summary
+
+    limiter = limiter or TokenBucket(rate_per_minute=API_RATE_LIMIT_PER_MINUTE)
+
+    def run(unit):
+        rows = process_unit(unit, engine, granularity, cg=cg, limiter=limiter)
+        mark_completed(engine, unit, rows, granularity)
+        return rows
+
+    with stage('backfill', granularity=granularity) as m, \
+            ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="backfill") as executor:
+        futures = {executor.submit(run, unit): unit for unit in pending}
+        for future in as_completed(futures):
+            unit = futures[future]
+            label = f"{unit.coin} [{unit.start.date()}, {unit.end.date()})"
+            try:
+                rows = future.result()
+            except Exception as e:
+                logger.error(f"Unidad {label} falló: {e}")
+                summary['failed'].append(unit)
+                continue
+            summary['completed'] += 1
+            summary['rows'] += rows
+            logger.info(f"Unidad {label}: {rows} filas ({summary['completed']}/{len(pending)})")
+        m.rows_out = summary['rows']
+
+    logger.info(f"Backfill terminado: {summary['completed']} unidades cargadas ({summary['rows']} filas), "
+                f"{len(summary['failed'])} fallidas")
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backfill histórico reanudable por (moneda, ventana).")
+    parser.add_argument('--start', required=True, help="Fecha inicial (incluida), p. ej. 2019-01-01")
+    parser.add_argument('--end', help="Fecha final (excluida); por defecto hoy")
+    parser.add_argument('--coins', help="Monedas separadas por comas; por defecto COINS")
+    parser.add_argument('--window-days', type=int, default=BACKFILL_WINDOW_DAYS,
+                        help="Días por unidad (0 = 365 en diario, 30 en horario)")
+    parser.add_argument('--workers', type=int, default=EXTRACT_MAX_WORKERS)
+    parser.add_argument('--granularity', default=GRANULARITY, choices=sorted(TABLES))
+    args = parser.parse_args(argv)
+
+    summary = run_backfill(args.start, args.end, coins=args.coins.split(',') if args.coins else None,
+                           window_days=args.window_days, max_workers=args.workers, granularity=args.granularity)
+    # Código de salida distinto de cero si quedan unidades pendientes (se retoman al relanzar)
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,182 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+from src.config import API_CACHE_ENABLED, API_CACHE_DIR, API_CACHE_TTL_SECONDS, API_CACHE_MAX_BYTES
+from src.utils.logger import setup_logger
+
+logger = setup_logger("extract_cache")
+
+# Fracción de max_bytes hasta la que se evicta al superar el límite
+_EVICT_TO = 0.9
+
+
+class MarketChartCache:
+    """
+    Caché en disco de respuestas `market_chart` de CoinGecko.
+
+    Cada payload se guarda como JSON comprimido (gzip) en un archivo cuyo nombre es
+    el hash de (coin_id, vs_currency, days, interval, día UTC). Las entradas expiran
+    `ttl_seconds` después de su `created_at` (que también queda como mtime del archivo)
+    y, si el directorio supera `max_bytes`, se eliminan las menos usadas recientemente
+    (LRU según atime, que se actualiza en cada acierto sin tocar el mtime).
+
+    El tamaño del directorio se lleva como estimación en memoria: `put` no recorre el
+    directorio salvo que la estimación supere `max_bytes`, y entonces la evicción baja
+    hasta `_EVICT_TO` de `max_bytes` para que la siguiente no llegue enseguida.
+    """
+
+    def __init__(self, cache_dir=API_CACHE_DIR, ttl_seconds=API_CACHE_TTL_SECONDS, max_bytes=API_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        # Estimación del tamaño del directorio; se recalcula en cada evicción
+        self._size = 0
+        self.evict()
+
+    @staticmethod
+    def make_key(coin_id, vs_currency, days, interval=None, day=None):
+        """
+        Clave de contenido. `day` (por defecto, hoy en UTC) agrupa las peticiones del mismo día.
+        """
+        day = day or datetime.now(timezone.utc).date().isoformat()
+        raw = json.dumps([coin_id, vs_currency, str(days), interval, str(day)])
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json.gz")
+
+    def get(self, key):
+        """
+        Devuelve el payload cacheado o None si no existe o expiró.
+        """
+        path = self._path(key)
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        if time.time() - entry['created_at'] > self.ttl_seconds:
+            self._discard(path)
+            with self._lock:
+                self.misses += 1
+            return None
+
+        # Marcar como usado recientemente para la política LRU (atime); el mtime sigue
+        # siendo created_at, la base del TTL
+        try:
+            os.utime(path, (time.time(), entry['created_at']))
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+        return entry['payload']
+
+    def put(self, key, payload):
+        """
+        Guarda el payload de forma atómica (archivo temporal + rename) y evicta solo si
+        la estimación de tamaño supera `max_bytes`.
+        """
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        created_at = time.time()
+        try:
+            with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+                json.dump({'created_at': created_at, 'payload': payload}, f)
+            os.utime(tmp_path, (created_at, created_at))
+            size = os.path.getsize(tmp_path)
+            replaced = self._size_of(path)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"No se pudo escribir en la caché ({path}): {e}")
+            self._remove(tmp_path)
+            return
+        with self._lock:
+            self._size += size - replaced
+            over_limit = self._size > self.max_bytes
+        if over_limit:
+            self.evict(target_bytes=int(self.max_bytes * _EVICT_TO))
+
+    def evict(self, target_bytes=None):
+        """
+        Recorre el directorio: elimina las entradas expiradas (según created_at, el mtime)
+        y, si se supera `target_bytes` (por defecto `max_bytes`), las menos usadas
+        recientemente (atime). Recalcula la estimación de tamaño.
+        """
+        target_bytes = self.max_bytes if target_bytes is None else target_bytes
+        with self._lock:
+            entries = []
+            now = time.time()
+            for name in os.listdir(self.cache_dir):
+                if not name.endswith('.json.gz'):
+                    continue
+                path = os.path.join(self.cache_dir, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                if now - stat.st_mtime > self.ttl_seconds:
+                    self._remove(path)
+                    continue
+                entries.append((stat.st_atime, stat.st_size, path))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= target_bytes:
+                    break
+                self._remove(path)
+                total -= size
+            self._size = total
+
+    @staticmethod
+    def _size_of(path):
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return 0
+
+    def _discard(self, path):
+        size = self._size_of(path)
+        self._remove(path)
+        with self._lock:
+            self._size -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def log_stats(self):
+        total = self.hits + self.misses
+        ratio = (self.hits / total * 100) if total else 0.0
+        logger.info(f"Caché CoinGecko: {self.hits} aciertos, {self.misses} fallos ({ratio:.0f}% hit ratio).")
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache():
+    """
+    Devuelve la caché compartida del proceso, o None si API_CACHE_ENABLED está desactivado.
+    """
+    global _default_cache
+    if not API_CACHE_ENABLED:
+        return None
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = MarketChartCache()
+    return _default_cache
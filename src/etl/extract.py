@@ -1,52 +1,217 @@
 from pycoingecko import CoinGeckoAPI
+import numpy as np
 import pandas as pd
 import time
-from src.config import COINS, DAYS_TO_FETCH, VS_CURRENCY
+import itertools
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from src.config import (
+    COINS, DAYS_TO_FETCH, VS_CURRENCY, COINGECKO_API_URL, EXTRACT_MAX_WORKERS, KPI_LOOKBACK_DAYS,
+    GRANULARITY, HOURLY_MAX_DAYS
+)
+from src.etl.rate_limit import TokenBucket, call_with_retries
+from src.etl.cache import get_default_cache
+from src.transform.dtypes import normalize_raw
+from src.transform.granularity import bar_frequency
+from src.utils.logger import setup_logger
+from src.utils.metrics import count_call
 
-def fetch_coin_data(coin_id, days=DAYS_TO_FETCH, vs_currency=VS_CURRENCY):
+logger = setup_logger("extract")
+
+def get_coingecko_client():
+    """
+    Crea un cliente de CoinGecko, apuntando a COINGECKO_API_URL si está configurada.
+    """
+    cg = CoinGeckoAPI()
+    if COINGECKO_API_URL:
+        cg.api_base_url = COINGECKO_API_URL.rstrip('/') + '/'
+    return cg
+
+def days_since_watermark(watermark, lookback=KPI_LOOKBACK_DAYS, max_days=DAYS_TO_FETCH, today=None):
+    """
+    Calcula cuántos días pedir a la API para una moneda cuyo último dato cargado es `watermark`:
+    los días faltantes más el lookback que necesitan las ventanas de KPIs.
+    Sin watermark (moneda nueva) se pide el histórico completo.
+    """
+    if watermark is None or pd.isna(watermark):
+        return max_days
+    today = today or datetime.now(timezone.utc).date()
+    missing = max(0, (today - pd.Timestamp(watermark).date()).days)
+    return int(min(max_days, max(1, missing + lookback)))
+
+def fetch_window(granularity=GRANULARITY):
+    """
+    Devuelve (días máximos, interval) a pedir a CoinGecko para la granularidad dada.
+    En modo horario no se fuerza `interval`: la API devuelve puntos horarios para
+    rangos de hasta HOURLY_MAX_DAYS días.
+    """
+    bar_frequency(granularity)  # valida la granularidad
+    if granularity == 'hourly':
+        return min(DAYS_TO_FETCH, HOURLY_MAX_DAYS), None
+    return DAYS_TO_FETCH, 'daily'
+
+def shard_coins(coins, shard_size):
+    """
+    Divide `coins` en shards consecutivos de hasta `shard_size` monedas (conserva el orden).
+    """
+    if shard_size < 1:
+        raise ValueError("shard_size debe ser mayor que 0.")
+    return [list(coins[i:i + shard_size]) for i in range(0, len(coins), shard_size)]
+
+def _as_pairs(points):
+    """
+    Convierte una lista JSON [[timestamp, valor], ...] en un array (n, 2) float64.
+    Los valores null de la API quedan como NaN.
+    """
+    try:
+        # fromiter sobre la lista aplanada evita la inferencia de forma de np.asarray
+        arr = np.fromiter(itertools.chain.from_iterable(points), dtype='float64', count=2 * len(points))
+    except (TypeError, ValueError):
+        arr = np.asarray(points, dtype='float64')
+    return arr.reshape(-1, 2)
+
+def _align_to(timestamps, pairs):
+    """
+    Alinea `pairs` con `timestamps` por coincidencia exacta (equivalente a un merge left),
+    usando searchsorted sobre los timestamps ordenados. Sin coincidencia -> NaN.
+    """
+    out = np.full(len(timestamps), np.nan)
+    if len(pairs) == 0:
+        return out
+    order = np.argsort(pairs[:, 0], kind='stable')
+    other_ts = pairs[order, 0]
+    pos = np.searchsorted(other_ts, timestamps)
+    pos_clipped = np.minimum(pos, len(other_ts) - 1)
+    found = (pos < len(other_ts)) & (other_ts[pos_clipped] == timestamps)
+    out[found] = pairs[order[pos_clipped[found]], 1]
+    return out
+
+def build_coin_frame(data, coin_id):
+    """
+    Construye el DataFrame de una moneda directamente desde el payload `market_chart`.
+
+    CoinGecko devuelve `prices`, `total_volumes` y `market_caps` con los mismos
+    timestamps; en ese caso las columnas se toman de los arrays sin joins. Si no están
+    alineados se cae a una alineación ordenada por timestamp (searchsorted).
+    """
+    prices = _as_pairs(data['prices'])
+    volumes = _as_pairs(data['total_volumes'])
+    market_caps = _as_pairs(data['market_caps'])
+    timestamps = prices[:, 0]
+
+    def aligned(pairs):
+        return len(pairs) == len(timestamps) and np.array_equal(pairs[:, 0], timestamps)
+
+    volume = volumes[:, 1] if aligned(volumes) else _align_to(timestamps, volumes)
+    market_cap = market_caps[:, 1] if aligned(market_caps) else _align_to(timestamps, market_caps)
+
+    return pd.DataFrame({
+        'timestamp': timestamps.astype('int64'),
+        'price': prices[:, 1],
+        'volume': volume,
+        'market_cap': market_cap,
+        'coin_id': coin_id,
+    }, copy=False)
+
+def _fetch_market_chart(coin_id, days, vs_currency, cg, limiter, interval, cache):
+    """
+    Devuelve el payload `market_chart`, desde la caché local si hay una entrada válida.
+    """
+    key = cache.make_key(coin_id, vs_currency, days, interval) if cache else None
+    if cache:
+        data = cache.get(key)
+        if data is not None:
+            count_call('api_cache_hits')
+            return data
+
+    cg = cg or get_coingecko_client()
+    params = {'interval': interval} if interval else {}
+    count_call('api_calls')
+    data = call_with_retries(cg.get_coin_market_chart_by_id, id=coin_id, vs_currency=vs_currency,
+                             days=days, limiter=limiter, **params)
+    if cache:
+        cache.put(key, data)
+    return data
+
+def fetch_coin_data(coin_id, days=DAYS_TO_FETCH, vs_currency=VS_CURRENCY, cg=None, limiter=None, interval='daily',
+                    cache=None):
     """
     Obtiene datos históricos de mercado para una moneda específica desde la API de CoinGecko.
+
+    Si se pasa un `limiter` (TokenBucket), cada petición consume un token y los
+    HTTP 429 se reintentan con backoff y jitter.
+    `interval='daily'` fuerza barras diarias también para rangos cortos (<= 90 días),
+    donde CoinGecko devolvería puntos horarios.
+    Las respuestas pasan por la caché en disco (`get_default_cache`) salvo que se
+    desactive con API_CACHE_ENABLED=false.
     """
     try:
-        cg = CoinGeckoAPI()
+        cache = cache if cache is not None else get_default_cache()
         # Obtener datos de gráfico de mercado
-        data = cg.get_coin_market_chart_by_id(id=coin_id, vs_currency=vs_currency, days=days)
-        
-        # Crear DataFrame inicial desde precios
-        df = pd.DataFrame(data['prices'], columns=['timestamp', 'price'])
-        
-        # Añadir volumen y market_cap
-        # Nota: CoinGecko devuelve listas [timestamp, value], asumimos que se alinean
-        volumes = pd.DataFrame(data['total_volumes'], columns=['timestamp', 'volume'])
-        market_caps = pd.DataFrame(data['market_caps'], columns=['timestamp', 'market_cap'])
-        
-        # Fusionar por timestamp para estar seguros, aunque el índice suele coincidir
-        df = df.merge(volumes, on='timestamp', how='left')
-        df = df.merge(market_caps, on='timestamp', how='left')
-        
-        # Añadir identificador coin_id
-        df['coin_id'] = coin_id
-        
-        return df
+        data = _fetch_market_chart(coin_id, days, vs_currency, cg, limiter, interval, cache)
+
+        return build_coin_frame(data, coin_id)
     except Exception as e:
-        print(f"Error obteniendo datos para {coin_id}: {e}")
+        logger.error(f"Error obteniendo datos para {coin_id}: {e}")
         return pd.DataFrame()
 
-def extract_all_coins():
-    """
-    Itera a través de la lista de monedas configurada (COINS) y obtiene datos para cada una.
-    Devuelve un DataFrame concatenado.
-    """
+def _extract_sequential(coins, days_by_coin, interval):
     all_data = []
-    for coin in COINS:
-        print(f"Obteniendo datos para {coin}...")
-        df = fetch_coin_data(coin)
+    for coin in coins:
+        logger.info(f"Obteniendo datos para {coin}...")
+        df = fetch_coin_data(coin, days=days_by_coin[coin], interval=interval)
         if not df.empty:
             all_data.append(df)
         # Ser amable con la API
-        time.sleep(1) 
-    
+        time.sleep(1)
+    return all_data
+
+def _extract_concurrent(coins, days_by_coin, max_workers, limiter, interval):
+    limiter = limiter or TokenBucket()
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="extract") as executor:
+        # executor.map conserva el orden de `coins`, igual que el modo secuencial
+        results = executor.map(
+            lambda coin: fetch_coin_data(coin, days=days_by_coin[coin], limiter=limiter, interval=interval), coins
+        )
+        return [df for df in results if not df.empty]
+
+def extract_all_coins(coins=None, max_workers=EXTRACT_MAX_WORKERS, limiter=None, watermarks=None,
+                      granularity=GRANULARITY):
+    """
+    Itera a través de la lista de monedas configurada (COINS) y obtiene datos para cada una.
+    Devuelve un DataFrame concatenado.
+
+    Con `max_workers > 1` las peticiones se lanzan en paralelo sobre un pool de hilos,
+    acotadas por un limitador token-bucket (API_RATE_LIMIT_PER_MINUTE) en lugar de la
+    pausa fija entre monedas.
+
+    Si se pasan `watermarks` ({coin: último price_timestamp cargado}), solo se piden los
+    días posteriores a cada watermark más KPI_LOOKBACK_DAYS (ver `days_since_watermark`).
+
+    `granularity='hourly'` pide barras horarias (como máximo HOURLY_MAX_DAYS días, ver
+    `fetch_window`).
+    """
+    coins = COINS if coins is None else coins
+    max_days, interval = fetch_window(granularity)
+    if watermarks is None:
+        days_by_coin = {coin: max_days for coin in coins}
+    else:
+        days_by_coin = {coin: days_since_watermark(watermarks.get(coin), max_days=max_days) for coin in coins}
+        logger.info(f"Extracción incremental: {sum(days_by_coin.values())} días en total "
+                    f"(vs {max_days * len(coins)} en carga completa).")
+
+    if max_workers > 1:
+        logger.info(f"Extrayendo {len(coins)} monedas con {max_workers} hilos concurrentes...")
+        all_data = _extract_concurrent(coins, days_by_coin, max_workers, limiter, interval)
+    else:
+        all_data = _extract_sequential(coins, days_by_coin, interval)
+
+    cache = get_default_cache()
+    if cache:
+        cache.log_stats()
+
     if all_data:
-        return pd.concat(all_data, ignore_index=True)
+        # coin_id pasa a categórico una sola vez sobre el frame concatenado
+        return normalize_raw(pd.concat(all_data, ignore_index=True))
     else:
         return pd.DataFrame()
@@ -0,0 +1,219 @@
+"""
+Detección de huecos en las series por moneda y relleno dirigido.
+
+`find_gaps` localiza, con una única consulta con LAG sobre (coin, price_timestamp),
+los tramos de barras que faltan entre dos barras cargadas de una moneda (en
+PostgreSQL el orden sale del índice de la clave primaria, sin sort). `fill_gaps`
+pide a la API solo esos tramos, reconstruye la serie alrededor de cada hueco con
+los precios ya guardados y recalcula únicamente las filas de KPIs cuyas ventanas
+(30 días) incluyen el hueco, que se escriben con upsert.
+
+Uso:
+    python -m src.etl.gaps [--since 2024-01-01] [--coins bitcoin,ethereum] [--dry-run]
+"""
+import argparse
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from datetime import datetime
+
+import pandas as pd
+from sqlalchemy import DateTime, bindparam, text
+
+from src.config import API_RATE_LIMIT_PER_MINUTE, EXTRACT_MAX_WORKERS, GAP_SCAN_DAYS, GRANULARITY
+from src.db.connection import get_engine
+from src.etl.backfill import fetch_lookback, fetch_range, DAILY_MIN_RANGE_DAYS
+from src.etl.rate_limit import TokenBucket
+from src.load.load_db import METRICS_COLUMNS, TABLES, load_data_to_supabase, table_names
+from src.transform.clean import clean_data
+from src.transform.dtypes import normalize_dates, normalize_raw
+from src.transform.granularity import bar_frequency
+from src.transform.kpis import calculate_kpis
+from src.transform.validate import split_nulls, validate_batch
+from src.utils.logger import setup_logger
+from src.utils.metrics import stage
+
+logger = setup_logger("gaps")
+
+
+@dataclass(frozen=True)
+class Gap:
+    """Barras faltantes [start, end] (ambas incluidas) de una moneda."""
+    coin: str
+    start: pd.Timestamp
+    end: pd.Timestamp
+    missing_bars: int
+
+
+def _longer_than_step(dialect):
+    # Diferencia entre barras consecutivas mayor que una barra, según el motor
+    if dialect in ('postgresql', 'duckdb'):
+        return "price_timestamp > prev_timestamp + :step_seconds * INTERVAL '1 second'"
+    return "(julianday(price_timestamp) - julianday(prev_timestamp)) * 86400 > :step_seconds + 1"
+
+
+def gaps_query(table, dialect, coins=None, since=None):
+    """
+    Consulta que devuelve (coin, prev_timestamp, price_timestamp) para cada par de
+    barras consecutivas de una moneda separadas por más de una barra.
+    """
+    where, params = [], {}
+    if coins is not None:
+        where.append("coin IN :coins")
+        params['coins'] = list(coins)
+    if since is not None:
+        where.append("price_timestamp >= :since")
+        params['since'] = pd.Timestamp(since).to_pydatetime()
+    source = table + (f" WHERE {' AND '.join(where)}" if where else '')
+    sql = (f"SELECT coin, prev_timestamp, price_timestamp FROM ("
+           f"SELECT coin, price_timestamp, LAG(price_timestamp) OVER ("
+           f"PARTITION BY coin ORDER BY price_timestamp) AS prev_timestamp FROM {source}) AS bars "
+           f"WHERE prev_timestamp IS NOT NULL AND {_longer_than_step(dialect)} "
+           f"ORDER BY coin, price_timestamp")
+    binds = [bindparam('since', type_=DateTime())] if 'since' in params else []
+    if 'coins' in params:
+        binds.append(bindparam('coins', expanding=True))
+    return text(sql).bindparams(*binds), params
+
+
+def find_gaps(engine, coins=None, since=None, granularity=GRANULARITY):
+    """
+    Huecos de la tabla de precios de `granularity` (opcionalmente solo `coins` y
+    barras desde `since`) como lista de Gap.
+    """
+    step = pd.Timedelta(bar_frequency(granularity))
+    query, params = gaps_query(table_names(granularity)[0], engine.dialect.name, coins, since)
+    with engine.connect() as conn:
+        rows = conn.execute(query, {**params, 'step_seconds': step.total_seconds()}).fetchall()
+    gaps = []
+    for coin, prev_ts, next_ts in rows:
+        start, end = pd.Timestamp(prev_ts) + step, pd.Timestamp(next_ts) - step
+        gaps.append(Gap(coin, start, end, int((end - start) / step) + 1))
+    return gaps
+
+
+def _read_prices(engine, coin, start, end, granularity):
+    """
+    Barras guardadas de `coin` en [start, end] con el formato del transform (coin_id, date, ...).
+    """
+    query = text(f"SELECT coin AS coin_id, price_timestamp AS date, price, volume, market_cap "
+                 f"FROM {table_names(granularity)[0]} "
+                 f"WHERE coin = :coin AND price_timestamp BETWEEN :start AND :end"
+                 ).bindparams(bindparam('start', type_=DateTime()), bindparam('end', type_=DateTime()))
+    with engine.connect() as conn:
+        df = pd.read_sql(query, conn, params={'coin': coin, 'start': start.to_pydatetime(),
+                                              'end': end.to_pydatetime()})
+    df['date'] = pd.to_datetime(df['date'])
+    for column in ('price', 'volume', 'market_cap'):
+        df[column] = pd.to_numeric(df[column], errors='coerce').astype('float64')
+    return df
+
+
+def fill_gap(gap, engine, granularity=GRANULARITY, cg=None, limiter=None):
+    """
+    Rellena un hueco y devuelve las filas recuperadas.
+
+    Solo se pide a la API el tramo del hueco (en diario, al menos DAILY_MIN_RANGE_DAYS
+    para recibir barras diarias). Con los precios guardados del lookback anterior y de
+    los `lookback` días posteriores se recalculan los KPIs, y se escriben con upsert
+    las barras recuperadas y las filas cuyas ventanas cubren el hueco: [start, end + lookback].
+    Los errores de la API y de la escritura se propagan: el hueco no cuenta como rellenado.
+    """
+    step = pd.Timedelta(bar_frequency(granularity))
+    lookback = fetch_lookback(granularity)
+    fetch_start = gap.start
+    if granularity == 'daily':
+        fetch_start = min(fetch_start, gap.end + step - pd.Timedelta(days=DAILY_MIN_RANGE_DAYS))
+    raw_df, nulls = split_nulls(fetch_range(gap.coin, fetch_start, gap.end + step, cg=cg, limiter=limiter))
+    recovered = clean_data(raw_df, granularity)
+    if not recovered.empty:
+        recovered = recovered[(recovered['date'] >= gap.start) & (recovered['date'] <= gap.end)]
+    if recovered.empty:
+        logger.warning(f"La API no tiene datos para {gap.coin} [{gap.start}, {gap.end}]; el hueco se mantiene.")
+        return 0
+
+    affected_end = gap.end + lookback
+    # Una barra de más al inicio: SQLite compara las fechas como texto y el límite exacto puede quedar fuera
+    stored = _read_prices(engine, gap.coin, gap.start - lookback - step, affected_end, granularity)
+    series = pd.concat([stored, recovered[['coin_id', 'date', 'price', 'volume', 'market_cap']]],
+                       ignore_index=True)
+    series = normalize_raw(series.drop_duplicates(['coin_id', 'date']).sort_values('date', ignore_index=True))
+    series['date'] = normalize_dates(series['date'])
+
+    full = calculate_kpis(series, columns=METRICS_COLUMNS, granularity=granularity)
+    df = full[(full['date'] >= gap.start) & (full['date'] <= affected_end)]
+    nulls = nulls[(nulls['date'] >= gap.start) & (nulls['date'] < gap.end + step)]
+    df, _ = validate_batch(df, granularity, context=full, nulls=nulls)
+    load_data_to_supabase(df, engine=engine, write_mode='upsert', truncate=False, parallel=False,
+                          granularity=granularity)
+    logger.info(f"Hueco {gap.coin} [{gap.start}, {gap.end}]: {len(recovered)}/{gap.missing_bars} barras "
+                f"recuperadas, {len(df)} filas de KPIs recalculadas")
+    return len(recovered)
+
+
+def fill_gaps(engine, gaps, granularity=GRANULARITY, max_workers=EXTRACT_MAX_WORKERS, cg=None, limiter=None):
+    """
+    Rellena `gaps` en paralelo bajo el rate limit compartido. Devuelve
+    {'gaps', 'filled', 'failed', 'rows'}; los huecos que fallan se vuelven a detectar
+    en la próxima pasada.
+    """
+    summary = {'gaps': len(gaps), 'filled': 0, 'failed': [], 'rows': 0}
+    if not gaps:
+        return summary
+    limiter = limiter or TokenBucket(rate_per_minute=API_RATE_LIMIT_PER_MINUTE)
+    with stage('gap_fill', granularity=granularity) as m, \
+            ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="gaps") as executor:
+        futures = {executor.submit(fill_gap, gap, engine, granularity, cg, limiter): gap for gap in gaps}
+        for future in as_completed(futures):
+            gap = futures[future]
+            try:
+                rows = future.result()
+            except Exception as e:
+                logger.error(f"No se pudo rellenar el hueco {gap.coin} [{gap.start}, {gap.end}]: {e}")
+                summary['failed'].append(gap)
+                continue
+            summary['filled'] += 1 if rows else 0
+            summary['rows'] += rows
+        m.rows_out = summary['rows']
+    logger.info(f"Huecos: {summary['filled']}/{len(gaps)} rellenados ({summary['rows']} barras), "
+                f"{len(summary['failed'])} fallidos, {len(gaps) - summary['filled']} siguen abiertos")
+    return summary
+
+
+def scan_and_fill(engine=None, coins=None, since=None, granularity=GRANULARITY, dry_run=False, **kwargs):
+    """
+    Busca huecos desde `since` (por defecto los últimos GAP_SCAN_DAYS días; None con
+    GAP_SCAN_DAYS=0 = toda la historia) y los rellena salvo con `dry_run`.
+    """
+    engine = engine or get_engine()
+    if since is None and GAP_SCAN_DAYS > 0:
+        since = pd.Timestamp(datetime.now().date()) - pd.Timedelta(days=GAP_SCAN_DAYS)
+    gaps = find_gaps(engine, coins=coins, since=since, granularity=granularity)
+    if not gaps:
+        logger.info("Sin huecos en las series.")
+        return {'gaps': 0, 'filled': 0, 'failed': [], 'rows': 0}
+    logger.warning(f"{len(gaps)} huecos ({sum(g.missing_bars for g in gaps)} barras faltantes) en "
+                   f"{len({g.coin for g in gaps})} monedas")
+    if dry_run:
+        for gap in gaps:
+            logger.info(f"  {gap.coin}: {gap.start} -> {gap.end} ({gap.missing_bars} barras)")
+        return {'gaps': len(gaps), 'filled': 0, 'failed': [], 'rows': 0}
+    return fill_gaps(engine, gaps, granularity, **kwargs)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Detección y relleno de huecos en las series por moneda.")
+    parser.add_argument('--since', help="Solo barras desde esta fecha (por defecto los últimos GAP_SCAN_DAYS días)")
+    parser.add_argument('--coins', help="Monedas separadas por comas; por defecto todas")
+    parser.add_argument('--granularity', default=GRANULARITY, choices=sorted(TABLES))
+    parser.add_argument('--workers', type=int, default=EXTRACT_MAX_WORKERS)
+    parser.add_argument('--dry-run', action='store_true', help="Solo listar los huecos")
+    args = parser.parse_args(argv)
+
+    summary = scan_and_fill(coins=args.coins.split(',') if args.coins else None, since=args.since,
+                            granularity=args.granularity, dry_run=args.dry_run, max_workers=args.workers)
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
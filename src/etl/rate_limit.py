@@ -0,0 +1,138 @@
+import random
+import threading
+import time
+
+import requests
+
+from src.config import (
+    API_RATE_LIMIT_PER_MINUTE,
+    API_RATE_LIMIT_BURST,
+    API_MAX_RETRIES,
+    API_BACKOFF_BASE_SECONDS,
+    API_BACKOFF_MAX_SECONDS,
+)
+from src.utils.logger import setup_logger
+
+logger = setup_logger("rate_limit")
+
+
+class TokenBucket:
+    """
+    Limitador de tasa token-bucket compartido entre hilos.
+
+    Repone `rate_per_minute` tokens por minuto hasta un máximo de `burst`.
+    Cada petición a la API consume un token; si no hay tokens disponibles,
+    `acquire` bloquea hasta que se repongan. `pause` congela el bucket para
+    todos los hilos (usado cuando la API responde HTTP 429).
+    """
+
+    def __init__(self, rate_per_minute=API_RATE_LIMIT_PER_MINUTE, burst=API_RATE_LIMIT_BURST,
+                 clock=time.monotonic, sleep=time.sleep):
+        if rate_per_minute <= 0:
+            raise ValueError("rate_per_minute debe ser mayor que 0.")
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1, int(burst))
+        self.tokens = float(self.capacity)
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self._updated
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self._updated = now
+
+    def acquire(self):
+        """
+        Bloquea hasta obtener un token.
+        """
+        while True:
+            with self._lock:
+                now = self._clock()
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                else:
+                    self._refill(now)
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            self._sleep(wait)
+
+    def pause(self, seconds):
+        """
+        Detiene la emisión de tokens durante `seconds` segundos y vacía el bucket.
+        """
+        with self._lock:
+            now = self._clock()
+            self._paused_until = max(self._paused_until, now + seconds)
+            self.tokens = 0.0
+            self._updated = self._paused_until
+
+
+def is_rate_limited(exc):
+    """
+    Detecta una respuesta HTTP 429 de CoinGecko.
+
+    pycoingecko lanza `requests.HTTPError` si el cuerpo no es JSON, o
+    `ValueError(<json>)` si la API devolvió el error en formato JSON.
+    """
+    if isinstance(exc, requests.exceptions.HTTPError) and exc.response is not None:
+        return exc.response.status_code == 429
+    if isinstance(exc, ValueError) and exc.args and isinstance(exc.args[0], dict):
+        status = exc.args[0].get('status', {})
+        if isinstance(status, dict) and status.get('error_code') == 429:
+            return True
+        return exc.args[0].get('error_code') == 429
+    return False
+
+
+def _is_transient(exc):
+    return isinstance(exc, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+
+
+def _retry_after(exc):
+    response = getattr(exc, 'response', None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, base=API_BACKOFF_BASE_SECONDS, cap=API_BACKOFF_MAX_SECONDS):
+    """
+    Backoff exponencial con "full jitter": uniforme en [0, min(cap, base * 2^attempt)].
+    """
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def call_with_retries(func, *args, limiter=None, max_retries=API_MAX_RETRIES, sleep=time.sleep, **kwargs):
+    """
+    Ejecuta `func(*args, **kwargs)` respetando el limitador y reintentando con jitter
+    ante HTTP 429 y errores de red transitorios. Otros errores se propagan de inmediato.
+    """
+    for attempt in range(max_retries + 1):
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            rate_limited = is_rate_limited(e)
+            if not (rate_limited or _is_transient(e)) or attempt == max_retries:
+                raise
+
+            delay = _retry_after(e) or backoff_delay(attempt)
+            if rate_limited:
+                logger.warning(f"HTTP 429 recibido. Reintento {attempt + 1}/{max_retries} en {delay:.1f}s.")
+                if limiter is not None:
+                    # Frenar a todos los hilos, no solo al que recibió el 429
+                    limiter.pause(delay)
+                    continue
+            else:
+                logger.warning(f"Error de red ({e}). Reintento {attempt + 1}/{max_retries} en {delay:.1f}s.")
+            sleep(delay)
@@ -1,61 +1,206 @@
+import io
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
 from sqlalchemy import text
+from src.config import (
+    LOAD_METHOD, COPY_CHUNKSIZE, WRITE_MODE, LOAD_PARALLEL, GRANULARITY, PARTITIONED_TABLES, ROLLUPS_ENABLED
+)
 from src.db.connection import get_engine
 from src.utils.logger import setup_logger
 
 logger = setup_logger("load_db")
 
-def truncate_tables(engine):
+# Clave primaria de cryptocurrency_prices y cryptocurrency_metrics (sql/schema_supabase.sql)
+PRIMARY_KEY = ('coin', 'price_timestamp')
+
+# Tablas (prices, metrics) por granularidad; las horarias tienen el mismo esquema
+TABLES = {
+    'daily': ('cryptocurrency_prices', 'cryptocurrency_metrics'),
+    'hourly': ('cryptocurrency_prices_hourly', 'cryptocurrency_metrics_hourly'),
+}
+
+def table_names(granularity=GRANULARITY):
+    """
+    Devuelve (tabla de precios, tabla de métricas) para la granularidad dada.
+    """
+    if granularity not in TABLES:
+        raise ValueError(f"Granularidad no soportada: {granularity}. Opciones: {sorted(TABLES)}")
+    return TABLES[granularity]
+
+def _copy_from_buffer(dbapi_conn, copy_sql, buffer):
+    """
+    Ejecuta COPY ... FROM STDIN con el driver disponible (psycopg2 o psycopg 3).
+    """
+    with dbapi_conn.cursor() as cur:
+        if hasattr(cur, 'copy_expert'):
+            cur.copy_expert(copy_sql, buffer)
+        else:
+            with cur.copy(copy_sql) as copy:
+                copy.write(buffer.getvalue())
+
+def _copy_rows(dbapi_conn, df, table_name, chunksize=COPY_CHUNKSIZE):
+    columns = ', '.join(f'"{c}"' for c in df.columns)
+    copy_sql = f'COPY {table_name} ({columns}) FROM STDIN WITH (FORMAT csv)'
+    for start in range(0, len(df), chunksize):
+        buffer = io.StringIO()
+        df.iloc[start:start + chunksize].to_csv(buffer, index=False, header=False)
+        buffer.seek(0)
+        _copy_from_buffer(dbapi_conn, copy_sql, buffer)
+
+def _insert_rows(conn, df, table_name):
+    """
+    INSERT multi-fila vía executemany sobre una conexión SQLAlchemy abierta (motores sin COPY).
+    """
+    columns = ', '.join(df.columns)
+    params = ', '.join(f':{c}' for c in df.columns)
+    values = df.astype(object).where(df.notna(), None)
+    for col in df.select_dtypes(include=['datetime']).columns:
+        # Los drivers DB-API esperan datetime nativo, no pandas.Timestamp
+        values[col] = pd.Series([None if v is None else v.to_pydatetime() for v in values[col]],
+                                index=values.index, dtype=object)
+    records = values.to_dict('records')
+    for start in range(0, len(records), 1000):
+        conn.execute(text(f"INSERT INTO {table_name} ({columns}) VALUES ({params})"), records[start:start + 1000])
+
+def copy_frame(df, table_name, engine, chunksize=COPY_CHUNKSIZE):
+    """
+    Envía `df` a `table_name` con `COPY ... FROM STDIN (FORMAT csv)` desde un buffer
+    en memoria, en lotes de `chunksize` filas y dentro de una única transacción.
+    Solo PostgreSQL; la tabla debe existir.
+    """
+    raw_conn = engine.raw_connection()
+    try:
+        _copy_rows(raw_conn, df, table_name, chunksize)
+        raw_conn.commit()
+    except Exception:
+        raw_conn.rollback()
+        raise
+    finally:
+        raw_conn.close()
+
+def _merge_sql(table_name, stage, columns, write_mode, key_columns=PRIMARY_KEY):
+    """
+    SQL que mueve el contenido de `stage` a `table_name` (INSERT ... SELECT, con
+    ON CONFLICT DO UPDATE si write_mode='upsert').
+    """
+    column_list = ', '.join(columns)
+    # WHERE true: SQLite lo exige para distinguir ON CONFLICT de un JOIN ... ON
+    sql = f"INSERT INTO {table_name} ({column_list}) SELECT {column_list} FROM {stage} WHERE true"
+    if write_mode == 'upsert':
+        updates = ', '.join(f"{c} = EXCLUDED.{c}" for c in columns if c not in key_columns)
+        sql += f" ON CONFLICT ({', '.join(key_columns)}) DO UPDATE SET {updates}"
+    return sql
+
+def upsert_frame(df, table_name, engine, key_columns=PRIMARY_KEY, load_method=LOAD_METHOD):
+    """
+    Fusiona `df` en `table_name` de forma idempotente.
+
+    Carga el lote en una tabla temporal de staging (COPY en PostgreSQL) y ejecuta un
+    único `INSERT ... SELECT ... ON CONFLICT (key) DO UPDATE`, todo en una transacción.
+    Las filas nuevas se insertan y las existentes se sobrescriben, así que reintentos
+    y correcciones tardías no requieren truncar ni recargar.
+    """
+    # ON CONFLICT no admite dos filas con la misma clave en el mismo INSERT
+    df = df.drop_duplicates(subset=list(key_columns), keep='last')
+    columns = ', '.join(df.columns)
+    stage = f"{table_name}_stage"
+
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {stage}"))
+        conn.execute(text(f"CREATE TEMPORARY TABLE {stage} AS SELECT {columns} FROM {table_name} WHERE 1 = 0"))
+        if load_method == 'copy' and engine.dialect.name == 'postgresql':
+            _copy_rows(conn.connection, df, stage)
+        else:
+            _insert_rows(conn, df, stage)
+        conn.execute(text(_merge_sql(table_name, stage, df.columns, 'upsert', key_columns)))
+        conn.execute(text(f"DROP TABLE {stage}"))
+
+def write_frame(df, table_name, engine, load_method=LOAD_METHOD, write_mode=WRITE_MODE):
+    """
+    Escribe `df` en `table_name`.
+    write_mode='append' inserta (falla ante claves existentes); 'upsert' fusiona vía staging.
+    load_method='copy' usa COPY en PostgreSQL; en otros motores (o con 'insert')
+    se usa `to_sql` con INSERTs en lotes de 1000 filas.
+    """
+    if write_mode == 'upsert':
+        upsert_frame(df, table_name, engine, load_method=load_method)
+    elif load_method == 'copy' and engine.dialect.name == 'postgresql':
+        copy_frame(df, table_name, engine)
+    else:
+        df.to_sql(table_name, engine, if_exists='append', index=False, chunksize=1000)
+
+def truncate_tables(engine, granularity=GRANULARITY):
     """
     Limpia todos los datos de las tablas antes de cargar.
     Útil para pipelines de carga completa (historical).
     """
     try:
         with engine.connect() as conn:
-            conn.execute(text("TRUNCATE TABLE cryptocurrency_prices, cryptocurrency_metrics RESTART IDENTITY;"))
-            conn.commit()
+            if engine.dialect.name == 'postgresql':
+                conn.execute(text(f"TRUNCATE TABLE {', '.join(table_names(granularity))} RESTART IDENTITY;"))
+            else:
+                # Backends embebidos (SQLite / DuckDB): sin TRUNCATE multi-tabla ni RESTART IDENTITY
+                for table in table_names(granularity):
+                    conn.execute(text(f"DELETE FROM {table}"))
             conn.commit()
         logger.info("Tables truncated successfully (Historical Load).")
     except Exception as e:
         logger.error(f"Error truncating tables: {e}")
 
-def get_latest_date(engine):
+def get_latest_date(engine, granularity=GRANULARITY):
     """
     Recupera el price_timestamp más reciente de la base de datos.
     Usado para carga incremental.
     """
     try:
-        query = "SELECT MAX(price_timestamp) FROM cryptocurrency_prices;"
+        query = f"SELECT MAX(price_timestamp) FROM {table_names(granularity)[0]};"
         with engine.connect() as conn:
             result = conn.execute(text(query)).scalar()
         return pd.to_datetime(result) if result else None
-    except Exception as e:
     except Exception as e:
         logger.error(f"Error fetching max date: {e}")
         return None
 
-def filter_new_data(df, latest_date):
+def get_latest_dates_by_coin(engine, granularity=GRANULARITY):
+    """
+    Recupera el price_timestamp más reciente de cada moneda (high-water mark por moneda).
+    Devuelve un dict {coin: Timestamp}; vacío si la tabla no tiene datos.
+    """
+    try:
+        query = f"SELECT coin, MAX(price_timestamp) FROM {table_names(granularity)[0]} GROUP BY coin;"
+        with engine.connect() as conn:
+            rows = conn.execute(text(query)).fetchall()
+        return {coin: pd.to_datetime(max_date) for coin, max_date in rows if max_date is not None}
+    except Exception as e:
+        logger.error(f"Error fetching per-coin watermarks: {e}")
+        return {}
+
+def filter_new_data(df, latest_date, inclusive=False):
     """
     Filtra el DataFrame para incluir solo registros más recientes que la última fecha en la BD.
+
+    `latest_date` puede ser una fecha global o un dict {coin: fecha} con el watermark
+    de cada moneda; las monedas sin watermark se cargan completas.
+    Con `inclusive=True` se conserva también la fila del watermark (útil en modo upsert
+    para refrescar la última barra, que pudo cargarse con el día aún en curso).
     """
     if latest_date is None:
         return df
     
     # Asegurar que la fecha del df sea datetime
     if 'date' in df.columns:
+        if isinstance(latest_date, dict):
+            watermarks = pd.to_datetime(df['coin_id'].map(latest_date))
+            newer = (df['date'] >= watermarks) if inclusive else (df['date'] > watermarks)
+            return df[watermarks.isna() | newer]
         # Normalizar para eliminar tiempo si es necesario, aunque usualmente se maneja en clean.py
+        if inclusive:
+            return df[df['date'] >= latest_date]
         return df[df['date'] > latest_date]
     return df
 
-def load_raw_prices_to_supabase(df, engine):
-    """
-    Carga datos de precios en la tabla cryptocurrency_prices.
-    Renombrado de load_prices para coincidir con la solicitud del usuario.
-    """
-    """
-    if df.empty:
-        logger.warning("No price data to load.")
-        return
-
+def _prepare_prices_frame(df):
     # Preparar DataFrame para la tabla de precios
     prices_df = df[['coin_id', 'date', 'price', 'volume', 'market_cap']].copy()
     prices_df.rename(columns={
@@ -69,74 +214,188 @@ def load_raw_prices_to_supabase(df, engine):
     # O implica un índice ordenado.
     # Mantengámoslo simple: rango para el lote actual.
     prices_df['row_index'] = range(len(prices_df)) 
+    return prices_df
 
-    table_name = 'cryptocurrency_prices'
+# KPIs persistidos en cryptocurrency_metrics (nombres del registro de src/transform/kpis.py)
+METRICS_COLUMNS = [
+    'price_change_24h', 'price_change_7d', 'price_change_30d',
+    'market_cap_change_24h', 'market_cap_change_7d', 'market_cap_change_30d',
+    'volume_change_24h', 'volume_change_7d', 'volume_change_30d',
+    'daily_return', 'profitability_30d', 'volatility_30d',
+]
+
+def _prepare_metrics_frame(df):
+    metrics_df = df[['coin_id', 'date'] + METRICS_COLUMNS].copy()
+    
+    metrics_df.rename(columns={
+        'coin_id': 'coin',
+        'date': 'price_timestamp'
+    }, inplace=True)
+    return metrics_df
+
+def load_raw_prices_to_supabase(df, engine, load_method=LOAD_METHOD, write_mode=WRITE_MODE,
+                                granularity=GRANULARITY):
+    """
+    Carga datos de precios en la tabla cryptocurrency_prices (o su variante horaria).
+    Renombrado de load_prices para coincidir con la solicitud del usuario.
+    Los errores de escritura se registran y se relanzan.
+    """
+    if df.empty:
+        logger.warning("No price data to load.")
+        return
+
+    prices_df = _prepare_prices_frame(df)
+    table_name = table_names(granularity)[0]
     
     try:
-        prices_df.to_sql(table_name, engine, if_exists='append', index=False, chunksize=1000)
-    try:
-        prices_df.to_sql(table_name, engine, if_exists='append', index=False, chunksize=1000)
-        logger.info(f"Loaded {len(prices_df)} rows into {table_name}")
+        write_frame(prices_df, table_name, engine, load_method, write_mode)
+        logger.info(f"Loaded {len(prices_df)} rows into {table_name} ({write_mode})")
     except Exception as e:
-        logger.error(f"Error loading {table_name} (likely duplicates): {e}")
+        # Se propaga: reintentos, checkpoints y estado de KPIs solo avanzan si la carga se confirmó
+        logger.error(f"Error loading {table_name} ({write_mode}): {e}")
+        raise
 
 
-def load_metrics_to_supabase(df, engine):
+def load_metrics_to_supabase(df, engine, load_method=LOAD_METHOD, write_mode=WRITE_MODE,
+                             granularity=GRANULARITY):
     """
-    Carga datos de métricas en la tabla cryptocurrency_metrics.
+    Carga datos de métricas en la tabla cryptocurrency_metrics (o su variante horaria).
     Renombrado de load_metrics para coincidir con la solicitud del usuario.
+    Los errores de escritura se registran y se relanzan.
     """
-    if df.empty:
     if df.empty:
         logger.warning("No metrics data to load.")
         return
 
-    metrics_df = df[['coin_id', 'date', 
-                     'price_change_24h', 'price_change_7d', 'price_change_30d',
-                     'market_cap_change_24h', 'market_cap_change_7d', 'market_cap_change_30d',
-                     'volume_change_24h', 'volume_change_7d', 'volume_change_30d']].copy()
+    metrics_df = _prepare_metrics_frame(df)
+    table_name = table_names(granularity)[1]
     
-    metrics_df.rename(columns={
-        'coin_id': 'coin',
-        'date': 'price_timestamp'
-    }, inplace=True)
-    
-    table_name = 'cryptocurrency_metrics'
-    
-    try:
-        metrics_df.to_sql(table_name, engine, if_exists='append', index=False, chunksize=1000)
     try:
-        metrics_df.to_sql(table_name, engine, if_exists='append', index=False, chunksize=1000)
-        logger.info(f"Loaded {len(metrics_df)} rows into {table_name}")
+        write_frame(metrics_df, table_name, engine, load_method, write_mode)
+        logger.info(f"Loaded {len(metrics_df)} rows into {table_name} ({write_mode})")
     except Exception as e:
-        logger.error(f"Error loading {table_name} (likely duplicates): {e}")
+        # Se propaga: reintentos, checkpoints y estado de KPIs solo avanzan si la carga se confirmó
+        logger.error(f"Error loading {table_name} ({write_mode}): {e}")
+        raise
+
+
+def load_tables_parallel(df, engine, write_mode=WRITE_MODE, truncate=False, granularity=GRANULARITY):
+    """
+    Carga prices y metrics a la vez y las publica de forma atómica (solo PostgreSQL).
+
+    1. Cada tabla se copia (COPY) a su propia tabla UNLOGGED de staging en una conexión
+       distinta del pool, en paralelo.
+    2. Una única transacción (opcionalmente precedida de TRUNCATE) mueve ambos staging
+       a sus tablas destino: o se confirman las dos cargas o ninguna.
+    """
+    prices_table, metrics_table = table_names(granularity)
+    frames = {
+        prices_table: _prepare_prices_frame(df),
+        metrics_table: _prepare_metrics_frame(df),
+    }
+    if write_mode == 'upsert':
+        frames = {t: f.drop_duplicates(subset=list(PRIMARY_KEY), keep='last') for t, f in frames.items()}
+    suffix = uuid.uuid4().hex[:8]
+    stages = {table: f"{table}_stage_{suffix}" for table in frames}
 
+    try:
+        with engine.begin() as conn:
+            for table, frame in frames.items():
+                columns = ', '.join(frame.columns)
+                conn.execute(text(f"CREATE UNLOGGED TABLE {stages[table]} AS "
+                                  f"SELECT {columns} FROM {table} WHERE 1 = 0"))
+
+        with ThreadPoolExecutor(max_workers=len(frames), thread_name_prefix="load") as executor:
+            futures = [executor.submit(copy_frame, frame, stages[table], engine) for table, frame in frames.items()]
+            for future in futures:
+                future.result()
+
+        with engine.begin() as conn:
+            if truncate:
+                conn.execute(text(f"TRUNCATE TABLE {prices_table}, {metrics_table} RESTART IDENTITY;"))
+            for table, frame in frames.items():
+                conn.execute(text(_merge_sql(table, stages[table], frame.columns, write_mode)))
+        for table, frame in frames.items():
+            logger.info(f"Loaded {len(frame)} rows into {table} ({write_mode}, parallel)")
+    finally:
+        with engine.begin() as conn:
+            for stage in stages.values():
+                conn.execute(text(f"DROP TABLE IF EXISTS {stage}"))
 
-def load_data_to_supabase(df, incremental=False):
+
+def load_data_to_supabase(df, incremental=False, watermarks=None, load_method=LOAD_METHOD,
+                          write_mode=WRITE_MODE, parallel=LOAD_PARALLEL, engine=None, truncate=None,
+                          granularity=GRANULARITY):
     """
     Orquesta la carga de datos en las tablas de Supabase.
     Soporta modos Histórico (Truncate) e Incremental (Append New).
+
+    En modo incremental se filtra contra el watermark de cada moneda; `watermarks`
+    permite reutilizar los leídos antes de la extracción y evitar otra consulta.
+    `load_method` ('copy' | 'insert') elige entre COPY FROM STDIN y INSERTs vía to_sql.
+    Con `write_mode='upsert'` la carga histórica no trunca (las filas existentes se
+    sobrescriben) y la incremental re-escribe también la fila del watermark.
+    Con `parallel=True` (PostgreSQL) ambas tablas se cargan a la vez y se confirman
+    juntas en una sola transacción (ver `load_tables_parallel`).
+    `truncate` fuerza (o evita) el TRUNCATE de la carga histórica; por ejemplo, al cargar
+    por chunks de monedas solo el primero debe truncar.
+    `granularity` elige las tablas diarias o las horarias (*_hourly).
+    Con ROLLUPS_ENABLED, al terminar se recalculan los rollups semanales y mensuales
+    de los periodos que toca el lote (ver `src/load/rollups.py`).
+    Cualquier error de escritura (tablas base o rollups) se propaga al llamador.
     """
-    engine = get_engine()
+    engine = engine or get_engine()
+    upsert = write_mode == 'upsert'
+    parallel = parallel and engine.dialect.name == 'postgresql'
+    if truncate is None:
+        truncate = not incremental and not upsert
     
     if not incremental:
-        logger.info("--- Mode: HISTORICAL LOAD (Full Refresh) ---")
-        truncate_tables(engine)
+        if truncate:
+            logger.info("--- Mode: HISTORICAL LOAD (Full Refresh) ---")
+        elif upsert:
+            logger.info("--- Mode: UPSERT LOAD (Merge on key, no truncate) ---")
+        else:
+            logger.info("--- Mode: HISTORICAL LOAD (Append) ---")
+        if truncate and not parallel:
+            truncate_tables(engine, granularity)
         df_to_load = df
     else:
         logger.info("--- Mode: INCREMENTAL LOAD ---")
-        latest_date = get_latest_date(engine)
-        logger.info(f"Latest date in DB: {latest_date}")
+        if watermarks is None:
+            watermarks = get_latest_dates_by_coin(engine, granularity)
+        logger.info(f"Per-coin watermarks in DB: {len(watermarks)} coins")
         
-        df_to_load = filter_new_data(df, latest_date)
+        df_to_load = filter_new_data(df, watermarks, inclusive=upsert)
         logger.info(f"New rows to insert: {len(df_to_load)}")
     
     if df_to_load.empty:
         logger.info("Skipping load (No new data).")
         return
 
-    logger.info("Loading Prices...")
-    load_raw_prices_to_supabase(df_to_load, engine)
-    
-    logger.info("Loading Metrics...")
-    load_metrics_to_supabase(df_to_load, engine)
+    if PARTITIONED_TABLES and engine.dialect.name == 'postgresql':
+        # Import diferido: partitions importa este módulo
+        from src.db.partitions import ensure_partitions
+        ensure_partitions(engine, df_to_load['date'].min(), df_to_load['date'].max(), granularity=granularity)
+
+    if parallel:
+        logger.info("Loading Prices and Metrics in parallel...")
+        load_tables_parallel(df_to_load, engine, write_mode, truncate=truncate, granularity=granularity)
+    else:
+        logger.info("Loading Prices...")
+        load_raw_prices_to_supabase(df_to_load, engine, load_method, write_mode, granularity)
+
+        logger.info("Loading Metrics...")
+        load_metrics_to_supabase(df_to_load, engine, load_method, write_mode, granularity)
+
+    if ROLLUPS_ENABLED:
+        # Import diferido: rollups importa este módulo
+        from src.load.rollups import refresh_rollups
+        logger.info("Refreshing Rollups...")
+        try:
+            refresh_rollups(engine, df_to_load, granularity, replace=truncate)
+        except Exception as e:
+            # Las tablas base ya están confirmadas; se propaga para no dejar rollups desactualizados
+            # sin aviso (un reintento en modo upsert los recalcula)
+            logger.error(f"Error refreshing rollups: {e}")
+            raise
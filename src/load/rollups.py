@@ -0,0 +1,134 @@
+import pandas as pd
+from sqlalchemy import DateTime, bindparam, text
+from src.config import GRANULARITY
+from src.load.load_db import table_names, upsert_frame
+from src.utils.logger import setup_logger
+
+logger = setup_logger("rollups")
+
+# Periodos de agregación -> frecuencia de pandas (semanas de lunes a domingo, como
+# DATE_TRUNC('week') en PostgreSQL)
+ROLLUP_PERIODS = {
+    'weekly': 'W-SUN',
+    'monthly': 'M',
+}
+ROLLUP_KEY = ('coin', 'period_start')
+# Columnas de cryptocurrency_rollup_* (sql/schema_supabase.sql)
+ROLLUP_COLUMNS = [
+    'coin', 'period_start',
+    'open', 'high', 'low', 'close', 'volume', 'n_bars',
+    'period_return', 'avg_daily_return', 'std_daily_return', 'min_daily_return', 'max_daily_return',
+    'volatility_30d',
+]
+
+
+def rollup_table(period, granularity=GRANULARITY):
+    """
+    Tabla de rollups de `period` ('weekly' | 'monthly'); las de datos horarios llevan sufijo _hourly.
+    """
+    if period not in ROLLUP_PERIODS:
+        raise ValueError(f"Periodo de rollup no soportado: {period}. Opciones: {sorted(ROLLUP_PERIODS)}")
+    table_names(granularity)  # valida la granularidad
+    suffix = '_hourly' if granularity == 'hourly' else ''
+    return f"cryptocurrency_rollup_{period}{suffix}"
+
+
+def period_start(dates, period):
+    """
+    Inicio del periodo (semana o mes) de cada fecha de la Serie `dates`.
+    """
+    return dates.dt.to_period(ROLLUP_PERIODS[period]).dt.start_time
+
+
+def compute_rollups(df, period):
+    """
+    Agrega barras (coin, price_timestamp, price, volume, daily_return, volatility_30d)
+    por moneda y periodo:
+
+    - OHLC a partir de los precios de cierre de cada barra y volumen sumado.
+    - `period_return`: cambio porcentual entre la primera y la última barra del periodo.
+    - Estadísticos de `daily_return` (fracción, como en cryptocurrency_metrics).
+    - `volatility_30d`: volatilidad móvil de 30 días al cierre del periodo (porcentaje).
+    """
+    if df.empty:
+        return pd.DataFrame(columns=ROLLUP_COLUMNS)
+    df = df.sort_values(['coin', 'price_timestamp'])
+    grouped = df.assign(period_start=period_start(df['price_timestamp'], period)).groupby(
+        ['coin', 'period_start'], sort=True, observed=True)
+    out = grouped.agg(
+        open=('price', 'first'),
+        high=('price', 'max'),
+        low=('price', 'min'),
+        close=('price', 'last'),
+        volume=('volume', 'sum'),
+        n_bars=('price', 'size'),
+        avg_daily_return=('daily_return', 'mean'),
+        std_daily_return=('daily_return', 'std'),
+        min_daily_return=('daily_return', 'min'),
+        max_daily_return=('daily_return', 'max'),
+        volatility_30d=('volatility_30d', 'last'),
+    ).reset_index()
+    out['period_return'] = (out['close'] / out['open'] - 1) * 100
+    return out[ROLLUP_COLUMNS]
+
+
+def _read_bars(engine, bounds, granularity):
+    """
+    Lee de las tablas de hechos las barras de cada moneda dentro de sus periodos
+    afectados, `bounds[coin] = (inicio, fin)` con el fin excluido. Los límites por
+    moneda van en la consulta (join con una tabla derivada) para no leer de más.
+    """
+    prices_table, metrics_table = table_names(granularity)
+    rows, params = [], {}
+    for i, (coin, (start, end)) in enumerate(bounds.items()):
+        # UNION ALL de SELECTs en lugar de VALUES: SQLite no admite alias de columnas en VALUES
+        rows.append(f"SELECT :coin_{i} AS coin, :start_{i} AS period_lo, :end_{i} AS period_hi")
+        params.update({f'coin_{i}': coin, f'start_{i}': start.to_pydatetime(), f'end_{i}': end.to_pydatetime()})
+    query = text(
+        f"SELECT p.coin, p.price_timestamp, p.price, p.volume, m.daily_return, m.volatility_30d "
+        f"FROM {prices_table} p "
+        f"JOIN ({' UNION ALL '.join(rows)}) b "
+        f"ON p.coin = b.coin AND p.price_timestamp >= b.period_lo AND p.price_timestamp < b.period_hi "
+        f"LEFT JOIN {metrics_table} m ON m.coin = p.coin AND m.price_timestamp = p.price_timestamp"
+    ).bindparams(*(bindparam(name, type_=DateTime()) for name in params if not name.startswith('coin_')))
+    with engine.connect() as conn:
+        df = pd.read_sql(query, conn, params=params)
+    if df.empty:
+        return df
+    df['price_timestamp'] = pd.to_datetime(df['price_timestamp'])
+    for column in ('price', 'volume', 'daily_return', 'volatility_30d'):
+        df[column] = pd.to_numeric(df[column], errors='coerce').astype('float64')
+    return df
+
+
+def refresh_rollups(engine, df, granularity=GRANULARITY, periods=tuple(ROLLUP_PERIODS), replace=False):
+    """
+    Recalcula los rollups de los periodos que toca el lote `df` (salida del transform,
+    con coin_id y date) y los fusiona con upsert.
+
+    Para cada moneda del lote se releen de la base solo las barras de sus periodos
+    afectados, desde el inicio del periodo de su fecha más antigua hasta el fin del de su
+    fecha más reciente (las filas previas de esos periodos pueden venir de cargas
+    anteriores); un lote antiguo (backfill, relleno de huecos) no relee hasta hoy.
+    Con `replace=True` (carga histórica que trunca) se vacían antes las tablas de rollups.
+    """
+    if df.empty:
+        return {}
+    dates = df.groupby('coin_id', observed=True)['date'].agg(['min', 'max'])
+    refreshed = {}
+    for period in periods:
+        table = rollup_table(period, granularity)
+        freq = ROLLUP_PERIODS[period]
+        bounds = {str(coin): (pd.Timestamp(first).to_period(freq).start_time,
+                              (pd.Timestamp(last).to_period(freq) + 1).start_time)
+                  for coin, (first, last) in dates.iterrows()}
+        bars = _read_bars(engine, bounds, granularity)
+        rollups = compute_rollups(bars, period)
+        if replace:
+            with engine.begin() as conn:
+                conn.execute(text(f"DELETE FROM {table}"))
+        if not rollups.empty:
+            upsert_frame(rollups, table, engine, key_columns=ROLLUP_KEY)
+        refreshed[table] = len(rollups)
+        logger.info(f"Refreshed {len(rollups)} rows in {table} ({len(bounds)} coins)")
+    return refreshed
@@ -1,52 +1,191 @@
 import sys
-from src.etl.extract import extract_all_coins
+from src.etl.extract import extract_all_coins, shard_coins
+from src.etl.gaps import scan_and_fill
 from src.transform.clean import clean_data
 from src.transform.kpis import calculate_kpis
-from src.load.load_db import load_data_to_supabase
+from src.transform.parallel import transform_parallel
+from src.transform.validate import split_nulls, validate_batch
+from src.transform.kpi_state import (build_kpi_state, calculate_kpis_incremental, load_kpi_state, save_kpi_state,
+                                    state_history)
+from src.load.load_db import load_data_to_supabase, get_latest_dates_by_coin, METRICS_COLUMNS
 from src.utils.logger import setup_logger
-from src.data_quality import run_all_checks
+from src.data_quality import CONFIRMATION_CHECKS, run_all_checks, batch_scope, merge_scopes
 from src.db.connection import get_engine
+from src.streaming import run_streaming
+from src.utils.metrics import stage, write_textfile
+from src.config import (COINS, DQ_SCOPE, GAP_FILL_ENABLED, GRANULARITY, KPI_MODE, PIPELINE_MODE,
+                        PROCESS_CHUNK_COINS, TRANSFORM_MAX_WORKERS, VALIDATION_MODE)
 
 logger = setup_logger("main_pipeline")
 
-def run_pipeline(incremental=False):
-    logger.info(f"--- Iniciando Pipeline ETL (Incremental={incremental}) ---")
-    
-    # 1. Extracción
-    logger.info("\n[Paso 1] Extrayendo datos de CoinGecko...")
-    raw_df = extract_all_coins()
-    logger.info(f"Se extrajeron {len(raw_df)} filas.")
+def _transform(raw_df, incremental, kpi_state):
+    """
+    Limpieza + KPIs de un lote de monedas. Devuelve (final_df, estado de KPIs o None).
+    """
+    if KPI_MODE == 'incremental' and incremental:
+        logger.info("\n[Paso 2a] Limpiando datos...")
+        clean_df = clean_data(raw_df)
+        logger.info("[Paso 2b] Calculando KPIs...")
+        # Solo las filas nuevas de cada moneda, avanzando el estado de ventanas persistido
+        return calculate_kpis_incremental(clean_df, kpi_state)
+
+    if TRANSFORM_MAX_WORKERS > 1:
+        logger.info("\n[Paso 2] Limpiando datos y calculando KPIs en paralelo por moneda...")
+        final_df = transform_parallel(raw_df, columns=METRICS_COLUMNS)
+    else:
+        logger.info("\n[Paso 2a] Limpiando datos...")
+        clean_df = clean_data(raw_df)
+        logger.info("[Paso 2b] Calculando KPIs...")
+        # Solo los KPIs que persiste la carga (y sus dependencias)
+        final_df = calculate_kpis(clean_df, columns=METRICS_COLUMNS)
+    if KPI_MODE == 'incremental':
+        return final_df, build_kpi_state(final_df)
+    return final_df, None
+
+def _run_staged(engine, incremental, watermarks, previous_state, chunk_coins):
+    """
+    Modo por etapas: por cada chunk de monedas, extracción completa -> transform -> carga.
+    Devuelve (estado de KPIs o None, rangos de claves cargados).
+    """
+    chunks = shard_coins(COINS, chunk_coins) if chunk_coins > 0 else [COINS]
+
+    kpi_state = None
+    loaded_chunks = 0
+    # Rango de claves cargado (monedas y fechas de todos los chunks) para los checks de calidad
+    scopes = []
+
+    for i, coins in enumerate(chunks, start=1):
+        if len(chunks) > 1:
+            logger.info(f"\n=== Chunk {i}/{len(chunks)}: {', '.join(coins)} ===")
+
+        # 1. Extracción
+        logger.info("\n[Paso 1] Extrayendo datos de CoinGecko...")
+        with stage('extract', chunk=i) as m:
+            raw_df = extract_all_coins(coins=coins, watermarks=watermarks)
+            m.rows_out = len(raw_df)
+        logger.info(f"Se extrajeron {len(raw_df)} filas.")
+
+        if raw_df.empty:
+            logger.warning("No se extrajeron datos. Saliendo." if len(chunks) == 1
+                           else "No se extrajeron datos para este chunk.")
+            continue
+
+        # Las filas con NULLs se apartan antes de que la limpieza las descarte o los KPIs las rellenen
+        raw_df, nulls = split_nulls(raw_df)
+
+        # 2. Transformación (Limpieza)
+        # 3. Transformación (KPIs)
+        with stage('transform', rows_in=len(raw_df), chunk=i) as m:
+            final_df, chunk_state = _transform(raw_df, incremental, previous_state)
+            m.rows_out = len(final_df)
+        del raw_df
+
+        # Validación en memoria antes de tocar la base (cuarentena o rechazo del lote): solo
+        # las filas que se cargarán; el lookback ya cargado y el estado de KPIs son contexto
+        logger.info("\n[Paso 2c] Validando lote...")
+        with stage('validate', rows_in=len(final_df), chunk=i) as m:
+            final_df, _ = validate_batch(final_df, watermarks=watermarks, context=state_history(previous_state),
+                                         nulls=nulls)
+            m.rows_out = len(final_df)
+        if final_df.empty:
+            logger.warning("Ninguna fila pasó la validación para este chunk.")
+            continue
+
+        # Vista previa
+        print("\nVista previa de datos:")
+        print(final_df[['coin_id', 'date', 'price', 'profitability_30d', 'volatility_30d']].tail())
+
+        # 4. Carga
+        logger.info("\n[Paso 3] Cargando datos a Supabase...")
+        # En carga histórica por chunks solo el primer chunk cargado trunca las tablas
+        truncate = False if loaded_chunks else None
+
+        try:
+            with stage('load', rows_in=len(final_df), chunk=i):
+                load_data_to_supabase(final_df, incremental=incremental, watermarks=watermarks, engine=engine,
+                                      truncate=truncate)
+        except Exception as e:
+            logger.error(f"Error durante la fase de carga: {e}")
+            raise e
+        # El estado de KPIs del chunk solo avanza con una carga confirmada: un chunk vaciado
+        # por la validación o fallido se recalcula desde el estado anterior en la próxima ejecución
+        if chunk_state is not None:
+            kpi_state = {**(kpi_state or previous_state or {}), **chunk_state}
+        loaded_chunks += 1
+        scopes.append(batch_scope(final_df))
+
+    return kpi_state, scopes
+
+def run_pipeline(incremental=False, chunk_coins=PROCESS_CHUNK_COINS, mode=PIPELINE_MODE):
+    """
+    Ejecuta extract -> transform -> load -> checks de calidad.
+
+    Con `chunk_coins > 0` las monedas se procesan en chunks de ese tamaño (extracción,
+    transformación y carga completas por chunk), de modo que la memoria queda acotada
+    por el chunk y no por el universo completo; útil con GRANULARITY='hourly'.
+
+    Con `mode='streaming'` (ver src/streaming.py) cada moneda pasa por clean -> KPIs ->
+    validación -> carga en cuanto se extrae, con colas acotadas entre etapas, de modo que
+    red, CPU y base se solapan y la memoria la acota la profundidad de las colas.
+
+    Con METRICS_ENABLED cada etapa emite sus medidas como log JSON (src/utils/metrics.py)
+    y al terminar, también si falla, se escriben en METRICS_TEXTFILE_DIR.
+    """
+    try:
+        _run_pipeline(incremental, chunk_coins, mode)
+    finally:
+        write_textfile('pipeline')
+
+def _run_pipeline(incremental, chunk_coins, mode):
+    if mode not in ('staged', 'streaming'):
+        raise ValueError(f"PIPELINE_MODE no soportado: {mode}. Usar 'staged' o 'streaming'.")
+    logger.info(f"--- Iniciando Pipeline ETL (Incremental={incremental}, Granularidad={GRANULARITY}, "
+                f"Modo={mode}) ---")
     
-    if raw_df.empty:
-        logger.warning("No se extrajeron datos. Saliendo.")
+    # Motor compartido (pool) para watermarks, carga y checks de calidad
+    engine = get_engine()
+
+    watermarks = None
+    if incremental:
+        # Pedir solo los días posteriores al último dato de cada moneda (+ lookback de KPIs)
+        watermarks = get_latest_dates_by_coin(engine)
+    previous_state = load_kpi_state() if KPI_MODE == 'incremental' and incremental else None
+
+    if mode == 'streaming':
+        logger.info("Modo streaming: cada moneda pasa por extract -> transform -> load en cuanto llega")
+        result = run_streaming(engine, COINS, incremental=incremental, watermarks=watermarks,
+                               kpi_state=previous_state)
+        kpi_state = {**(previous_state or {}), **result.kpi_state} if result.kpi_state is not None else None
+        scopes = result.scopes
+    else:
+        kpi_state, scopes = _run_staged(engine, incremental, watermarks, previous_state, chunk_coins)
+    if not scopes:
         return
+    # Si todos los lotes pasaron la validación en memoria, los checks en la base se
+    # reducen a una confirmación barata
+    validated = VALIDATION_MODE != 'off'
 
-    # 2. Transformación (Limpieza)
-    logger.info("\n[Paso 2a] Limpiando datos...")
-    clean_df = clean_data(raw_df)
-    
-    # 3. Transformación (KPIs)
-    logger.info("[Paso 2b] Calculando KPIs...")
-    final_df = calculate_kpis(clean_df)
-    
-    # Vista previa
-    print("\nVista previa de datos:")
-    print(final_df[['coin_id', 'date', 'price', 'profitability_30d', 'volatility_30d']].tail())
+    # Solo llega aquí si todas las cargas terminaron bien (load_data_to_supabase propaga los
+    # errores) y el estado solo incluye chunks cargados, para no saltarse filas
+    if kpi_state is not None:
+        save_kpi_state(kpi_state)
 
-    # 4. Carga
-    logger.info("\n[Paso 3] Cargando datos a Supabase...")
-    
-    try:
-        load_data_to_supabase(final_df, incremental=incremental)
-    except Exception as e:
-        logger.error(f"Error durante la fase de carga: {e}")
-        raise e
+    # Huecos dentro de las series (extracciones fallidas, filas en cuarentena): una consulta
+    # con LAG y refetch solo de los tramos que faltan
+    if GAP_FILL_ENABLED and incremental:
+        logger.info("\n[Paso 3b] Buscando huecos en las series...")
+        try:
+            scan_and_fill(engine)
+        except Exception as e:
+            # No bloquea el pipeline: los huecos se vuelven a detectar en la próxima ejecución
+            logger.error(f"Error rellenando huecos: {e}")
         
     # 5. Checks de Calidad de Datos
     logger.info("\n[Paso 4] Ejecutando Checks de Calidad de Datos...")
+    scope = merge_scopes(scopes) if DQ_SCOPE == 'batch' else None
     try:
-        engine = get_engine()
-        run_all_checks(engine)
+        with stage('data_quality'):
+            run_all_checks(engine, scope=scope, checks=CONFIRMATION_CHECKS if validated and scope else None)
     except Exception as e:
         logger.error(f"Pipeline falló en Data Quality Check: {e}")
         # Dependiendo de la severidad, podemos hacer raise e para fallar el job completamente
@@ -56,6 +195,6 @@ def run_pipeline(incremental=False):
 
 if __name__ == "__main__":
     # Verificar argumentos
-    # Uso: python -m src.main --incremental
+    # Uso: python -m src.main --incremental [--streaming]
     is_incremental = '--incremental' in sys.argv
-    run_pipeline(incremental=is_incremental)
+    run_pipeline(incremental=is_incremental, mode='streaming' if '--streaming' in sys.argv else PIPELINE_MODE)
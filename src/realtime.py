@@ -0,0 +1,300 @@
+"""
+Servicio de micro-lotes casi en tiempo real.
+
+Cada `interval` segundos consulta el precio actual de todas las monedas en una sola
+llamada al endpoint `/simple/price` de CoinGecko y:
+
+1. añade los ticks nuevos (por `last_updated_at`) a la tabla `cryptocurrency_ticks`;
+2. actualiza en su sitio la barra en curso (día u hora según GRANULARITY) de las
+   tablas de precios y métricas, recalculando sus KPIs con upsert.
+
+La historia que necesitan los KPIs de la barra en curso (el lookback de las ventanas)
+se lee una sola vez al arrancar y luego se mantiene en memoria con lo que escribe cada
+consulta, así que una consulta solo hace una llamada a la API y dos upserts pequeños.
+
+Por consulta se mide la latencia de punta a punta (desde el `last_updated_at` del tick
+hasta que la barra queda confirmada en la base), el retraso de la fuente y la duración
+de la consulta; se registran en el log y, con METRICS_TEXTFILE_DIR, en
+`crypto_etl_realtime.prom`. El reloj es inyectable para probar el servicio con un
+reloj simulado.
+
+Uso:
+    python -m src.realtime [--interval 60] [--coins bitcoin,ethereum] [--max-polls 10]
+"""
+import argparse
+import sys
+import time
+from dataclasses import dataclass
+
+import pandas as pd
+from sqlalchemy import DateTime, bindparam, text
+
+from src.config import COINS, GRANULARITY, REALTIME_POLL_SECONDS, VS_CURRENCY
+from src.db.connection import get_engine
+from src.etl.backfill import fetch_lookback
+from src.etl.extract import get_coingecko_client
+from src.etl.rate_limit import TokenBucket, call_with_retries
+from src.load.load_db import METRICS_COLUMNS, TABLES, load_data_to_supabase, table_names, upsert_frame
+from src.transform.dtypes import normalize_dates, normalize_raw
+from src.transform.granularity import bar_frequency
+from src.transform.kpis import calculate_kpis
+from src.transform.validate import split_nulls, validate_batch
+from src.utils.logger import setup_logger
+from src.utils.metrics import count_call, stage, write_textfile
+
+logger = setup_logger("realtime")
+
+TICKS_TABLE = 'cryptocurrency_ticks'
+TICKS_KEY = ('coin', 'tick_timestamp')
+TICKS_DDL = f"""
+CREATE TABLE IF NOT EXISTS {TICKS_TABLE} (
+    coin VARCHAR(50) NOT NULL,
+    tick_timestamp TIMESTAMP NOT NULL,
+    price NUMERIC,
+    volume_24h NUMERIC,
+    market_cap NUMERIC,
+    received_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (coin, tick_timestamp)
+)
+"""
+
+
+class SystemClock:
+    """Reloj real (segundos epoch). Los tests inyectan uno simulado con la misma interfaz."""
+
+    def now(self):
+        return time.time()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+
+@dataclass
+class PollResult:
+    """
+    Resultado de una consulta. Las latencias son el máximo entre las monedas
+    actualizadas (None si ningún tick era nuevo).
+    """
+    polled_at: pd.Timestamp
+    ticks: int = 0
+    bars_updated: int = 0
+    poll_seconds: float = 0.0
+    end_to_end_seconds: float = None
+    source_lag_seconds: float = None
+
+
+def ensure_ticks_table(engine):
+    with engine.begin() as conn:
+        conn.execute(text(TICKS_DDL))
+
+
+def fetch_ticks(coins, cg=None, limiter=None, vs_currency=VS_CURRENCY):
+    """
+    Precio, volumen 24h, market cap y `last_updated_at` actuales de `coins` en una sola
+    llamada a `/simple/price`. Las monedas que la API no devuelve se omiten.
+    """
+    cg = cg or get_coingecko_client()
+    count_call('api_calls')
+    data = call_with_retries(cg.get_price, ids=list(coins), vs_currencies=vs_currency, include_market_cap=True,
+                             include_24hr_vol=True, include_last_updated_at=True, limiter=limiter)
+    rows = [{'coin': coin, 'tick_timestamp': pd.Timestamp(quote['last_updated_at'], unit='s'),
+             'price': quote.get(vs_currency), 'volume_24h': quote.get(f'{vs_currency}_24h_vol'),
+             'market_cap': quote.get(f'{vs_currency}_market_cap')}
+            for coin, quote in data.items() if quote.get('last_updated_at') and quote.get(vs_currency) is not None]
+    missing = set(coins) - {row['coin'] for row in rows}
+    if missing:
+        logger.warning(f"Sin cotización para: {', '.join(sorted(missing))}")
+    return pd.DataFrame(rows, columns=['coin', 'tick_timestamp', 'price', 'volume_24h', 'market_cap'])
+
+
+def _read_recent_prices(engine, coins, since, granularity):
+    """
+    Barras guardadas de `coins` desde `since`, con el formato del transform (coin_id, date, ...).
+    """
+    query = text(f"SELECT coin AS coin_id, price_timestamp AS date, price, volume, market_cap "
+                 f"FROM {table_names(granularity)[0]} WHERE coin IN :coins AND price_timestamp >= :since"
+                 ).bindparams(bindparam('coins', expanding=True), bindparam('since', type_=DateTime()))
+    with engine.connect() as conn:
+        df = pd.read_sql(query, conn, params={'coins': list(coins), 'since': since.to_pydatetime()})
+    df['date'] = normalize_dates(pd.to_datetime(df['date']))
+    for column in ('price', 'volume', 'market_cap'):
+        df[column] = pd.to_numeric(df[column], errors='coerce').astype('float64')
+    return df
+
+
+class RealtimeService:
+    """
+    Bucle de consultas periódicas. `poll_once` hace una consulta; `run` las repite a
+    cadencia fija (si una consulta se retrasa, se saltan los turnos perdidos en lugar
+    de encadenar consultas).
+    """
+
+    def __init__(self, engine=None, coins=None, granularity=GRANULARITY, interval=REALTIME_POLL_SECONDS,
+                 cg=None, limiter=None, clock=None):
+        if granularity not in TABLES:
+            raise ValueError(f"Granularidad no soportada: {granularity}. Opciones: {sorted(TABLES)}")
+        if interval <= 0:
+            raise ValueError("El intervalo entre consultas debe ser mayor que 0.")
+        self.engine = engine or get_engine()
+        self.coins = list(COINS if coins is None else coins)
+        self.granularity = granularity
+        self.interval = interval
+        self.cg = cg
+        self.limiter = limiter or TokenBucket()
+        self.clock = clock or SystemClock()
+        self.step = bar_frequency(granularity)
+        self.lookback = fetch_lookback(granularity)
+        self.last_tick = {}
+        self.last_result = None
+        self._series = None
+        # Barras cuya escritura falló: se reintentan junto con las de la próxima consulta
+        self._pending = None
+
+        ensure_ticks_table(self.engine)
+
+    def _now(self):
+        # Resolución de microsegundos: la de TIMESTAMP en la base
+        return pd.Timestamp(self.clock.now(), unit='s').floor('us')
+
+    def _history(self, bar):
+        # Lookback de la barra en curso (más una barra: SQLite compara las fechas como texto)
+        if self._series is None:
+            self._series = _read_recent_prices(self.engine, self.coins, bar - self.lookback - self.step,
+                                               self.granularity)
+            logger.info(f"Historia cargada: {len(self._series)} barras de {self._series['coin_id'].nunique()} monedas")
+        return self._series
+
+    def _update_bars(self, ticks):
+        """
+        Recalcula y escribe (upsert) la barra en curso de las monedas de `ticks`, más las
+        barras pendientes de una escritura fallida. Devuelve las filas escritas. Si la carga
+        falla, la historia en memoria no avanza y las barras quedan pendientes.
+        """
+        bars = pd.DataFrame({
+            'coin_id': ticks['coin'], 'date': normalize_dates(ticks['tick_timestamp'].dt.floor(self.step)),
+            'price': ticks['price'], 'volume': ticks['volume_24h'], 'market_cap': ticks['market_cap'],
+        })
+        if self._pending is not None:
+            # Un tick nuevo de la misma barra sustituye al pendiente
+            bars = pd.concat([self._pending, bars], ignore_index=True).drop_duplicates(['coin_id', 'date'],
+                                                                                         keep='last')
+        # Ticks con NULLs: calculate_kpis los rellenaría con 0; se apartan para la validación
+        bars, nulls = split_nulls(bars)
+        if bars.empty:
+            validate_batch(bars, self.granularity, nulls=nulls)
+            self._pending = None
+            return 0
+        latest_bar = bars['date'].max()
+        series = pd.concat([self._history(latest_bar), bars], ignore_index=True)
+        series = series.drop_duplicates(['coin_id', 'date'], keep='last')
+        series = series[series['date'] >= latest_bar - self.lookback - self.step]
+        series = normalize_raw(series.sort_values(['coin_id', 'date'], ignore_index=True))
+
+        df = calculate_kpis(series, columns=METRICS_COLUMNS, granularity=self.granularity)
+        keys = pd.MultiIndex.from_frame(bars[['coin_id', 'date']].astype({'coin_id': str}))
+        current = pd.MultiIndex.from_frame(df[['coin_id', 'date']].astype({'coin_id': str}))
+        # La barra en curso se valida contra la historia en memoria (picos en la última barra)
+        df, _ = validate_batch(df[current.isin(keys)].reset_index(drop=True), self.granularity, context=df,
+                               nulls=nulls)
+        if not df.empty:
+            try:
+                load_data_to_supabase(df, engine=self.engine, write_mode='upsert', truncate=False, parallel=False,
+                                      granularity=self.granularity)
+            except Exception:
+                self._pending = bars
+                raise
+        self._pending = None
+        # La historia en memoria avanza solo con lo confirmado (incluido el cambio de barra);
+        # una barra en cuarentena no entra en la historia de las siguientes
+        written = pd.MultiIndex.from_frame(df[['coin_id', 'date']].astype({'coin_id': str}))
+        rejected = keys.difference(written)
+        if len(rejected):
+            stored = pd.MultiIndex.from_frame(series[['coin_id', 'date']].astype({'coin_id': str}))
+            series = series[~stored.isin(rejected)]
+        self._series = series[['coin_id', 'date', 'price', 'volume', 'market_cap']]
+        return len(df)
+
+    def poll_once(self):
+        """Una consulta: API -> ticks nuevos -> barra en curso. Devuelve un PollResult."""
+        started = self.clock.now()
+        result = PollResult(polled_at=pd.Timestamp(started, unit='s'))
+        with stage('realtime_poll', granularity=self.granularity) as m:
+            ticks = fetch_ticks(self.coins, cg=self.cg, limiter=self.limiter)
+            received = self._now()
+            # Solo los ticks que la fuente actualizó desde la consulta anterior
+            is_new = [ts > self.last_tick.get(coin, pd.Timestamp.min)
+                      for coin, ts in zip(ticks['coin'], ticks['tick_timestamp'])]
+            ticks = ticks[is_new].reset_index(drop=True)
+            result.ticks = len(ticks)
+            if not ticks.empty:
+                upsert_frame(ticks.assign(received_at=received), TICKS_TABLE, self.engine, key_columns=TICKS_KEY)
+                result.bars_updated = self._update_bars(ticks)
+                self.last_tick.update(zip(ticks['coin'], ticks['tick_timestamp']))
+                committed = self._now()
+                result.end_to_end_seconds = (committed - ticks['tick_timestamp'].min()).total_seconds()
+                result.source_lag_seconds = (received - ticks['tick_timestamp'].min()).total_seconds()
+            m.rows_out = result.bars_updated
+        result.poll_seconds = self.clock.now() - started
+        self.last_result = result
+
+        latency = '-' if result.end_to_end_seconds is None else f"{result.end_to_end_seconds:.1f}s"
+        logger.info(f"Consulta {result.polled_at}: {result.ticks} ticks nuevos, {result.bars_updated} barras "
+                    f"actualizadas, latencia de punta a punta {latency}, consulta {result.poll_seconds:.2f}s")
+        gauges = {'realtime_poll_seconds': ('Duración de la última consulta', result.poll_seconds),
+                  'realtime_ticks': ('Ticks nuevos en la última consulta', result.ticks),
+                  'realtime_last_poll_timestamp_seconds': ('Inicio de la última consulta', started)}
+        if result.end_to_end_seconds is not None:
+            gauges['realtime_end_to_end_latency_seconds'] = (
+                'Desde last_updated_at del tick más antiguo hasta su barra confirmada en la base',
+                result.end_to_end_seconds)
+            gauges['realtime_source_lag_seconds'] = (
+                'Desde last_updated_at del tick más antiguo hasta su recepción', result.source_lag_seconds)
+        write_textfile('realtime', gauges=gauges)
+        return result
+
+    def run(self, max_polls=None):
+        """
+        Consulta cada `interval` segundos hasta `max_polls` consultas (None = sin fin).
+        Un error en una consulta se registra y el servicio sigue. Devuelve las consultas hechas.
+        """
+        polls = 0
+        next_at = self.clock.now()
+        while max_polls is None or polls < max_polls:
+            delay = next_at - self.clock.now()
+            if delay > 0:
+                self.clock.sleep(delay)
+            try:
+                self.poll_once()
+            except Exception as e:
+                logger.error(f"Consulta fallida: {e}")
+            polls += 1
+
+            next_at += self.interval
+            late = self.clock.now() - next_at
+            if late > 0:
+                missed = int(late // self.interval) + 1
+                logger.warning(f"La consulta superó el intervalo de {self.interval}s; se saltan {missed} turnos")
+                next_at += missed * self.interval
+        return polls
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servicio de micro-lotes casi en tiempo real.")
+    parser.add_argument('--interval', type=float, default=REALTIME_POLL_SECONDS, help="Segundos entre consultas")
+    parser.add_argument('--coins', help="Monedas separadas por comas; por defecto COINS")
+    parser.add_argument('--granularity', default=GRANULARITY, choices=sorted(TABLES))
+    parser.add_argument('--max-polls', type=int, help="Terminar tras N consultas (por defecto, sin fin)")
+    args = parser.parse_args(argv)
+
+    service = RealtimeService(coins=args.coins.split(',') if args.coins else None, granularity=args.granularity,
+                              interval=args.interval)
+    logger.info(f"Servicio en tiempo real: {len(service.coins)} monedas cada {args.interval}s ({args.granularity})")
+    try:
+        service.run(max_polls=args.max_polls)
+    except KeyboardInterrupt:
+        logger.info("Servicio detenido.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,256 @@
+"""
+Modo streaming de run_pipeline (PIPELINE_MODE=streaming).
+
+En lugar de extraer todas las monedas, concatenarlas, transformarlas y cargarlas por
+etapas, cada moneda fluye por extract -> clean/KPIs/validación -> load en cuanto llega:
+
+    hilos de extracción --(raw_q)--> hilo de transform --(load_q)--> hilo de carga
+
+Las colas están acotadas (`queue_depth`), así que una etapa lenta frena a las
+anteriores (backpressure) y la memoria queda acotada por la profundidad de las colas
+y no por el número de monedas. Red, CPU y base se solapan: el tiempo total tiende al
+de la etapa más lenta. Los hilos de transform y de carga agrupan los frames que
+encuentran esperando en su cola (hasta `load_batch_coins`), de modo que si una de esas
+etapas es el cuello de botella sus lotes crecen y su coste fijo por llamada (KPIs y
+validación, staging y rollups) se amortiza.
+"""
+import queue
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+import pandas as pd
+
+from src.config import (EXTRACT_MAX_WORKERS, GRANULARITY, KPI_MODE, STREAM_LOAD_BATCH_COINS, STREAM_QUEUE_DEPTH)
+from src.data_quality import batch_scope
+from src.etl.extract import days_since_watermark, fetch_coin_data, fetch_window
+from src.etl.rate_limit import TokenBucket
+from src.load.load_db import METRICS_COLUMNS, load_data_to_supabase
+from src.transform.clean import clean_data
+from src.transform.dtypes import normalize_raw
+from src.transform.kpi_state import build_kpi_state, calculate_kpis_incremental, state_history
+from src.transform.kpis import calculate_kpis
+from src.transform.validate import split_nulls, validate_batch
+from src.utils.logger import setup_logger
+from src.utils.metrics import stage
+
+logger = setup_logger("streaming")
+
+# Marca de fin de stream que cada etapa pasa a la siguiente
+_DONE = object()
+_POLL_SECONDS = 0.1
+
+
+@dataclass
+class StreamResult:
+    """
+    Resultado de una ejecución: rangos de claves cargados (para los checks de calidad),
+    estado de KPIs de las monedas cargadas (modo incremental), filas cargadas y
+    segundos ocupados de cada etapa frente al tiempo total.
+    """
+    scopes: list = field(default_factory=list)
+    kpi_state: dict = None
+    rows_loaded: int = 0
+    busy_seconds: dict = field(default_factory=dict)
+    wall_seconds: float = 0.0
+    max_in_flight: int = 0
+
+
+def transform_frame(raw_df, incremental=False, kpi_state=None, granularity=GRANULARITY, watermarks=None):
+    """
+    Limpieza + KPIs + validación de los datos crudos de una moneda (o de unas pocas).
+    Devuelve (final_df, estado de KPIs de esas monedas o None). Con `watermarks` solo
+    se validan y devuelven las filas posteriores al último dato cargado de cada moneda.
+    """
+    raw_df, nulls = split_nulls(raw_df)
+    clean_df = clean_data(raw_df, granularity)
+    history = None
+    if KPI_MODE == 'incremental' and incremental:
+        # Solo el estado de las monedas del frame (calculate_kpis_incremental lo copia entero)
+        coins = set(map(str, clean_df['coin_id'].unique()))
+        state = {coin: s for coin, s in (kpi_state or {}).items() if coin in coins}
+        history = state_history(state)
+        final_df, state = calculate_kpis_incremental(clean_df, state, granularity)
+    else:
+        final_df = calculate_kpis(clean_df, columns=METRICS_COLUMNS, granularity=granularity)
+        state = build_kpi_state(final_df, granularity) if KPI_MODE == 'incremental' else None
+    final_df, _ = validate_batch(final_df, granularity, watermarks=watermarks if incremental else None,
+                                 context=history, nulls=nulls)
+    return final_df, state
+
+
+class _Stream:
+    """Colas, parada y contabilidad compartidas por los hilos de una ejecución."""
+
+    def __init__(self, queue_depth):
+        self.raw_q = queue.Queue(maxsize=queue_depth)
+        self.load_q = queue.Queue(maxsize=queue_depth)
+        self.stop = threading.Event()
+        self.errors = []
+        self.lock = threading.Lock()
+        self.busy = defaultdict(float)
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def put(self, q, item):
+        # put bloqueante (backpressure) que se abandona si otra etapa falló
+        while not self.stop.is_set():
+            try:
+                q.put(item, timeout=_POLL_SECONDS)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(self, q):
+        while True:
+            try:
+                return q.get(timeout=_POLL_SECONDS)
+            except queue.Empty:
+                if self.stop.is_set():
+                    return _DONE
+
+    def track(self, stage_name, seconds, delta=0):
+        # `in_flight`: monedas entre su extracción y el fin de su carga
+        with self.lock:
+            self.busy[stage_name] += seconds
+            self.in_flight += delta
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def fail(self, exc):
+        with self.lock:
+            self.errors.append(exc)
+        self.stop.set()
+
+    def get_batch(self, q, limit):
+        """
+        Espera un frame y añade los que ya esperan en la cola, hasta `limit`.
+        Devuelve (lote, fin del stream).
+        """
+        item = self.get(q)
+        if item is _DONE:
+            return [], True
+        batch = [item]
+        while len(batch) < limit:
+            try:
+                item = q.get_nowait()
+            except queue.Empty:
+                break
+            if item is _DONE:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+
+def run_streaming(engine, coins, incremental=False, watermarks=None, kpi_state=None, granularity=GRANULARITY,
+                  queue_depth=STREAM_QUEUE_DEPTH, extract_workers=EXTRACT_MAX_WORKERS,
+                  load_batch_coins=STREAM_LOAD_BATCH_COINS, limiter=None, fetch=fetch_coin_data):
+    """
+    Ejecuta extract -> transform -> load de `coins` en streaming y devuelve un StreamResult.
+
+    En carga histórica la primera carga trunca las tablas (como el primer chunk del modo
+    por etapas) y las siguientes añaden. Si una etapa falla (también una carga), las demás
+    se detienen y la excepción se relanza aquí; lo ya cargado queda en la base.
+    """
+    stream = _Stream(queue_depth)
+    result = StreamResult()
+    max_days, interval = fetch_window(granularity)
+    days_by_coin = {coin: max_days if watermarks is None
+                    else days_since_watermark(watermarks.get(coin), max_days=max_days) for coin in coins}
+    limiter = limiter or TokenBucket()
+    pending = queue.SimpleQueue()
+    for coin in coins:
+        pending.put(coin)
+    extract_workers = max(1, min(extract_workers, len(coins)))
+    remaining_extractors = [extract_workers]
+
+    def extractor():
+        try:
+            while not stream.stop.is_set():
+                try:
+                    coin = pending.get_nowait()
+                except queue.Empty:
+                    break
+                start = time.perf_counter()
+                df = fetch(coin, days=days_by_coin[coin], limiter=limiter, interval=interval)
+                stream.track('extract', time.perf_counter() - start, delta=0 if df.empty else 1)
+                if not df.empty and not stream.put(stream.raw_q, df):
+                    return
+        except Exception as e:
+            stream.fail(e)
+        finally:
+            with stream.lock:
+                remaining_extractors[0] -= 1
+                last = remaining_extractors[0] == 0
+            if last:
+                stream.put(stream.raw_q, _DONE)
+
+    def transformer():
+        try:
+            finished = False
+            while not finished:
+                batch, finished = stream.get_batch(stream.raw_q, load_batch_coins)
+                if not batch:
+                    break
+                start = time.perf_counter()
+                raw_df = normalize_raw(pd.concat(batch, ignore_index=True))
+                final_df, state = transform_frame(raw_df, incremental, kpi_state, granularity, watermarks)
+                stream.track('transform', time.perf_counter() - start)
+                if not stream.put(stream.load_q, (final_df, state, len(batch))):
+                    return
+        except Exception as e:
+            stream.fail(e)
+        stream.put(stream.load_q, _DONE)
+
+    def loader():
+        truncate = None
+        try:
+            finished = False
+            while not finished:
+                # Los frames que ya esperan en la cola van en una sola carga
+                batch, finished = stream.get_batch(stream.load_q, load_batch_coins)
+                if not batch:
+                    break
+                frames = [df for df, _, _ in batch if not df.empty]
+                start = time.perf_counter()
+                if frames:
+                    df = normalize_raw(pd.concat(frames, ignore_index=True))
+                    # Un error de carga se propaga (ver load_data_to_supabase) y detiene las demás etapas
+                    load_data_to_supabase(df, incremental=incremental, watermarks=watermarks, engine=engine,
+                                          truncate=truncate, granularity=granularity)
+                    # Solo la primera carga de una ejecución histórica trunca
+                    truncate = False
+                    result.scopes.append(batch_scope(df))
+                    result.rows_loaded += len(df)
+                # Estado de KPIs solo de lotes cargados: los vaciados por la validación se recalculan
+                # desde el estado anterior en la próxima ejecución
+                for frame, state, _ in batch:
+                    if state is not None and not frame.empty:
+                        result.kpi_state = {**(result.kpi_state or {}), **state}
+                stream.track('load', time.perf_counter() - start, delta=-sum(n for _, _, n in batch))
+        except Exception as e:
+            stream.fail(e)
+
+    threads = [threading.Thread(target=extractor, name=f"stream-extract-{i}", daemon=True)
+               for i in range(extract_workers)]
+    threads += [threading.Thread(target=transformer, name="stream-transform", daemon=True),
+                threading.Thread(target=loader, name="stream-load", daemon=True)]
+
+    wall = time.perf_counter()
+    with stage('streaming', granularity=granularity) as m:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        m.rows_out = result.rows_loaded
+    result.wall_seconds = time.perf_counter() - wall
+    result.busy_seconds = dict(stream.busy)
+    result.max_in_flight = stream.max_in_flight
+
+    if stream.errors:
+        raise stream.errors[0]
+    busy = ', '.join(f"{name} {seconds:.1f}s" for name, seconds in result.busy_seconds.items())
+    logger.info(f"Streaming: {result.rows_loaded} filas cargadas en {result.wall_seconds:.1f}s "
+                f"(tiempo ocupado por etapa: {busy}; máx. {result.max_in_flight} monedas en vuelo)")
+    return result
@@ -1,15 +1,24 @@
 import pandas as pd
+from src.config import GRANULARITY
+from src.transform.dtypes import normalize_raw, normalize_dates
+from src.transform.granularity import bar_frequency
 
-def clean_data(df):
+def clean_data(df, granularity=GRANULARITY):
     """
     Realiza una limpieza básica en los datos crudos de criptomonedas.
+
+    Cada punto se asigna al inicio de su barra (día u hora según `granularity`) y se
+    conserva un único punto por moneda y barra.
     """
     if df.empty:
         return df
+
+    # coin_id categórico y valores en float64 (no-op si extract ya aplicó el esquema)
+    df = normalize_raw(df)
     
-    # Convertir timestamp a datetime y normalizar para eliminar el componente de tiempo (00:00:00)
-    # Esto asegura que no tengamos duplicados para el mismo día (ej. 00:00 vs hora actual)
-    df['date'] = pd.to_datetime(df['timestamp'], unit='ms').dt.normalize()
+    # Convertir timestamp a datetime y truncar al inicio de la barra (00:00:00 en modo diario)
+    # Esto asegura que no tengamos duplicados para la misma barra (ej. 00:00 vs hora actual)
+    df['date'] = normalize_dates(pd.to_datetime(df['timestamp'], unit='ms').dt.floor(bar_frequency(granularity)))
     
     # Eliminar la columna timestamp original si no se necesita.
     # Mantenemos 'date' para mejor legibilidad e indexación.
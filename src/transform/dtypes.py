@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+
+from src.config import LEAN_DTYPES, KPI_FLOAT_DTYPE
+
+# Tipos del esquema de trabajo (de fetch_coin_data a load_db) con LEAN_DTYPES activado:
+# - coin_id: category (códigos int8/int16 en vez de un string por fila)
+# - timestamp: int64 (epoch ms, tal como llega de la API)
+# - price / volume / market_cap: float64
+# - date: datetime64[s] (la resolución diaria/horaria no necesita nanosegundos)
+# - KPIs en porcentaje: KPI_FLOAT_DTYPE ('float64' o 'float32'); daily_return siempre float64
+DATE_DTYPE = 'datetime64[s]'
+VALUE_COLUMNS = ('price', 'volume', 'market_cap')
+
+
+def normalize_raw(df, enabled=LEAN_DTYPES):
+    """
+    Aplica el esquema a un frame crudo o limpio, en place (solo columnas presentes).
+    Las categorías de coin_id quedan ordenadas, así que ordenar por coin_id equivale
+    a ordenar por el texto.
+    """
+    if not enabled or df.empty:
+        return df
+    if 'coin_id' in df.columns and not isinstance(df['coin_id'].dtype, pd.CategoricalDtype):
+        df['coin_id'] = pd.Categorical(df['coin_id'])
+    if 'timestamp' in df.columns and df['timestamp'].dtype != np.int64:
+        df['timestamp'] = df['timestamp'].astype('int64')
+    for column in VALUE_COLUMNS:
+        if column in df.columns and df[column].dtype != np.float64:
+            df[column] = df[column].astype('float64')
+    return df
+
+
+def normalize_dates(dates, enabled=LEAN_DTYPES):
+    """
+    Convierte una serie de fechas a datetime64[s].
+    """
+    if not enabled:
+        return dates
+    return dates.astype(DATE_DTYPE)
+
+
+def kpi_dtype(percent, float_dtype=KPI_FLOAT_DTYPE):
+    """
+    Tipo de salida de un KPI: los porcentajes pueden guardarse en float32;
+    las fracciones (daily_return) se mantienen en float64.
+    """
+    if float_dtype not in ('float64', 'float32'):
+        raise ValueError(f"KPI_FLOAT_DTYPE no soportado: {float_dtype}. Usar 'float64' o 'float32'.")
+    return np.dtype(float_dtype) if percent else np.dtype('float64')
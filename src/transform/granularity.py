@@ -0,0 +1,29 @@
+import pandas as pd
+
+from src.config import GRANULARITY
+
+# Duración de una barra para cada granularidad soportada
+BAR_FREQUENCIES = {
+    'daily': pd.Timedelta(days=1),
+    'hourly': pd.Timedelta(hours=1),
+}
+
+
+def bar_frequency(granularity=GRANULARITY):
+    """
+    Duración de una barra (pd.Timedelta) para `granularity` ('daily' u 'hourly').
+    """
+    if granularity not in BAR_FREQUENCIES:
+        raise ValueError(f"Granularidad no soportada: {granularity}. Usar 'daily' u 'hourly'.")
+    return BAR_FREQUENCIES[granularity]
+
+
+def periods_for(window, granularity=GRANULARITY):
+    """
+    Número de barras que cubre una ventana temporal (p. ej. '7D' -> 7 diarias o 168 horarias).
+    """
+    bar = bar_frequency(granularity)
+    window = pd.Timedelta(window)
+    if window % bar:
+        raise ValueError(f"La ventana {window} no es múltiplo de la barra {granularity} ({bar}).")
+    return int(window // bar)
@@ -0,0 +1,326 @@
+import json
+import math
+import os
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from src.config import KPI_STATE_PATH, KPI_FLOAT_DTYPE, GRANULARITY
+from src.transform.dtypes import kpi_dtype
+from src.transform.granularity import bar_frequency, periods_for
+from src.transform.kpis import calculate_kpis, KPI_COLUMNS, KPI_REGISTRY
+from src.utils.logger import setup_logger
+
+logger = setup_logger("kpi_state")
+
+# Ventana más larga usada por los KPIs (pct_change a 30 días y volatilidad de 30 días de
+# retornos); en filas: 30 en modo diario, 720 en modo horario
+WINDOW = '30D'
+# Si la varianza calculada con sumas es menor que esta fracción de la suma de cuadrados,
+# hay cancelación numérica y se recalcula en dos pasadas sobre los retornos guardados.
+_CANCELLATION_RATIO = 1e-8
+
+
+def _empty_state(granularity=GRANULARITY):
+    return {
+        'granularity': granularity,
+        'last_date': None,
+        'n_rows': 0,
+        'price': [],
+        'market_cap': [],
+        'volume': [],
+        'returns': [],
+        'return_sum': 0.0,
+        'return_sumsq': 0.0,
+        'invalid_returns': 0,
+        'regular': True,
+    }
+
+
+def _as_windows(state, window):
+    """
+    Pasa el historial de la moneda (listas en el JSON) a deques acotados, una sola vez
+    por moneda: añadir una fila y descartar la más antigua es O(1). Los niveles guardan
+    una fila más que la ventana para poder rehacer la última barra (`_revert_last`).
+    """
+    if isinstance(state['returns'], deque):
+        return
+    for key in ('price', 'market_cap', 'volume'):
+        state[key] = deque(state[key][-(window + 1):], maxlen=window + 1)
+    state['returns'] = deque(state['returns'][-window:], maxlen=window)
+    # Los estados guardados antes de existir el contador no lo traen: se recuenta al convertir
+    state['invalid_returns'] = sum(r is None for r in state['returns'])
+
+
+def _revert_last(state):
+    """
+    Deshace la última fila del estado (barra re-extraída con valores revisados, p. ej.
+    la del día en curso), en O(1): la fila siguiente la sustituye.
+    """
+    for key in ('price', 'market_cap', 'volume'):
+        state[key].pop()
+    last = state['returns'].pop()
+    if last is None:
+        state['invalid_returns'] -= 1
+    else:
+        state['return_sum'] -= last
+        state['return_sumsq'] -= last * last
+    state['n_rows'] -= 1
+
+
+def _lag_change(history, value, periods):
+    """
+    x[t] / x[t - periods] - 1 usando el historial de la moneda (NaN si aún no hay `periods` filas).
+    """
+    if len(history) < periods:
+        return np.nan
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return float(np.float64(value) / np.float64(history[-periods]) - 1)
+
+
+def _volatility(state, window):
+    returns = state['returns']
+    if len(returns) < window or state['invalid_returns']:
+        return np.nan
+    total, total_sq = state['return_sum'], state['return_sumsq']
+    variance = (total_sq - total * total / window) / (window - 1)
+    if not math.isfinite(variance) or variance * (window - 1) < _CANCELLATION_RATIO * total_sq:
+        variance = float(np.var(np.asarray(returns, dtype='float64'), ddof=1))
+    return math.sqrt(max(variance, 0.0))
+
+
+def _step(state, price, market_cap, volume):
+    """
+    Avanza el estado de una moneda con una fila nueva y devuelve sus KPIs (NaN donde
+    la ventana aún está incompleta), en O(1).
+    """
+    granularity = state['granularity']
+    day, week, window = (periods_for(w, granularity) for w in ('1D', '7D', WINDOW))
+    _as_windows(state, window)
+    daily_return = _lag_change(state['price'], price, day)
+
+    returns = state['returns']
+    if len(returns) == window:
+        # El deque descarta el retorno más antiguo al añadir: se resta antes de las sumas
+        old = returns[0]
+        if old is None:
+            state['invalid_returns'] -= 1
+        else:
+            state['return_sum'] -= old
+            state['return_sumsq'] -= old * old
+    # Retorno NaN (sin historia) o infinito (precio previo 0): la ventana no tiene desviación definida
+    if math.isfinite(daily_return):
+        returns.append(daily_return)
+        state['return_sum'] += daily_return
+        state['return_sumsq'] += daily_return * daily_return
+    else:
+        returns.append(None)
+        state['invalid_returns'] += 1
+
+    kpis = {
+        'daily_return': daily_return,
+        'market_cap_change_24h': _lag_change(state['market_cap'], market_cap, day) * 100,
+        'volume_change_24h': _lag_change(state['volume'], volume, day) * 100,
+        'profitability_30d': _lag_change(state['price'], price, window) * 100,
+        'volatility_30d': _volatility(state, window) * 100,
+        'price_change_24h': daily_return * 100,
+        'price_change_7d': _lag_change(state['price'], price, week) * 100,
+        'price_change_30d': _lag_change(state['price'], price, window) * 100,
+        'market_cap_change_7d': _lag_change(state['market_cap'], market_cap, week) * 100,
+        'market_cap_change_30d': _lag_change(state['market_cap'], market_cap, window) * 100,
+        'volume_change_7d': _lag_change(state['volume'], volume, week) * 100,
+        'volume_change_30d': _lag_change(state['volume'], volume, window) * 100,
+    }
+
+    for key, value in (('price', price), ('market_cap', market_cap), ('volume', volume)):
+        state[key].append(float(value))
+    state['n_rows'] += 1
+    return kpis
+
+
+def _is_regular(dates, granularity):
+    """True si `dates` (ordenadas) son barras consecutivas de la granularidad, sin huecos."""
+    return bool((pd.Series(dates).diff().iloc[1:] == bar_frequency(granularity)).all())
+
+
+def build_kpi_state(df, granularity=GRANULARITY):
+    """
+    Construye el estado por moneda a partir del histórico limpio (salida de clean_data):
+    los últimos 30 días de precios, market caps y volúmenes (más uno, para poder rehacer
+    la última barra), los últimos 30 días de retornos a 24h y su suma y suma de cuadrados.
+    """
+    state = {}
+    if df.empty:
+        return state
+    day, window = periods_for('1D', granularity), periods_for(WINDOW, granularity)
+    df = df.sort_values(by=['coin_id', 'date'])
+    for coin, group in df.groupby('coin_id', sort=False, observed=True):
+        coin_state = _empty_state(granularity)
+        tail = group.tail(window + day + 1)
+        prices = tail['price'].to_numpy(dtype='float64')
+        # Los primeros `day` retornos de la moneda son indefinidos (igual que en calculate_kpis)
+        returns = np.full(len(prices), np.nan)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            returns[day:] = prices[day:] / prices[:-day] - 1
+        returns = [float(r) if math.isfinite(r) else None for r in returns[-window:]]
+        valid = [r for r in returns if r is not None]
+
+        coin_state.update({
+            'last_date': pd.Timestamp(group['date'].iloc[-1]).isoformat(),
+            'n_rows': int(len(group)),
+            'price': [float(v) for v in tail['price'].iloc[-(window + 1):]],
+            'market_cap': [float(v) for v in tail['market_cap'].iloc[-(window + 1):]],
+            'volume': [float(v) for v in tail['volume'].iloc[-(window + 1):]],
+            'returns': returns,
+            'return_sum': float(sum(valid)),
+            'return_sumsq': float(sum(r * r for r in valid)),
+            'invalid_returns': len(returns) - len(valid),
+            # El estado avanza por filas: solo es continuable si su historial no tiene huecos
+            'regular': _is_regular(tail['date'], granularity),
+        })
+        state[str(coin)] = coin_state
+    return state
+
+
+def update_kpis(new_df, state, granularity=GRANULARITY):
+    """
+    Calcula los KPIs de filas nuevas avanzando el estado persistido, en O(1) por moneda y día.
+
+    Solo se procesan las filas desde el `last_date` de cada moneda: la fila de `last_date`
+    (re-extraída, quizá con valores revisados) sustituye a la última del estado y las
+    anteriores se ignoran. Las monedas sin estado empiezan desde cero (equivalente a
+    calculate_kpis sobre su historia completa).
+    Devuelve un DataFrame con las mismas columnas que calculate_kpis (NaN -> 0). `state`
+    se modifica in place.
+    """
+    if new_df.empty:
+        return new_df
+
+    df = new_df.sort_values(by=['coin_id', 'date'])
+    window = periods_for(WINDOW, granularity)
+    rows = []
+    index = []
+    for idx, coin, date, price, market_cap, volume in zip(df.index, df['coin_id'], df['date'], df['price'],
+                                                          df['market_cap'], df['volume']):
+        coin_state = state.setdefault(str(coin), _empty_state(granularity))
+        if coin_state['last_date'] is not None:
+            last_date = pd.Timestamp(coin_state['last_date'])
+            if pd.Timestamp(date) < last_date:
+                continue
+            if pd.Timestamp(date) == last_date:
+                _as_windows(coin_state, window)
+                _revert_last(coin_state)
+        rows.append(_step(coin_state, price, market_cap, volume))
+        coin_state['last_date'] = pd.Timestamp(date).isoformat()
+        index.append(idx)
+
+    result = df.loc[index].copy()
+    kpis = pd.DataFrame(rows, index=index, columns=KPI_COLUMNS, dtype='float64')
+    for name in KPI_COLUMNS:
+        result[name] = kpis[name].fillna(0).astype(kpi_dtype(KPI_REGISTRY[name].percent, KPI_FLOAT_DTYPE))
+    return result
+
+
+def calculate_kpis_incremental(df, state, granularity=GRANULARITY):
+    """
+    KPIs en modo incremental para el pipeline diario.
+
+    Las monedas con estado se avanzan solo con sus filas nuevas (`update_kpis`); las
+    monedas sin estado se calculan en batch sobre `df` y se inicializa su estado.
+    Devuelve (DataFrame con KPIs, estado actualizado). El estado recibido no se modifica,
+    para poder persistir el nuevo solo si la carga termina bien.
+    """
+    state = json.loads(json.dumps(state, default=list))
+    # Un estado solo es continuable si su último día está dentro de lo extraído
+    # (la extracción incremental incluye KPI_LOOKBACK_DAYS previos); si no, hay un hueco
+    # y la moneda se recalcula en batch.
+    first_dates = df.groupby('coin_id', observed=True)['date'].min()
+    # El estado avanza por filas y los KPIs son temporales: con huecos en las filas nuevas
+    # (o en el historial del estado) la moneda se recalcula en batch
+    gapped = set()
+    for coin, dates in df.sort_values('date').groupby('coin_id', observed=True)['date']:
+        last_date = state.get(str(coin), {}).get('last_date')
+        if last_date is not None:
+            last_date = pd.Timestamp(last_date)
+            if not _is_regular([last_date] + list(dates[dates > last_date]), granularity):
+                gapped.add(str(coin))
+    # Un estado de otra granularidad tampoco es continuable, ni uno guardado sin la fila
+    # extra de historial que permite rehacer la última barra.
+    window = periods_for(WINDOW, granularity)
+    continuable = {
+        str(coin) for coin, first in first_dates.items()
+        if str(coin) in state and state[str(coin)]['last_date'] is not None
+        and state[str(coin)].get('granularity', 'daily') == granularity
+        and pd.Timestamp(state[str(coin)]['last_date']) >= pd.Timestamp(first)
+        and len(state[str(coin)]['price']) >= min(state[str(coin)]['n_rows'], window + 1)
+        and state[str(coin)].get('regular', True) and str(coin) not in gapped
+    }
+    stale = set(map(str, first_dates.index)) & set(state) - continuable
+    if stale:
+        logger.warning(f"Estado de KPIs desactualizado para {sorted(stale)}; se recalculan en batch.")
+    known = df['coin_id'].astype(str).isin(continuable)
+
+    frames = []
+    if (~known).any():
+        batch = calculate_kpis(df[~known], granularity=granularity)
+        state.update(build_kpi_state(batch, granularity))
+        frames.append(batch)
+    if known.any():
+        frames.append(update_kpis(df[known], state, granularity))
+
+    frames = [f for f in frames if not f.empty]
+    if not frames:
+        return df.iloc[0:0], state
+    result = pd.concat(frames).sort_values(by=['coin_id', 'date'])
+    return result, state
+
+
+def state_history(state):
+    """
+    Barras guardadas en el estado (precio, market cap y volumen de la ventana) como
+    frame con coin_id y date, p. ej. como historia de `validate_batch(context=...)`
+    cuando el lote incremental solo trae las barras nuevas. Solo las monedas con
+    historial regular: en las demás no se conoce la fecha de cada barra.
+    """
+    frames = []
+    for coin, coin_state in (state or {}).items():
+        if not coin_state.get('last_date') or not coin_state.get('regular', True):
+            continue
+        n = len(coin_state['price'])
+        frames.append(pd.DataFrame({
+            'coin_id': coin,
+            'date': pd.date_range(end=pd.Timestamp(coin_state['last_date']), periods=n,
+                                  freq=bar_frequency(coin_state['granularity'])),
+            'price': list(coin_state['price']),
+            'volume': list(coin_state['volume']),
+            'market_cap': list(coin_state['market_cap']),
+        }))
+    if not frames:
+        return pd.DataFrame(columns=['coin_id', 'date', 'price', 'volume', 'market_cap'])
+    return pd.concat(frames, ignore_index=True)
+
+
+def load_kpi_state(path=KPI_STATE_PATH):
+    """
+    Lee el estado persistido ({coin: estado}); vacío si no existe.
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_kpi_state(state, path=KPI_STATE_PATH):
+    """
+    Guarda el estado de forma atómica (archivo temporal + rename).
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        # Los deques del historial se guardan como listas
+        json.dump(state, f, default=list)
+    os.replace(tmp_path, path)
+    logger.info(f"Estado de KPIs guardado para {len(state)} monedas en {path}")
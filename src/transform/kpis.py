@@ -1,52 +1,321 @@
 import pandas as pd
 import numpy as np
+from dataclasses import dataclass
+from typing import Callable
+from pandas.api.indexers import BaseIndexer
+from src.config import KPI_FLOAT_DTYPE, GRANULARITY
+from src.transform.dtypes import kpi_dtype
+from src.transform.granularity import bar_frequency, periods_for
 
-def calculate_kpis(df):
+# Cota de las ventanas admitidas (ver _KPIContext._time_keys)
+_MAX_WINDOW_SECONDS = int(pd.Timedelta('3650D').total_seconds())
+
+def _segment_positions(coin_ids):
+    """
+    Posición de cada fila dentro del bloque contiguo de su moneda (0, 1, 2, ...).
+    Requiere que las filas estén ordenadas por moneda.
+    """
+    codes, _ = pd.factorize(coin_ids)
+    n = len(codes)
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]]) if n else np.array([], dtype=np.intp)
+    lengths = np.diff(np.r_[starts, n])
+    return np.arange(n) - np.repeat(starts, lengths)
+
+def _pct_change(values, lag):
+    """
+    x[t] / x[lag[t]] - 1, con NaN donde no hay barra de referencia (`lag` = -1: inicio
+    de la moneda o hueco en la serie).
+    """
+    out = np.full(len(values), np.nan)
+    found = lag >= 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out[found] = values[found] / values[lag[found]] - 1
+    return out
+
+class _TimeWindows(BaseIndexer):
+    """Ventanas móviles con límites precalculados (`start`, `end` por fila)."""
+
+    def get_window_bounds(self, num_values=0, min_periods=None, center=None, closed=None, step=None):
+        return self.start, self.end
+
+def _rolling_std(values, starts):
+    """
+    Desviación estándar (ddof=1) de `values` en las filas [starts[t], t] de cada fila,
+    ignorando los NaN (retornos sin barra de referencia por un hueco).
+    """
+    indexer = _TimeWindows(start=starts.astype(np.int64), end=np.arange(1, len(values) + 1, dtype=np.int64))
+    return pd.Series(values).rolling(indexer, min_periods=2).std(ddof=1).to_numpy(dtype='float64', copy=True)
+
+def _percent(values):
+    values *= 100
+    return values
+
+@dataclass(frozen=True)
+class KPIDefinition:
+    """
+    Métrica declarativa del registro.
+
+    - `inputs`: columnas del DataFrame limpio que lee.
+    - `window`: ventana temporal (pd.Timedelta) que cubre sobre sus entradas; se resuelve
+      sobre `date` (ver `_KPIContext.lag_index` y `window_starts`).
+    - `depends`: KPIs cuyos arrays recibe `compute` como argumentos con nombre.
+    - `compute(ctx, **deps)`: devuelve un array float64 nuevo (NaN donde la ventana no alcanza).
+    - `percent`: el resultado es un porcentaje (admite KPI_FLOAT_DTYPE='float32' en la salida).
+    - `rolling`: la ventana incluye la fila actual (agregado móvil) en lugar de ser un lag.
+    """
+    name: str
+    inputs: tuple
+    window: pd.Timedelta
+    depends: tuple
+    compute: Callable
+    percent: bool = True
+    rolling: bool = False
+
+# Registro de KPIs disponibles, en el orden en que calculate_kpis los añade por defecto
+KPI_REGISTRY = {}
+
+def register_kpi(name, inputs=(), window='0D', depends=(), percent=True, rolling=False):
+    """
+    Decorador para registrar un KPI. Permite añadir métricas desde otros módulos
+    (o notebooks) sin tocar calculate_kpis. `window` es una duración ('7D', '24h', ...).
+    """
+    if pd.Timedelta(window) > pd.Timedelta(seconds=_MAX_WINDOW_SECONDS):
+        raise ValueError(f"Ventana demasiado larga para el KPI {name}: {window} (máximo 3650D)")
+
+    def decorator(compute):
+        KPI_REGISTRY[name] = KPIDefinition(name, tuple(inputs), pd.Timedelta(window), tuple(depends), compute,
+                                           percent, rolling)
+        return compute
+    return decorator
+
+def _register_pct_change(name, column, window):
+    register_kpi(name, inputs=(column,), window=window)(
+        lambda ctx: _percent(_pct_change(ctx.column(column), ctx.lag_index(window)))
+    )
+
+class _KPIContext:
+    """
+    Datos compartidos durante una evaluación: posiciones por moneda, granularidad,
+    claves temporales y columnas de entrada convertidas a float64 una sola vez.
+
+    Las ventanas se resuelven sobre `date`, no sobre el número de filas: si faltan
+    barras (huecos habituales en los datos horarios de CoinGecko), un lag de 24h
+    compara con la barra de hace 24h o queda indefinido, nunca con otra más antigua.
+    """
+
+    def __init__(self, df, granularity=GRANULARITY):
+        self.df = df
+        self.granularity = granularity
+        self.bar_seconds = int(bar_frequency(granularity).total_seconds())
+        # factorize sobre la Serie usa los códigos si coin_id es categórico
+        self.positions = _segment_positions(df['coin_id'])
+        self._columns = {}
+        self._keys = None
+        self._lags = {}
+
+    def periods(self, window):
+        """
+        Filas que cubre una ventana temporal con la granularidad actual si no hubiera huecos.
+        """
+        return periods_for(window, self.granularity)
+
+    def seconds(self):
+        """Segundos de `date` de cada fila."""
+        return self.df['date'].to_numpy(dtype='datetime64[s]').astype(np.int64)
+
+    def _time_keys(self):
+        # Segundos desde el inicio de los datos más un desplazamiento por moneda mayor que
+        # el rango de fechas más cualquier ventana: una sola búsqueda ordenada sirve para
+        # todas las monedas y ninguna ventana alcanza a la moneda anterior
+        if self._keys is None:
+            seconds = self.seconds()
+            codes, _ = pd.factorize(self.df['coin_id'])
+            relative = seconds - seconds.min()
+            span = int(relative.max()) + _MAX_WINDOW_SECONDS
+            self._keys = codes.astype(np.int64) * span + relative
+        return self._keys
+
+    def lag_index(self, window):
+        """
+        Fila de la misma moneda con `date` exactamente `window` antes; -1 si no existe.
+        """
+        window = pd.Timedelta(window)
+        if window not in self._lags:
+            keys = self._time_keys()
+            target = keys - int(window.total_seconds())
+            idx = np.minimum(np.searchsorted(keys, target), len(keys) - 1)
+            self._lags[window] = np.where(keys[idx] == target, idx, -1)
+        return self._lags[window]
+
+    def window_starts(self, window):
+        """
+        Primera fila de la misma moneda dentro de (date - window, date].
+        """
+        keys = self._time_keys()
+        return np.searchsorted(keys, keys - int(pd.Timedelta(window).total_seconds()), side='right')
+
+    def elapsed(self):
+        """
+        Segundos desde la primera barra de la moneda hasta cada fila.
+        """
+        seconds = self.seconds()
+        return seconds - seconds[np.arange(len(seconds)) - self.positions]
+
+    def column(self, name):
+        if name not in self._columns:
+            self._columns[name] = self.df[name].to_numpy(dtype='float64')
+        return self._columns[name]
+
+# Calcular retornos diarios (cambio porcentual en precio respecto a 24h antes)
+register_kpi('daily_return', inputs=('price',), window='1D', percent=False)(
+    lambda ctx: _pct_change(ctx.column('price'), ctx.lag_index('1D'))
+)
+# KPI 1: Cambios en Market Cap y Volumen
+_register_pct_change('market_cap_change_24h', 'market_cap', '1D')
+_register_pct_change('volume_change_24h', 'volume', '1D')
+# KPI 2: Rentabilidad Mensual (Aprox 30 días): cambio porcentual comparado con hace 30 días
+_register_pct_change('profitability_30d', 'price', '30D')
+
+# KPI 3: Volatilidad: desviación estándar de los retornos diarios sobre una ventana
+# móvil de 30 días. Esto da una medida de la volatilidad para el mes anterior
+# (en modo horario: los retornos a 24h de las barras de las últimas 720 horas).
+# Solo se define cuando la ventana completa cae después del primer retorno de la
+# moneda; dentro de ella, los retornos indefinidos por huecos se ignoran.
+@register_kpi('volatility_30d', window='30D', depends=('daily_return',), rolling=True)
+def _volatility_30d(ctx, daily_return):
+    volatility = _rolling_std(daily_return, ctx.window_starts('30D'))
+    first_return = int(pd.Timedelta('1D').total_seconds())
+    volatility[ctx.elapsed() < int(pd.Timedelta('30D').total_seconds()) + first_return - ctx.bar_seconds] = np.nan
+    return _percent(volatility)
+
+# Métricas adicionales útiles del script original: price/market_cap/volume a 24h, 7d y 30d
+@register_kpi('price_change_24h', depends=('daily_return',))
+def _price_change_24h(ctx, daily_return):
+    return daily_return * 100
+
+_register_pct_change('price_change_7d', 'price', '7D')
+_register_pct_change('price_change_30d', 'price', '30D')
+_register_pct_change('market_cap_change_7d', 'market_cap', '7D')
+_register_pct_change('market_cap_change_30d', 'market_cap', '30D')
+_register_pct_change('volume_change_7d', 'volume', '7D')
+_register_pct_change('volume_change_30d', 'volume', '30D')
+
+# Columnas que añade calculate_kpis por defecto, en orden
+KPI_COLUMNS = list(KPI_REGISTRY)
+
+def resolve_kpis(columns=None):
+    """
+    Devuelve los KPIs necesarios para `columns` (incluidas dependencias) en orden de
+    evaluación: cada métrica aparece después de todas de las que depende.
+    """
+    columns = KPI_COLUMNS if columns is None else list(columns)
+    order = []
+    visiting = set()
+
+    def visit(name):
+        if name in order:
+            return
+        if name not in KPI_REGISTRY:
+            raise ValueError(f"KPI desconocido: {name}")
+        if name in visiting:
+            raise ValueError(f"Dependencia circular en el KPI: {name}")
+        visiting.add(name)
+        for dependency in KPI_REGISTRY[name].depends:
+            visit(dependency)
+        visiting.discard(name)
+        order.append(name)
+
+    for name in columns:
+        visit(name)
+    return order
+
+def kpi_lookback(columns=None, granularity=GRANULARITY):
+    """
+    Filas previas por moneda que necesitan `columns` (ventana propia más la de sus
+    dependencias) con la granularidad dada.
+    """
+    lookback = {}
+    for name in resolve_kpis(columns):
+        kpi = KPI_REGISTRY[name]
+        own = periods_for(kpi.window, granularity) - (1 if kpi.rolling else 0)
+        lookback[name] = max(own, 0) + max((lookback[d] for d in kpi.depends), default=0)
+    columns = KPI_COLUMNS if columns is None else columns
+    return max((lookback[name] for name in columns), default=0)
+
+def calculate_kpis(df, columns=None, float_dtype=None, granularity=GRANULARITY):
     """
     Calcula KPIs y los añade como columnas al DataFrame.
-    
+
     KPIs:
     1. Tendencias de Capitalización de Mercado (vía market_cap_change)
     2. Rentabilidad Mensual (profitability_30d)
     3. Volatilidad Mensual (volatility_30d)
+
+    `columns` elige qué KPIs del registro añadir (por defecto todos, KPI_COLUMNS). Solo
+    se evalúan esos y sus dependencias, en orden, compartiendo intermedios como
+    `daily_return`; los intermedios no pedidos no se añaden al resultado.
+    Los cálculos se hacen en float64; `float_dtype` (por defecto KPI_FLOAT_DTYPE) fija
+    el tipo de salida de los KPIs en porcentaje.
+    Las ventanas son temporales (24h, 7d, 30d) y se resuelven sobre `date` con la
+    barra de `granularity` ('daily' u 'hourly'): con huecos en la serie, un cambio cuya
+    barra de referencia falta queda indefinido y la volatilidad usa los retornos que
+    caen dentro de los 30 días.
+
+    Se ordena una sola vez y todas las métricas se calculan sobre arrays NumPy
+    contiguos, enmascarando los límites entre monedas, en lugar de un groupby por
+    cada columna y periodo.
     """
     if df.empty:
         return df
 
+    columns = KPI_COLUMNS if columns is None else list(columns)
+    order = resolve_kpis(columns)
+    missing = {c for name in order for c in KPI_REGISTRY[name].inputs} - set(df.columns)
+    if missing:
+        raise ValueError(f"Faltan columnas de entrada para los KPIs: {sorted(missing)}")
+
     # Asegurar que los datos estén ordenados
     df = df.sort_values(by=['coin_id', 'date'])
-    
-    # Calcular retornos diarios (cambio porcentual en precio)
-    df['daily_return'] = df.groupby('coin_id')['price'].pct_change()
-    
-    # KPI 1: Cambios en Market Cap y Volumen
-    df['market_cap_change_24h'] = df.groupby('coin_id')['market_cap'].pct_change(periods=1) * 100
-    df['volume_change_24h'] = df.groupby('coin_id')['volume'].pct_change(periods=1) * 100
-    
-    # KPI 2: Rentabilidad Mensual (Aprox 30 días)
-    # Calculamos el cambio porcentual comparado con hace 30 días
-    df['profitability_30d'] = df.groupby('coin_id')['price'].pct_change(periods=30) * 100
-    
-    # KPI 3: Volatilidad
-    # Desviación estándar de los retornos diarios sobre una ventana móvil de 30 días
-    # Esto da una medida de la volatilidad para el mes anterior
-    df['volatility_30d'] = df.groupby('coin_id')['daily_return'].rolling(window=30).std().reset_index(0, drop=True) * 100
-    
-    # Métricas adicionales útiles del script original
-    df['price_change_24h'] = df.groupby('coin_id')['price'].pct_change(periods=1) * 100
-    df['price_change_7d'] = df.groupby('coin_id')['price'].pct_change(periods=7) * 100
-    df['price_change_30d'] = df.groupby('coin_id')['price'].pct_change(periods=30) * 100
-
-    df['market_cap_change_7d'] = df.groupby('coin_id')['market_cap'].pct_change(periods=7) * 100
-    df['market_cap_change_30d'] = df.groupby('coin_id')['market_cap'].pct_change(periods=30) * 100
-
-    df['volume_change_7d'] = df.groupby('coin_id')['volume'].pct_change(periods=7) * 100
-    df['volume_change_30d'] = df.groupby('coin_id')['volume'].pct_change(periods=30) * 100
-    
+    ctx = _KPIContext(df, granularity)
+
+    # Último KPI que consume cada intermedio: a partir de ahí se puede liberar o rellenar
+    last_use = {}
+    for name in order:
+        for dependency in KPI_REGISTRY[name].depends:
+            last_use[dependency] = name
+
     # Llenar NaNs generados por pct_change (las primeras filas serán NaN)
     # Podemos llenar con 0 o dejar como NaN. Dejar como NaN es más seguro para análisis,
     # pero para carga SQL, podríamos querer manejarlos.
     # Llenemos con 0 para los primeros registros donde el cambio es indefinido.
-    df = df.fillna(0)
-    
+    # Cada array se rellena cuando ya ningún KPI pendiente necesita sus NaN
+    # (p. ej. daily_return después de volatility_30d), sin copiar el DataFrame completo.
+    values = {}
+    outputs = {}
+
+    def release(name):
+        array = values.pop(name)
+        if name in columns:
+            array[np.isnan(array)] = 0
+            outputs[name] = array
+
+    for name in order:
+        kpi = KPI_REGISTRY[name]
+        values[name] = kpi.compute(ctx, **{d: values[d] for d in kpi.depends})
+        for dependency in kpi.depends:
+            if last_use[dependency] == name:
+                release(dependency)
+        if name not in last_use:
+            release(name)
+
+    for name in columns:
+        dtype = kpi_dtype(KPI_REGISTRY[name].percent, float_dtype or KPI_FLOAT_DTYPE)
+        df[name] = outputs[name].astype(dtype, copy=False)
+
+    # Columnas de entrada con NaN (clean_data normalmente ya los elimina); se revisan y
+    # rellenan columna a columna en vez de copiar el DataFrame completo con fillna
+    for column in df.columns.difference(columns):
+        if pd.api.types.is_float_dtype(df[column]) and df[column].hasnans:
+            df[column] = df[column].fillna(0)
+
     return df
@@ -0,0 +1,147 @@
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from src.config import TRANSFORM_MAX_WORKERS
+from src.transform.clean import clean_data
+from src.transform.dtypes import normalize_raw
+from src.transform.kpis import calculate_kpis
+from src.utils.logger import setup_logger
+
+logger = setup_logger("transform_parallel")
+
+# Particiones por worker: más de una para repartir mejor monedas de distinto tamaño
+_PARTITIONS_PER_WORKER = 4
+
+
+def _write_shared(table):
+    """
+    Serializa `table` como stream Arrow IPC directamente en un bloque de memoria compartida.
+    Devuelve (nombre del bloque, tamaño en bytes).
+    """
+    sink = pa.MockOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    size = sink.size()
+
+    shm = shared_memory.SharedMemory(create=True, size=max(1, size))
+    try:
+        buffer = pa.py_buffer(shm.buf)
+        sink = pa.FixedSizeBufferWriter(buffer)
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        sink.close()
+        # Soltar las vistas de Arrow sobre el bloque antes de cerrarlo
+        del writer, sink, buffer
+    finally:
+        shm.close()
+    return shm.name, size
+
+
+def _detach_strings(table):
+    """
+    Copia las columnas de texto y categóricas a memoria propia del proceso: pandas
+    envuelve esos buffers Arrow sin copiarlos, lo que impediría cerrar el bloque compartido.
+    """
+    for i, field in enumerate(table.schema):
+        if pa.types.is_string(field.type) or pa.types.is_large_string(field.type) or \
+                pa.types.is_dictionary(field.type):
+            table = table.set_column(i, field, pa.chunked_array([pa.concat_arrays(table.column(i).chunks)],
+                                                                type=field.type))
+    return table
+
+
+def _read_shared(name, size):
+    """
+    Lee un bloque escrito por `_write_shared` como DataFrame. La tabla Arrow se lee sin
+    copiar desde la memoria compartida; solo `to_pandas` materializa los datos.
+    """
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        buffer = pa.py_buffer(shm.buf)
+        reader = pa.ipc.open_stream(buffer[:size])
+        table = _detach_strings(reader.read_all())
+        # to_pandas copia los numéricos a bloques de pandas; nada queda apuntando al bloque compartido
+        df = table.to_pandas()
+        del reader, table, buffer
+    finally:
+        shm.close()
+    return df
+
+
+def _transform_partition(name, size, columns):
+    """
+    Worker: limpia y calcula KPIs de un grupo de monedas y deja el resultado en memoria compartida.
+    """
+    raw = _read_shared(name, size)
+    result = calculate_kpis(clean_data(raw), columns=columns)
+    return _write_shared(pa.Table.from_pandas(result, preserve_index=False))
+
+
+def _partition_bounds(row_counts, n_partitions):
+    """
+    Corta la secuencia de monedas (en orden) en `n_partitions` tramos contiguos con un
+    número de filas similar. Devuelve los índices de moneda donde empieza cada tramo.
+    """
+    cumulative = np.cumsum(row_counts)
+    targets = cumulative[-1] * np.arange(1, n_partitions) / n_partitions
+    cuts = np.searchsorted(cumulative, targets, side='left') + 1
+    return np.unique(np.r_[0, cuts[cuts < len(row_counts)]])
+
+
+def transform_parallel(raw_df, max_workers=TRANSFORM_MAX_WORKERS, columns=None):
+    """
+    `clean_data` + `calculate_kpis` repartidos por moneda en un ProcessPoolExecutor.
+
+    Las monedas se ordenan y se agrupan en particiones contiguas de tamaño similar; cada
+    partición viaja al worker como stream Arrow IPC en memoria compartida (no como
+    DataFrame pickleado) y el resultado vuelve por el mismo medio. Las particiones se
+    concatenan en orden, así que el resultado coincide con la versión secuencial
+    (ordenado por moneda y fecha, con índice 0..n-1).
+    """
+    if raw_df.empty:
+        return raw_df
+    if max_workers <= 1:
+        return calculate_kpis(clean_data(raw_df), columns=columns).reset_index(drop=True)
+
+    # Agrupar filas por moneda (orden estable dentro de cada moneda, igual que clean_data)
+    codes, coins = pd.factorize(raw_df['coin_id'], sort=True)
+    order = np.argsort(codes, kind='stable')
+    table = pa.Table.from_pandas(raw_df, preserve_index=False).take(order)
+    row_counts = np.bincount(codes, minlength=len(coins))
+    row_offsets = np.r_[0, np.cumsum(row_counts)]
+
+    n_partitions = min(len(coins), max_workers * _PARTITIONS_PER_WORKER)
+    bounds = _partition_bounds(row_counts, n_partitions)
+    starts = row_offsets[bounds]
+    stops = np.r_[starts[1:], len(raw_df)]
+
+    inputs = []
+    results = []
+    try:
+        for start, stop in zip(starts, stops):
+            inputs.append(_write_shared(table.slice(start, stop - start)))
+        del table
+
+        logger.info(f"Transformando {len(coins)} monedas en {len(inputs)} particiones con {max_workers} procesos...")
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(_transform_partition, name, size, columns) for name, size in inputs]
+            # Recoger en orden de partición para conservar el orden por moneda
+            for future in futures:
+                results.append(future.result())
+
+        frames = [_read_shared(name, size) for name, size in results]
+    finally:
+        for name, _ in inputs + results:
+            try:
+                shm = shared_memory.SharedMemory(name=name)
+                shm.close()
+                shm.unlink()
+            except FileNotFoundError:
+                pass
+
+    # Las particiones comparten categorías de coin_id, así que concat las conserva
+    return normalize_raw(pd.concat(frames, ignore_index=True))
@@ -0,0 +1,244 @@
+import os
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from src.config import (GRANULARITY, QUARANTINE_DIR, VALIDATION_MODE, VALIDATION_STALE_BARS,
+                        VALIDATION_ZSCORE, WRITE_MODE)
+from src.load.load_db import filter_new_data
+from src.transform.granularity import bar_frequency
+from src.utils.logger import setup_logger
+
+logger = setup_logger("validate")
+
+VALIDATION_MODES = ('quarantine', 'reject', 'off')
+# Problemas por fila, en orden de prioridad (una fila en cuarentena lleva el primero que cumple)
+ROW_ISSUES = ('null_key', 'null_value', 'non_positive', 'duplicate', 'price_outlier', 'volume_outlier')
+# Escala mínima de los retornos logarítmicos (0.1%): evita z-scores infinitos en monedas
+# casi constantes (stablecoins)
+_MIN_SCALE = 1e-3
+
+
+@dataclass
+class ValidationReport:
+    """
+    Resumen compacto de la validación de un lote: filas por problema (`issues`), huecos
+    entre barras, filas fuera de orden y monedas sin datos recientes. Solo los problemas
+    de `issues` sacan filas del lote; el resto son avisos.
+    """
+    rows: int
+    valid_rows: int
+    issues: dict = field(default_factory=dict)
+    gaps: int = 0
+    missing_bars: int = 0
+    unordered_rows: int = 0
+    stale_coins: list = field(default_factory=list)
+    seconds: float = 0.0
+    quarantine_path: str = None
+
+    @property
+    def quarantined(self):
+        return self.rows - self.valid_rows
+
+    @property
+    def clean(self):
+        return self.quarantined == 0
+
+    def to_dict(self):
+        return {
+            'rows': self.rows, 'valid_rows': self.valid_rows, 'quarantined': self.quarantined,
+            'issues': {k: v for k, v in self.issues.items() if v},
+            'gaps': self.gaps, 'missing_bars': self.missing_bars, 'unordered_rows': self.unordered_rows,
+            'stale_coins': self.stale_coins, 'seconds': round(self.seconds, 4),
+            'quarantine_path': self.quarantine_path,
+        }
+
+    def log(self):
+        issues = ', '.join(f"{k}={v}" for k, v in self.issues.items() if v) or 'ninguno'
+        log = logger.info if self.clean else logger.warning
+        log(f"Validación: {self.valid_rows}/{self.rows} filas válidas ({self.seconds * 1000:.1f} ms). "
+            f"Problemas: {issues}")
+        if self.gaps:
+            logger.warning(f"{self.gaps} huecos entre barras ({self.missing_bars} barras faltantes)")
+        if self.unordered_rows:
+            logger.warning(f"{self.unordered_rows} filas fuera de orden por moneda (lote reordenado)")
+        if self.stale_coins:
+            logger.warning(f"Monedas sin datos recientes: {', '.join(self.stale_coins)}")
+
+
+def _spikes(values, coins, zscore):
+    """
+    Filas aisladas anómalas: el retorno logarítmico de entrada y el de salida tienen
+    z-score robusto (mediana/MAD por moneda) por encima de `zscore` y signos opuestos,
+    es decir, un pico que revierte (tick erróneo). Un cambio de nivel sostenido no se
+    marca. La última barra de cada moneda aún no tiene retorno de salida: se puntúa
+    solo con el de entrada frente a la MAD de las barras anteriores.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_values = np.log(values.where(values > 0))
+    grouped = log_values.groupby(coins, observed=True)
+    returns = grouped.diff()
+    by_coin = returns.groupby(coins, observed=True)
+    median = by_coin.transform('median')
+    mad = (returns - median).abs().groupby(coins, observed=True).transform('median')
+    z = 0.6745 * (returns - median) / mad.clip(lower=_MIN_SCALE)
+    z_out = z.groupby(coins, observed=True).shift(-1)
+    reverting = (z.abs() > zscore) & (z_out.abs() > zscore) & (np.sign(z) != np.sign(z_out))
+    trailing = ~coins.duplicated(keep='last') & (z.abs() > zscore)
+    return (reverting | trailing).to_numpy()
+
+
+def _outliers(df, zscore, context=None):
+    """
+    Máscaras de picos de precio y volumen de las filas de `df`. Las filas de `context`
+    (barras anteriores de las mismas monedas, ya cargadas) solo aportan historia: el
+    retorno de entrada de la primera fila del lote y la MAD de cada moneda.
+    """
+    series = df[['coin_id', 'date', 'price', 'volume']].assign(_row=np.arange(len(df)))
+    if context is not None and not context.empty:
+        context = context[context['coin_id'].isin(df['coin_id'].unique())]
+        keys = pd.MultiIndex.from_frame(df[['coin_id', 'date']].astype({'coin_id': str}))
+        known = pd.MultiIndex.from_frame(context[['coin_id', 'date']].astype({'coin_id': str}))
+        context = context[~known.isin(keys)][['coin_id', 'date', 'price', 'volume']].assign(_row=-1)
+        series = pd.concat([context.astype({'coin_id': str}), series.astype({'coin_id': str})],
+                           ignore_index=True).sort_values(['coin_id', 'date'], kind='stable', ignore_index=True)
+    rows = series['_row'].to_numpy()
+    batch = rows >= 0
+    masks = {}
+    for name, column in (('price_outlier', 'price'), ('volume_outlier', 'volume')):
+        mask = np.zeros(len(df), dtype=bool)
+        mask[rows[batch]] = _spikes(series[column], series['coin_id'], zscore)[batch]
+        masks[name] = mask
+    return masks
+
+
+def row_issues(df, zscore=VALIDATION_ZSCORE, context=None):
+    """
+    Máscaras booleanas (una por problema de ROW_ISSUES) sobre las filas de `df`, que
+    debe estar ordenado por moneda y fecha. `context`: ver `_outliers`.
+    """
+    coins = df['coin_id']
+    return {
+        'null_key': (coins.isna() | df['date'].isna() | df['price'].isna()).to_numpy(),
+        'null_value': (df['volume'].isna() | df['market_cap'].isna()).to_numpy(),
+        'non_positive': ((df['price'] <= 0) | (df['volume'] < 0) | (df['market_cap'] < 0)).to_numpy(),
+        'duplicate': df.duplicated(['coin_id', 'date'], keep='first').to_numpy(),
+        **_outliers(df, zscore, context),
+    }
+
+
+def split_nulls(df):
+    """
+    Aparta las filas con NULLs de un frame crudo (con `timestamp`) o de barras (con
+    `date`) antes de clean_data, que las descarta, y de calculate_kpis, que las rellena
+    con 0. Devuelve (df sin esas filas, filas apartadas con la columna `reason`) para
+    pasarlas a `validate_batch(nulls=...)`.
+    """
+    key = 'date' if 'date' in df.columns else 'timestamp'
+    null_key = df['coin_id'].isna() | df[key].isna() | df['price'].isna()
+    bad = null_key | df['volume'].isna() | df['market_cap'].isna()
+    nulls = df[bad].assign(reason=np.where(null_key[bad], 'null_key', 'null_value'))
+    if key == 'timestamp':
+        nulls['date'] = pd.to_datetime(nulls['timestamp'], unit='ms')
+    return (df[~bad] if bad.any() else df), nulls
+
+
+def _write_quarantine(rejected, granularity, quarantine_dir):
+    os.makedirs(quarantine_dir, exist_ok=True)
+    path = os.path.join(quarantine_dir, f"{granularity}_{datetime.now():%Y%m%dT%H%M%S%f}.parquet")
+    rejected.assign(coin_id=rejected['coin_id'].astype(str)).to_parquet(path, index=False)
+    return path
+
+
+def validate_batch(df, granularity=GRANULARITY, mode=VALIDATION_MODE, zscore=VALIDATION_ZSCORE,
+                   stale_bars=VALIDATION_STALE_BARS, quarantine_dir=QUARANTINE_DIR, watermarks=None,
+                   context=None, nulls=None):
+    """
+    Valida en memoria un lote ya transformado (salida de calculate_kpis, con coin_id,
+    date, price, volume, market_cap) antes de cargarlo, y devuelve (df_válido, report).
+
+    - Por fila: NULLs, valores no positivos, claves (coin, fecha) duplicadas y picos
+      anómalos de precio o volumen (ver `_spikes`).
+    - Por moneda (solo aviso): fechas no monótonas (el lote se reordena), huecos entre
+      barras consecutivas y monedas cuya última barra queda más de `stale_bars` barras
+      por detrás de la más reciente del lote.
+
+    Solo se validan (y se devuelven) las filas que se van a cargar: con `watermarks`
+    ({coin: fecha}, como en la carga incremental) las filas ya cargadas del lookback
+    pasan a ser contexto. `context` añade barras anteriores (p. ej. la historia del
+    estado de KPIs) que, como esas, solo sirven de historia para los picos. `nulls`
+    son las filas apartadas por `split_nulls` antes de limpiar el lote crudo.
+
+    Con `mode='quarantine'` las filas con problemas se apartan a un Parquet en
+    `quarantine_dir` (con la columna `reason`) y el resto sigue a la carga; con
+    `'reject'` cualquier fila con problemas lanza ValueError sin tocar la base; con
+    `'off'` no se valida. Los KPIs de las filas vecinas a una fila apartada ya se
+    calcularon con ella; la fila se podrá recuperar en un backfill.
+    """
+    if mode not in VALIDATION_MODES:
+        raise ValueError(f"VALIDATION_MODE no soportado: {mode}. Opciones: {VALIDATION_MODES}")
+    if watermarks is not None:
+        loaded = df
+        df = filter_new_data(df, watermarks, inclusive=WRITE_MODE == 'upsert')
+        context = loaded if context is None else pd.concat([context, loaded], ignore_index=True)
+    nulls = nulls if nulls is not None and not nulls.empty else None
+    if mode == 'off' or (df.empty and nulls is None):
+        return df, ValidationReport(rows=len(df), valid_rows=len(df))
+
+    start = time.perf_counter()
+    unordered = 0
+    gap_bars = pd.Series(dtype='float64')
+    stale = pd.Series(dtype='object')
+    masks = {name: np.zeros(len(df), dtype=bool) for name in ROW_ISSUES}
+    if not df.empty:
+        coins = df['coin_id']
+        step = pd.Timedelta(bar_frequency(granularity))
+
+        # Orden por moneda y fecha: las demás comprobaciones comparan filas consecutivas
+        deltas = df['date'].groupby(coins, observed=True).diff()
+        unordered = int((deltas < pd.Timedelta(0)).sum())
+        if unordered:
+            df = df.sort_values(['coin_id', 'date'], kind='stable')
+            coins = df['coin_id']
+            deltas = df['date'].groupby(coins, observed=True).diff()
+
+        gap_bars = (deltas / step).where(deltas > step)
+        last_dates = df['date'].groupby(coins, observed=True).max()
+        stale = last_dates[last_dates < last_dates.max() - stale_bars * step]
+        masks = row_issues(df, zscore, context)
+
+    bad = np.logical_or.reduce(list(masks.values()))
+    issues = {name: int(mask.sum()) for name, mask in masks.items()}
+    if nulls is not None:
+        for reason, count in nulls['reason'].value_counts().items():
+            issues[reason] += int(count)
+    report = ValidationReport(
+        rows=len(df) + (0 if nulls is None else len(nulls)),
+        valid_rows=int((~bad).sum()),
+        issues=issues,
+        gaps=int(gap_bars.notna().sum()),
+        missing_bars=int((gap_bars - 1).sum()),
+        unordered_rows=unordered,
+        stale_coins=sorted(str(c) for c in stale.index),
+    )
+
+    if not report.clean:
+        if mode == 'reject':
+            report.seconds = time.perf_counter() - start
+            report.log()
+            raise ValueError(f"Lote rechazado por la validación previa a la carga: {report.to_dict()['issues']}")
+        reasons = np.select(list(masks.values()), list(masks), default='')
+        rejected = df[bad].assign(reason=reasons[bad])
+        if nulls is not None:
+            rejected = pd.concat([nulls.astype({'coin_id': str}), rejected.astype({'coin_id': str})],
+                                 ignore_index=True)
+        report.quarantine_path = _write_quarantine(rejected, granularity, quarantine_dir)
+        df = df[~bad]
+
+    report.seconds = time.perf_counter() - start
+    report.log()
+    if report.quarantine_path:
+        logger.warning(f"{report.quarantined} filas en cuarentena: {report.quarantine_path}")
+    return df, report
@@ -0,0 +1,127 @@
+import os
+import re
+import shutil
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+from pyarrow import fs
+
+from src.config import INTERMEDIATE_DIR, INTERMEDIATE_FORMAT
+from src.transform.dtypes import normalize_raw
+from src.utils.logger import setup_logger
+
+logger = setup_logger("intermediate_store")
+
+# Layout hive: un directorio por moneda (coin_id=bitcoin/part-0.arrow). Dentro de cada
+# moneda las filas van ordenadas por fecha en row groups de ROW_GROUP_SIZE filas, así que
+# los filtros de fecha descartan row groups por sus estadísticas min/max sin leerlos.
+# (Particionar además por año multiplicaba los fragmentos y hacía la lectura ~5x más lenta.)
+ROW_GROUP_SIZE = 64 * 1024
+_FORMATS = {'parquet': 'parquet', 'arrow': 'ipc'}
+
+
+class IntermediateStore:
+    """
+    Almacén columnar para pasar DataFrames entre tareas (extract -> transform -> load).
+
+    Cada ejecución escribe en su propio directorio (`base_dir/<run_id>`), así que
+    ejecuciones concurrentes y backfills no se pisan. Cada dataset se guarda en
+    Arrow IPC (o Parquet) particionado por moneda y ordenado por fecha, y se lee con
+    memory-map pidiendo solo las columnas, monedas y rango de fechas necesarios.
+    """
+
+    def __init__(self, run_id, base_dir=INTERMEDIATE_DIR, file_format=INTERMEDIATE_FORMAT):
+        if file_format not in _FORMATS:
+            raise ValueError(f"Formato intermedio no soportado: {file_format}. Usar 'parquet' o 'arrow'.")
+        self.run_id = run_id
+        self.root = os.path.join(base_dir, re.sub(r'[^A-Za-z0-9_.-]+', '_', str(run_id)))
+        self.file_format = file_format
+        self._filesystem = fs.LocalFileSystem(use_mmap=True)
+
+    @property
+    def _partitioning(self):
+        return ds.partitioning(pa.schema([('coin_id', pa.string())]), flavor='hive')
+
+    def path(self, name):
+        return os.path.join(self.root, name)
+
+    def exists(self, name):
+        return os.path.isdir(self.path(name))
+
+    @staticmethod
+    def _time_column(schema):
+        return 'date' if 'date' in schema.names else 'timestamp'
+
+    def write(self, name, df):
+        """
+        Escribe `df` como dataset `name` (sobrescribe las particiones existentes).
+        Necesita `coin_id` y `date` (datetime) o `timestamp` (epoch ms) para particionar.
+        """
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        table = table.set_column(table.schema.get_field_index('coin_id'), 'coin_id',
+                                 table['coin_id'].cast(pa.string()))
+        table = table.sort_by([('coin_id', 'ascending'), (self._time_column(table.schema), 'ascending')])
+
+        path = self.path(name)
+        ds.write_dataset(table, path, format=_FORMATS[self.file_format], partitioning=self._partitioning,
+                         existing_data_behavior='delete_matching',
+                         min_rows_per_group=min(ROW_GROUP_SIZE, max(1, len(table))),
+                         max_rows_per_group=ROW_GROUP_SIZE)
+        logger.info(f"Dataset '{name}' guardado: {len(df)} filas en {path} ({self.file_format})")
+        return path
+
+    def read(self, name, columns=None, coins=None, start=None, end=None):
+        """
+        Lee el dataset `name` como DataFrame (ordenado por moneda y fecha).
+
+        - `columns`: solo estas columnas (el resto no se lee del disco).
+        - `coins`: solo las particiones de estas monedas.
+        - `start` / `end`: filas con fecha en [start, end].
+        """
+        path = self.path(name)
+        if not os.path.isdir(path):
+            raise ValueError(f"No existe el dataset intermedio '{name}' para la ejecución {self.run_id}.")
+        dataset = ds.dataset(path, format=_FORMATS[self.file_format], partitioning=self._partitioning,
+                             filesystem=self._filesystem)
+
+        time_column = self._time_column(dataset.schema)
+        time_type = dataset.schema.field(time_column).type
+
+        def time_scalar(value):
+            value = pd.Timestamp(value)
+            if pa.types.is_timestamp(time_type):
+                return pa.scalar(value.to_pydatetime(), type=time_type)
+            return pa.scalar(int(value.value // 1_000_000), type=time_type)
+
+        conditions = []
+        if coins is not None:
+            conditions.append(ds.field('coin_id').isin([str(c) for c in coins]))
+        if start is not None:
+            conditions.append(ds.field(time_column) >= time_scalar(start))
+        if end is not None:
+            conditions.append(ds.field(time_column) <= time_scalar(end))
+        expression = None
+        for condition in conditions:
+            expression = condition if expression is None else expression & condition
+
+        if columns is None:
+            # Orden original de columnas (las de partición se añaden al final del esquema)
+            metadata = dataset.schema.pandas_metadata or {}
+            original = [c['name'] for c in metadata.get('columns', []) if c.get('name') is not None]
+            columns = [c for c in original if c in dataset.schema.names] or dataset.schema.names
+        # coin_id se guarda como texto (columna de partición); vuelve como categórico
+        return normalize_raw(dataset.to_table(columns=list(columns), filter=expression).to_pandas())
+
+    def size_bytes(self, name):
+        total = 0
+        for directory, _, files in os.walk(self.path(name)):
+            total += sum(os.path.getsize(os.path.join(directory, f)) for f in files)
+        return total
+
+    def cleanup(self):
+        """
+        Elimina todos los datasets de la ejecución.
+        """
+        shutil.rmtree(self.root, ignore_errors=True)
+        logger.info(f"Almacén intermedio eliminado: {self.root}")
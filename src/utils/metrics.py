@@ -0,0 +1,215 @@
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from functools import wraps
+
+from src.config import METRICS_ENABLED, METRICS_TEXTFILE_DIR
+from src.utils.logger import setup_logger
+
+try:
+    import resource
+except ImportError:  # Windows: sin getrusage, la memoria pico queda en None
+    resource = None
+
+logger = setup_logger("metrics")
+
+# Contadores de llamadas externas que cada etapa reporta como delta (entrada -> salida)
+CALL_COUNTERS = ('api_calls', 'api_cache_hits', 'db_queries')
+_PREFIX = 'crypto_etl'
+
+
+@dataclass
+class StageMetrics:
+    """
+    Medidas de una etapa del pipeline. `rows_in` / `rows_out` los completa quien
+    ejecuta la etapa (o `timed` a partir del DataFrame devuelto).
+    """
+    stage: str
+    labels: dict = field(default_factory=dict)
+    rows_in: int = None
+    rows_out: int = None
+    wall_seconds: float = 0.0
+    cpu_seconds: float = 0.0
+    peak_rss_mb: float = None
+    rss_growth_mb: float = None
+    calls: dict = field(default_factory=dict)
+
+
+class _Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = dict.fromkeys(CALL_COUNTERS, 0)
+        self.stages = []
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.counters)
+
+
+_registry = _Registry()
+
+
+def count_call(name, n=1, enabled=None):
+    """
+    Suma `n` al contador `name` (ver CALL_COUNTERS). Sin instrumentación activa no hace nada.
+    """
+    if enabled if enabled is not None else METRICS_ENABLED:
+        _registry.count(name, n)
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    # ru_maxrss está en KiB en Linux (en bytes en macOS)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+@contextmanager
+def stage(name, rows_in=None, enabled=None, **labels):
+    """
+    Mide una etapa: tiempo de reloj y de CPU, memoria pico del proceso (y cuánto creció
+    durante la etapa), llamadas a la API / consultas a la base y filas de entrada/salida.
+    Al salir emite una línea de log JSON y guarda la medida para `write_textfile`.
+
+        with stage('load', rows_in=len(df)) as m:
+            ...
+            m.rows_out = loaded
+
+    Con la instrumentación desactivada (METRICS_ENABLED=false) solo se crea el objeto.
+    """
+    metrics = StageMetrics(stage=name, labels=labels, rows_in=rows_in)
+    if not (enabled if enabled is not None else METRICS_ENABLED):
+        yield metrics
+        return
+
+    calls_before = _registry.snapshot()
+    rss_before = _peak_rss_mb()
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        yield metrics
+    finally:
+        metrics.wall_seconds = time.perf_counter() - wall
+        metrics.cpu_seconds = time.process_time() - cpu
+        metrics.peak_rss_mb = _peak_rss_mb()
+        if rss_before is not None:
+            metrics.rss_growth_mb = metrics.peak_rss_mb - rss_before
+        calls_after = _registry.snapshot()
+        metrics.calls = {k: calls_after[k] - calls_before.get(k, 0) for k in calls_after}
+        with _registry._lock:
+            _registry.stages.append(metrics)
+        logger.info(json.dumps({'event': 'stage', **asdict(metrics)}, default=str))
+
+
+def timed(name, **labels):
+    """
+    Decorador equivalente a `stage`: si la función devuelve algo con longitud (p. ej.
+    un DataFrame) se toma como `rows_out`, y si su primer argumento la tiene, como `rows_in`.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            rows_in = len(args[0]) if args and hasattr(args[0], '__len__') else None
+            with stage(name, rows_in=rows_in, **labels) as m:
+                result = func(*args, **kwargs)
+                if hasattr(result, '__len__'):
+                    m.rows_out = len(result)
+                return result
+        return wrapper
+    return decorator
+
+
+def instrument_engine(engine):
+    """
+    Cuenta las sentencias que ejecuta `engine` en el contador `db_queries`. Las copias
+    con COPY sobre la conexión DBAPI cruda no pasan por aquí.
+    """
+    from sqlalchemy import event
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _count(conn, cursor, statement, parameters, context, executemany):
+        count_call('db_queries')
+
+    return engine
+
+
+def recorded_stages():
+    return list(_registry.stages)
+
+
+def _label_string(labels):
+    return ','.join(f'{k}="{str(v)}"' for k, v in sorted(labels.items()))
+
+
+def render_openmetrics(stages=None, job='pipeline', gauges=None):
+    """
+    Texto en formato Prometheus/OpenMetrics con una serie por etapa (las etapas con el
+    mismo nombre, p. ej. una por chunk, se suman; la memoria pico se toma como máximo).
+    `gauges` añade series sueltas {nombre: (descripción, valor)}, p. ej. latencias.
+    """
+    totals = {}
+    for m in recorded_stages() if stages is None else stages:
+        t = totals.setdefault(m.stage, {'wall_seconds': 0.0, 'cpu_seconds': 0.0, 'rows_in': 0, 'rows_out': 0,
+                                        'peak_rss_mb': 0.0, 'runs': 0, **dict.fromkeys(CALL_COUNTERS, 0)})
+        t['wall_seconds'] += m.wall_seconds
+        t['cpu_seconds'] += m.cpu_seconds
+        t['rows_in'] += m.rows_in or 0
+        t['rows_out'] += m.rows_out or 0
+        t['peak_rss_mb'] = max(t['peak_rss_mb'], m.peak_rss_mb or 0.0)
+        t['runs'] += 1
+        for k, v in m.calls.items():
+            t[k] = t.get(k, 0) + v
+
+    series = {
+        'stage_wall_seconds': ('gauge', 'Tiempo de reloj de la etapa', 'wall_seconds'),
+        'stage_cpu_seconds': ('gauge', 'Tiempo de CPU del proceso durante la etapa', 'cpu_seconds'),
+        'stage_rows_in': ('gauge', 'Filas de entrada', 'rows_in'),
+        'stage_rows_out': ('gauge', 'Filas de salida', 'rows_out'),
+        'stage_peak_rss_megabytes': ('gauge', 'Memoria residente pico del proceso', 'peak_rss_mb'),
+        'stage_runs': ('gauge', 'Ejecuciones de la etapa', 'runs'),
+        **{f'stage_{k}': ('gauge', f'Llamadas: {k}', k) for k in CALL_COUNTERS},
+    }
+    lines = []
+    for metric, (kind, help_text, key) in series.items():
+        lines.append(f"# HELP {_PREFIX}_{metric} {help_text}")
+        lines.append(f"# TYPE {_PREFIX}_{metric} {kind}")
+        for name, t in totals.items():
+            lines.append(f"{_PREFIX}_{metric}{{{_label_string({'job': job, 'stage': name})}}} {t[key]}")
+    for metric, (help_text, value) in (gauges or {}).items():
+        lines.append(f"# HELP {_PREFIX}_{metric} {help_text}")
+        lines.append(f"# TYPE {_PREFIX}_{metric} gauge")
+        lines.append(f"{_PREFIX}_{metric}{{{_label_string({'job': job})}}} {value}")
+    lines.append(f"# HELP {_PREFIX}_last_run_timestamp_seconds Fin de la última ejecución")
+    lines.append(f"# TYPE {_PREFIX}_last_run_timestamp_seconds gauge")
+    lines.append(f"{_PREFIX}_last_run_timestamp_seconds{{{_label_string({'job': job})}}} {time.time():.0f}")
+    return '\n'.join(lines) + '\n'
+
+
+def write_textfile(job='pipeline', directory=METRICS_TEXTFILE_DIR, gauges=None):
+    """
+    Escribe las etapas registradas (y `gauges`, ver `render_openmetrics`) en
+    `<directory>/crypto_etl_<job>.prom` (collector textfile de node_exporter) de forma
+    atómica y vacía el registro. Sin directorio configurado o sin nada que escribir no
+    hace nada.
+    """
+    stages = recorded_stages()
+    with _registry._lock:
+        _registry.stages.clear()
+    if not directory or not (stages or gauges):
+        return None
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{_PREFIX}_{job}.prom")
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(render_openmetrics(stages, job=job, gauges=gauges))
+    # node_exporter nunca ve un fichero a medio escribir
+    os.replace(tmp_path, path)
+    return path
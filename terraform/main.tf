@@ -79,6 +79,10 @@ resource "postgresql_table" "cryptocurrency_metrics" {
     name = "price_change_24h"
     type = "numeric"
   }
+  columns {
+    name = "daily_return"
+    type = "numeric"
+  }
   columns {
     name = "profitability_30d"
     type = "numeric"
@@ -0,0 +1,115 @@
+import os
+import sys
+import threading
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, text
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.etl import backfill
+from src.etl.backfill import CHECKPOINT_TABLE, plan_units, run_backfill
+from src.load.load_db import METRICS_COLUMNS
+from src.transform.clean import clean_data
+from src.transform.kpis import calculate_kpis
+
+DAY_MS = 86_400_000
+
+
+class FakeRangeCoinGecko:
+    """Endpoint de rango falso: una barra diaria por moneda con precios deterministas."""
+
+    def __init__(self, fail=()):
+        self.fail = set(fail)
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def get_coin_market_chart_range_by_id(self, id, vs_currency, from_timestamp, to_timestamp, **kwargs):
+        with self.lock:
+            self.calls.append((id, from_timestamp))
+        if (id, from_timestamp) in self.fail:
+            raise ConnectionError('timeout')
+        first = -(-from_timestamp * 1000 // DAY_MS) * DAY_MS
+        ts = np.arange(first, to_timestamp * 1000, DAY_MS)
+        day = ts // DAY_MS
+        price = 100 + 10 * np.sin(day / 7) + len(id)
+        return {
+            'prices': [[int(t), float(p)] for t, p in zip(ts, price)],
+            'total_volumes': [[int(t), float(1e6 + d)] for t, d in zip(ts, day)],
+            'market_caps': [[int(t), float(p * 1e6)] for t, p in zip(ts, price)],
+        }
+
+
+def _engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'backfill.db'}")
+    metrics = ', '.join(f"{c} NUMERIC" for c in METRICS_COLUMNS)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE cryptocurrency_prices (row_index BIGINT, coin TEXT NOT NULL, "
+                          "price_timestamp TIMESTAMP NOT NULL, price NUMERIC, volume NUMERIC, market_cap NUMERIC, "
+                          "PRIMARY KEY (coin, price_timestamp))"))
+        conn.execute(text(f"CREATE TABLE cryptocurrency_metrics (coin TEXT NOT NULL, "
+                          f"price_timestamp TIMESTAMP NOT NULL, {metrics}, PRIMARY KEY (coin, price_timestamp))"))
+    return engine
+
+
+def test_plan_units_splits_range_per_coin():
+    units = plan_units(['bitcoin', 'ethereum'], '2020-01-01', '2020-03-01', window_days=30)
+    assert [(u.coin, str(u.start.date()), str(u.end.date())) for u in units] == [
+        ('bitcoin', '2020-01-01', '2020-01-31'), ('ethereum', '2020-01-01', '2020-01-31'),
+        ('bitcoin', '2020-01-31', '2020-03-01'), ('ethereum', '2020-01-31', '2020-03-01'),
+    ]
+
+
+def test_backfill_resumes_from_checkpoint_and_matches_single_pass(tmp_path, monkeypatch):
+    monkeypatch.setattr('src.load.load_db.ROLLUPS_ENABLED', False)
+    engine = _engine(tmp_path)
+    coins = ['bitcoin', 'ethereum']
+    args = dict(start='2021-01-01', end='2021-06-30', coins=coins, window_days=60, max_workers=2, engine=engine)
+
+    # Primera ejecución: la unidad [2021-03-02, 2021-05-01) de ethereum falla y queda pendiente
+    # (en diario se piden al menos 91 días para que la API devuelva barras diarias)
+    failing = ('ethereum', int((pd.Timestamp('2021-05-01') - pd.Timedelta(days=91)).timestamp()))
+    summary = run_backfill(cg=FakeRangeCoinGecko(fail=[failing]), **args)
+    assert summary['planned'] == 6 and summary['completed'] == 5 and len(summary['failed']) == 1
+
+    # Segunda ejecución: solo se pide la unidad pendiente
+    cg = FakeRangeCoinGecko()
+    summary = run_backfill(cg=cg, **args)
+    assert summary['skipped'] == 5 and summary['completed'] == 1 and cg.calls == [failing]
+    with engine.connect() as conn:
+        assert conn.execute(text(f"SELECT COUNT(*) FROM {CHECKPOINT_TABLE}")).scalar() == 6
+
+    # Los KPIs en los bordes de ventana coinciden con un cálculo de una sola pasada
+    stored = pd.read_sql("SELECT * FROM cryptocurrency_metrics ORDER BY coin, price_timestamp", engine)
+    stored['price_timestamp'] = pd.to_datetime(stored['price_timestamp'])
+    assert len(stored) == 2 * 180 and not stored.duplicated(['coin', 'price_timestamp']).any()
+
+    raw = pd.concat([backfill.build_coin_frame(FakeRangeCoinGecko().get_coin_market_chart_range_by_id(
+        coin, 'usd', int(pd.Timestamp('2020-10-01').timestamp()), int(pd.Timestamp('2021-06-30').timestamp())), coin)
+        for coin in coins], ignore_index=True)
+    expected = calculate_kpis(clean_data(raw), columns=METRICS_COLUMNS)
+    expected = expected[expected['date'] >= '2021-01-01'].reset_index(drop=True)
+    np.testing.assert_allclose(stored['volatility_30d'].astype(float), expected['volatility_30d'], rtol=1e-9)
+    np.testing.assert_allclose(stored['price_change_30d'].astype(float), expected['price_change_30d'], rtol=1e-9)
+
+
+def test_failed_load_leaves_unit_pending(tmp_path, monkeypatch):
+    monkeypatch.setattr('src.load.load_db.ROLLUPS_ENABLED', False)
+    engine = _engine(tmp_path)
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE cryptocurrency_metrics RENAME TO metrics_missing"))
+    args = dict(start='2021-01-01', end='2021-03-01', coins=['bitcoin'], window_days=60, max_workers=1,
+                engine=engine)
+
+    # La escritura de métricas falla: la unidad no se marca como completada
+    summary = run_backfill(cg=FakeRangeCoinGecko(), **args)
+    assert summary['completed'] == 0 and len(summary['failed']) == 1
+    with engine.connect() as conn:
+        assert conn.execute(text(f"SELECT COUNT(*) FROM {CHECKPOINT_TABLE}")).scalar() == 0
+        conn.execute(text("ALTER TABLE metrics_missing RENAME TO cryptocurrency_metrics"))
+        conn.commit()
+
+    # Al relanzar se reintenta y se completa
+    summary = run_backfill(cg=FakeRangeCoinGecko(), **args)
+    assert summary['skipped'] == 0 and summary['completed'] == 1
@@ -0,0 +1,56 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine, text
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.data_quality import batch_scope, run_all_checks, run_checks
+
+
+def _engine(rows):
+    engine = create_engine('sqlite://')
+    with engine.begin() as conn:
+        # Sin clave primaria, para poder insertar duplicados
+        conn.execute(text("CREATE TABLE cryptocurrency_prices (coin TEXT, price_timestamp TIMESTAMP, "
+                          "price NUMERIC, volume NUMERIC, market_cap NUMERIC)"))
+    pd.DataFrame(rows, columns=['coin', 'price_timestamp', 'price', 'volume', 'market_cap']).to_sql(
+        'cryptocurrency_prices', engine, if_exists='append', index=False)
+    return engine
+
+
+def _rows(coins, days, end=None):
+    end = end or pd.Timestamp.now().normalize()
+    dates = pd.date_range(end=end, periods=days, freq='D')
+    return [(coin, date, 1.0, 2.0, 3.0) for coin in coins for date in dates]
+
+
+def test_single_scan_matches_per_check_queries():
+    coins = ['bitcoin', 'ethereum', 'cardano', 'solana', 'ripple']
+    engine = _engine(_rows(coins, 10) + [('bitcoin', pd.Timestamp.now().normalize(), None, 1.0, None)])
+
+    single = run_checks(engine)
+    separate = run_checks(engine, single_scan=False)
+
+    assert single.metrics == separate.metrics
+    assert single.metrics['row_count'] == 51 and single.metrics['duplicate_keys'] == 1
+    assert {r.name for r in single.failures} == {'no_null_keys', 'no_null_values', 'no_duplicates'}
+    assert [r.passed for r in single.results] == [r.passed for r in separate.results]
+    assert all(r.seconds >= 0 for r in single.results)
+
+
+def test_batch_scope_ignores_rows_outside_the_loaded_range():
+    old_duplicate = ('bitcoin', pd.Timestamp('2020-01-01'), 1.0, 2.0, 3.0)
+    engine = _engine(_rows(['bitcoin', 'ethereum'], 5) + [old_duplicate, old_duplicate])
+    today = pd.Timestamp.now().normalize()
+    batch = pd.DataFrame({'coin_id': ['bitcoin', 'ethereum'], 'date': [today - pd.Timedelta(days=2), today]})
+
+    with pytest.raises(ValueError, match='no_duplicates'):
+        run_all_checks(engine)
+    report = run_all_checks(engine, scope=batch_scope(batch))
+
+    assert report.metrics['row_count'] == 6
+    # coin_coverage solo exige las monedas del lote
+    assert all(r.passed for r in report.results)
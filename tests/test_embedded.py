@@ -0,0 +1,82 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import text
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.data_quality import run_checks
+from src.db import embedded
+from src.db.embedded import create_embedded_engine, export_parquet, run_analytic_queries
+from src.load.load_db import METRICS_COLUMNS, load_data_to_supabase
+from src.transform.clean import clean_data
+from src.transform.kpis import calculate_kpis
+from tests.test_kpis import synthetic_raw
+
+
+def _batch():
+    raw = synthetic_raw([90, 90, 60])
+    # Que la serie termine hoy (check de frescura) y con un salto > 10 % ("pump day")
+    raw['timestamp'] += (pd.Timestamp.now().normalize() - pd.Timestamp('2023-03-31')).value // 10**6
+    clean = clean_data(raw)
+    step = (clean['coin_id'] == 'coin-00') & (clean['date'] >= clean['date'].min() + pd.Timedelta(days=40))
+    clean.loc[step, ['price', 'market_cap']] *= 1.25
+    return calculate_kpis(clean, columns=METRICS_COLUMNS)
+
+
+def _pump_days(df):
+    prev = df.groupby('coin_id', observed=True)['price'].shift(1)
+    growth = (df['price'] - prev) / prev
+    return int((growth > 0.10).sum())
+
+
+def _check_backend(engine):
+    df = _batch()
+    # Carga histórica dos veces: la segunda vacía las tablas antes (sin TRUNCATE en motores embebidos)
+    for _ in range(2):
+        load_data_to_supabase(df, engine=engine, parallel=False)
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM cryptocurrency_prices")).scalar() == len(df)
+        assert conn.execute(text("SELECT COUNT(*) FROM cryptocurrency_rollup_weekly")).scalar() > 0
+
+    assert run_checks(engine).failures == []
+
+    results = list(run_analytic_queries(engine).values())
+    assert len(results) == 3
+    assert len(results[0]) == df['coin_id'].nunique()
+    assert len(results[1]) == _pump_days(df) > 0
+    assert len(results[2]) > 0
+    return results
+
+
+def test_sqlite_backend_runs_loader_checks_and_analytics(tmp_path):
+    engine = create_embedded_engine('sqlite', str(tmp_path / 'crypto.sqlite'))
+    assert engine.dialect.name == 'sqlite'
+    _check_backend(engine)
+    # El volcado a Parquet conserva las filas y tipos columnares
+    exported = export_parquet(engine, str(tmp_path / 'parquet'))
+    prices = pd.read_parquet(tmp_path / 'parquet' / 'cryptocurrency_prices.parquet')
+    assert exported['cryptocurrency_prices'] == len(prices) > 0
+    assert pd.api.types.is_datetime64_any_dtype(prices['price_timestamp']) and prices['price'].dtype == np.float64
+
+
+def test_duckdb_falls_back_to_sqlite_when_not_installed(monkeypatch, tmp_path):
+    monkeypatch.setattr(embedded, 'duckdb_available', lambda: False)
+    assert embedded.embedded_url('duckdb', 'data/crypto.duckdb') == 'sqlite:///data/crypto.sqlite'
+    with pytest.raises(ValueError):
+        embedded.embedded_url('mysql')
+
+
+def test_duckdb_backend_and_parquet_analytics(tmp_path):
+    pytest.importorskip('duckdb_engine')
+    engine = create_embedded_engine('duckdb', str(tmp_path / 'crypto.duckdb'))
+    assert engine.dialect.name == 'duckdb'
+    results = _check_backend(engine)
+
+    export_parquet(engine, str(tmp_path / 'parquet'))
+    from_parquet = list(run_analytic_queries(embedded.parquet_engine(str(tmp_path / 'parquet'))).values())
+    for expected, actual in zip(results, from_parquet):
+        pd.testing.assert_frame_equal(actual, expected, check_dtype=False)
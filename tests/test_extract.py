@@ -0,0 +1,216 @@
+import os
+import sys
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.etl import extract
+from src.etl.cache import MarketChartCache
+from src.etl.rate_limit import TokenBucket, call_with_retries, is_rate_limited
+
+
+@pytest.fixture(autouse=True)
+def no_disk_cache(monkeypatch):
+    # Los tests no deben leer ni escribir la caché compartida del proceso
+    monkeypatch.setattr(extract, 'get_default_cache', lambda: None)
+
+
+def _payload(n, offset=0):
+    ts = [1_700_000_000_000 + i * 86_400_000 for i in range(n)]
+    return {
+        'prices': [[t, 100.0 + i + offset] for i, t in enumerate(ts)],
+        'total_volumes': [[t, 10.0 + i] for i, t in enumerate(ts)],
+        'market_caps': [[t, 1000.0 + i] for i, t in enumerate(ts)],
+    }
+
+
+class FakeCoinGecko:
+    """Cliente falso: devuelve 429 (formato JSON de pycoingecko) las primeras `fail_first` veces."""
+
+    def __init__(self, fail_first=0):
+        self.fail_first = fail_first
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def get_coin_market_chart_by_id(self, id, vs_currency, days, **kwargs):
+        with self.lock:
+            self.calls += 1
+            if self.calls <= self.fail_first:
+                raise ValueError({'status': {'error_code': 429, 'error_message': 'Rate limit'}})
+        return _payload(5, offset=len(id))
+
+
+def test_is_rate_limited_detects_json_error():
+    assert is_rate_limited(ValueError({'status': {'error_code': 429}}))
+    assert not is_rate_limited(ValueError({'error': 'coin not found'}))
+    assert not is_rate_limited(KeyError('prices'))
+
+
+def test_call_with_retries_recovers_from_429(monkeypatch):
+    monkeypatch.setattr('src.etl.rate_limit.backoff_delay', lambda attempt: 0)
+    cg = FakeCoinGecko(fail_first=2)
+    data = call_with_retries(cg.get_coin_market_chart_by_id, id='bitcoin', vs_currency='usd', days=5,
+                             sleep=lambda s: None)
+    assert cg.calls == 3
+    assert len(data['prices']) == 5
+
+
+def test_token_bucket_blocks_when_empty():
+    now = [0.0]
+    slept = []
+
+    def sleep(seconds):
+        slept.append(seconds)
+        now[0] += seconds
+
+    bucket = TokenBucket(rate_per_minute=60, burst=2, clock=lambda: now[0], sleep=sleep)
+    for _ in range(4):
+        bucket.acquire()
+    # 2 tokens de ráfaga + 2 tokens repuestos a 1 token/segundo
+    assert sum(slept) == 2.0
+
+
+def test_concurrent_extraction_matches_sequential(monkeypatch):
+    cg = FakeCoinGecko()
+    monkeypatch.setattr(extract, 'get_coingecko_client', lambda: cg)
+    monkeypatch.setattr(extract.time, 'sleep', lambda s: None)
+    coins = ['bitcoin', 'ethereum', 'solana', 'dogecoin']
+
+    sequential = extract.extract_all_coins(coins=coins, max_workers=1)
+    concurrent = extract.extract_all_coins(coins=coins, max_workers=4,
+                                           limiter=TokenBucket(rate_per_minute=60_000, burst=10))
+
+    pd.testing.assert_frame_equal(sequential, concurrent)
+    assert list(concurrent['coin_id'].unique()) == coins
+
+
+def test_days_since_watermark_adds_kpi_lookback():
+    from datetime import date
+    today = date(2024, 3, 10)
+    assert extract.days_since_watermark(None) == extract.DAYS_TO_FETCH
+    assert extract.days_since_watermark(pd.Timestamp('2024-03-09'), today=today) == 1 + extract.KPI_LOOKBACK_DAYS
+    assert extract.days_since_watermark(pd.Timestamp('2020-01-01'), today=today) == extract.DAYS_TO_FETCH
+
+
+def test_extract_all_coins_requests_only_missing_days(monkeypatch):
+    requested = {}
+
+    def fake_fetch(coin_id, days, **kwargs):
+        requested[coin_id] = days
+        return pd.DataFrame()
+
+    monkeypatch.setattr(extract, 'fetch_coin_data', fake_fetch)
+    monkeypatch.setattr(extract.time, 'sleep', lambda s: None)
+    recent = pd.Timestamp.now(tz='UTC').tz_localize(None).normalize() - pd.Timedelta(days=2)
+    extract.extract_all_coins(coins=['bitcoin', 'newcoin'], max_workers=1, watermarks={'bitcoin': recent})
+
+    assert requested['bitcoin'] == 2 + extract.KPI_LOOKBACK_DAYS
+    assert requested['newcoin'] == extract.DAYS_TO_FETCH
+
+
+def test_hourly_extraction_caps_days_and_uses_auto_interval(monkeypatch):
+    requested = {}
+
+    def fake_fetch(coin_id, days, **kwargs):
+        requested[coin_id] = (days, kwargs.get('interval'))
+        return pd.DataFrame()
+
+    monkeypatch.setattr(extract, 'fetch_coin_data', fake_fetch)
+    monkeypatch.setattr(extract.time, 'sleep', lambda s: None)
+    extract.extract_all_coins(coins=['bitcoin'], max_workers=1, granularity='hourly')
+
+    assert requested['bitcoin'] == (min(extract.DAYS_TO_FETCH, extract.HOURLY_MAX_DAYS), None)
+    with pytest.raises(ValueError):
+        extract.fetch_window('minutely')
+
+
+def test_shard_coins_splits_in_order():
+    assert extract.shard_coins(['a', 'b', 'c', 'd', 'e'], 2) == [['a', 'b'], ['c', 'd'], ['e']]
+    assert extract.shard_coins(['a'], 3) == [['a']]
+    with pytest.raises(ValueError):
+        extract.shard_coins(['a'], 0)
+
+
+def test_cache_hit_skips_api_call(tmp_path):
+    cache = MarketChartCache(cache_dir=str(tmp_path), ttl_seconds=3600, max_bytes=10**6)
+    cg = FakeCoinGecko()
+
+    first = extract.fetch_coin_data('bitcoin', days=5, cg=cg, cache=cache)
+    second = extract.fetch_coin_data('bitcoin', days=5, cg=cg, cache=cache)
+
+    assert cg.calls == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+    pd.testing.assert_frame_equal(first, second)
+
+
+def test_cache_expires_and_evicts_lru(tmp_path):
+    cache = MarketChartCache(cache_dir=str(tmp_path), ttl_seconds=3600, max_bytes=10**6)
+    key = cache.make_key('bitcoin', 'usd', 5, 'daily')
+    cache.put(key, _payload(5))
+    cache.ttl_seconds = -1
+    assert cache.get(key) is None
+
+    cache = MarketChartCache(cache_dir=str(tmp_path), ttl_seconds=3600, max_bytes=10**6)
+    keys = [cache.make_key(coin, 'usd', 5, 'daily') for coin in ('a', 'b', 'c')]
+    now = time.time()
+    for k in keys:
+        cache.put(k, _payload(50))
+    for i, k in enumerate(keys):
+        os.utime(os.path.join(str(tmp_path), f"{k}.json.gz"), (now - 60 + i, now - 60 + i))
+    os.utime(os.path.join(str(tmp_path), f"{keys[0]}.json.gz"))  # 'a' usado recientemente
+    cache.max_bytes = sum(os.path.getsize(os.path.join(str(tmp_path), f"{k}.json.gz")) for k in (keys[0], keys[2]))
+    cache.evict()
+
+    assert cache.get(keys[0]) is not None
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[2]) is not None
+
+
+def test_cache_put_scans_only_over_limit_and_ttl_ignores_hits(tmp_path, monkeypatch):
+    clock = [time.time()]
+    monkeypatch.setattr('src.etl.cache.time.time', lambda: clock[0])
+    cache = MarketChartCache(cache_dir=str(tmp_path), ttl_seconds=3600, max_bytes=10**6)
+    scans = []
+    listdir = os.listdir
+    monkeypatch.setattr('src.etl.cache.os.listdir', lambda path: scans.append(path) or listdir(path))
+
+    keys = [cache.make_key(coin, 'usd', 5, 'daily') for coin in ('a', 'b')]
+    for k in keys:
+        cache.put(k, _payload(50))
+    # Por debajo del límite, put no recorre el directorio
+    assert scans == []
+
+    # Los aciertos no alargan la vida de la entrada: get y evict expiran por created_at
+    clock[0] += 3000
+    assert cache.get(keys[0]) is not None
+    clock[0] += 1000
+    cache.evict()
+    assert not os.path.exists(os.path.join(str(tmp_path), f"{keys[0]}.json.gz"))
+    assert cache.get(keys[0]) is None
+
+
+def _legacy_frame(data, coin_id):
+    df = pd.DataFrame(data['prices'], columns=['timestamp', 'price'])
+    volumes = pd.DataFrame(data['total_volumes'], columns=['timestamp', 'volume'])
+    market_caps = pd.DataFrame(data['market_caps'], columns=['timestamp', 'market_cap'])
+    df = df.merge(volumes, on='timestamp', how='left')
+    df = df.merge(market_caps, on='timestamp', how='left')
+    df['coin_id'] = coin_id
+    return df
+
+
+def test_build_coin_frame_matches_merge_when_aligned():
+    data = _payload(30)
+    pd.testing.assert_frame_equal(extract.build_coin_frame(data, 'bitcoin'), _legacy_frame(data, 'bitcoin'))
+
+
+def test_build_coin_frame_aligns_mismatched_timestamps():
+    data = _payload(10)
+    data['total_volumes'] = list(reversed(data['total_volumes'][2:]))
+    data['market_caps'] = data['market_caps'][:-1]
+
+    pd.testing.assert_frame_equal(extract.build_coin_frame(data, 'bitcoin'), _legacy_frame(data, 'bitcoin'))
@@ -0,0 +1,79 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.etl.backfill import run_backfill
+from src.etl.gaps import Gap, find_gaps, scan_and_fill
+from tests.test_backfill import FakeRangeCoinGecko, _engine
+
+
+def _read(engine, table):
+    df = pd.read_sql(f"SELECT * FROM {table} ORDER BY coin, price_timestamp", engine)
+    df['price_timestamp'] = pd.to_datetime(df['price_timestamp'])
+    return df.drop(columns=['row_index'], errors='ignore')
+
+
+def test_gaps_are_found_and_filled_with_targeted_kpi_recompute(tmp_path, monkeypatch):
+    monkeypatch.setattr('src.load.load_db.ROLLUPS_ENABLED', False)
+    engine = _engine(tmp_path)
+    run_backfill('2021-01-01', '2021-06-30', coins=['bitcoin', 'ethereum'], window_days=180, max_workers=1,
+                 engine=engine, cg=FakeRangeCoinGecko())
+    expected_prices, expected_metrics = _read(engine, 'cryptocurrency_prices'), _read(engine, 'cryptocurrency_metrics')
+
+    with engine.begin() as conn:
+        for table in ('cryptocurrency_prices', 'cryptocurrency_metrics'):
+            conn.execute(text(f"DELETE FROM {table} WHERE coin = 'bitcoin' "
+                              f"AND price_timestamp BETWEEN '2021-03-10' AND '2021-03-14 23:59:59'"))
+            conn.execute(text(f"DELETE FROM {table} WHERE coin = 'ethereum' "
+                              f"AND price_timestamp BETWEEN '2021-05-01' AND '2021-05-01 23:59:59'"))
+        # KPIs que dependían de las barras perdidas (y uno lejano que no debe tocarse)
+        conn.execute(text("UPDATE cryptocurrency_metrics SET volatility_30d = NULL WHERE coin = 'bitcoin' "
+                          "AND price_timestamp BETWEEN '2021-03-15' AND '2021-04-10'"))
+        conn.execute(text("UPDATE cryptocurrency_metrics SET volatility_30d = -1 WHERE coin = 'bitcoin' "
+                          "AND price_timestamp BETWEEN '2021-06-01' AND '2021-06-01 23:59:59'"))
+
+    gaps = find_gaps(engine, since='2021-01-01')
+    assert gaps == [Gap('bitcoin', pd.Timestamp('2021-03-10'), pd.Timestamp('2021-03-14'), 5),
+                    Gap('ethereum', pd.Timestamp('2021-05-01'), pd.Timestamp('2021-05-01'), 1)]
+
+    cg = FakeRangeCoinGecko()
+    summary = scan_and_fill(engine, since='2021-01-01', cg=cg, max_workers=1)
+    assert summary['filled'] == 2 and summary['rows'] == 6 and len(cg.calls) == 2
+    assert find_gaps(engine, since='2021-01-01') == []
+
+    prices, metrics = _read(engine, 'cryptocurrency_prices'), _read(engine, 'cryptocurrency_metrics')
+    pd.testing.assert_frame_equal(prices, expected_prices, check_dtype=False)
+    # Solo se recalculan las filas cuyas ventanas cubren el hueco: la fila lejana conserva su valor
+    untouched = (metrics['coin'] == 'bitcoin') & (metrics['price_timestamp'] == '2021-06-01')
+    assert metrics.loc[untouched, 'volatility_30d'].astype(float).item() == -1
+    np.testing.assert_allclose(metrics.loc[~untouched, 'volatility_30d'].astype(float),
+                               expected_metrics.loc[~untouched, 'volatility_30d'].astype(float), rtol=1e-9)
+
+
+def test_gap_whose_load_fails_is_reported_unfilled(tmp_path, monkeypatch):
+    monkeypatch.setattr('src.load.load_db.ROLLUPS_ENABLED', False)
+    engine = _engine(tmp_path)
+    run_backfill('2021-01-01', '2021-06-30', coins=['bitcoin', 'ethereum'], window_days=180, max_workers=1,
+                 engine=engine, cg=FakeRangeCoinGecko())
+    with engine.begin() as conn:
+        for coin, day in (('bitcoin', '2021-03-10'), ('ethereum', '2021-05-01')):
+            conn.execute(text(f"DELETE FROM cryptocurrency_prices WHERE coin = '{coin}' "
+                              f"AND price_timestamp BETWEEN '{day}' AND '{day} 23:59:59'"))
+
+    from src.etl import gaps as gaps_module
+    load = gaps_module.load_data_to_supabase
+
+    def failing_load(df, **kwargs):
+        if (df['coin_id'] == 'ethereum').any():
+            raise RuntimeError('merge failed')
+        return load(df, **kwargs)
+
+    monkeypatch.setattr(gaps_module, 'load_data_to_supabase', failing_load)
+    summary = scan_and_fill(engine, since='2021-01-01', cg=FakeRangeCoinGecko(), max_workers=1)
+    assert summary['filled'] == 1 and [g.coin for g in summary['failed']] == ['ethereum']
+    assert [g.coin for g in find_gaps(engine, since='2021-01-01')] == ['ethereum']
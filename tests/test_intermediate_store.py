@@ -0,0 +1,60 @@
+import os
+import sys
+
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.transform.clean import clean_data
+from src.transform.dtypes import normalize_raw
+from src.transform.kpis import calculate_kpis
+from src.utils.intermediate_store import IntermediateStore
+from tests.test_kpis import synthetic_raw
+
+
+def test_round_trip_raw_and_processed(tmp_path):
+    raw = synthetic_raw([400, 40])
+    processed = calculate_kpis(clean_data(raw.copy()))
+
+    for file_format in ('parquet', 'arrow'):
+        store = IntermediateStore('manual__2024-01-01T00:00:00+00:00', base_dir=str(tmp_path), file_format=file_format)
+        store.write('raw', raw)
+        store.write('processed', processed)
+
+        # Partición por moneda
+        assert os.path.isdir(os.path.join(store.path('processed'), 'coin_id=coin-00'))
+
+        restored = store.read('raw')
+        # El almacén devuelve el esquema de src/transform/dtypes.py (coin_id categórico)
+        expected = normalize_raw(raw.sort_values(['coin_id', 'timestamp']).reset_index(drop=True))
+        pd.testing.assert_frame_equal(restored, expected, check_dtype=False)
+
+        restored = store.read('processed')
+        pd.testing.assert_frame_equal(restored, processed.reset_index(drop=True), check_dtype=False)
+        store.cleanup()
+        assert not os.path.exists(store.root)
+
+
+def test_read_prunes_columns_coins_and_dates(tmp_path):
+    processed = calculate_kpis(clean_data(synthetic_raw([400, 40, 10])))
+    store = IntermediateStore('run-1', base_dir=str(tmp_path))
+    store.write('processed', processed)
+
+    subset = store.read('processed', columns=['coin_id', 'date', 'volatility_30d'], coins=['coin-00'],
+                        start='2023-12-01', end='2024-01-31')
+
+    assert list(subset.columns) == ['coin_id', 'date', 'volatility_30d']
+    assert set(subset['coin_id']) == {'coin-00'}
+    assert subset['date'].min() == pd.Timestamp('2023-12-01')
+    assert subset['date'].max() == pd.Timestamp('2024-01-31')
+    assert len(subset) == 62
+
+
+def test_runs_do_not_overwrite_each_other(tmp_path):
+    first = IntermediateStore('run-a', base_dir=str(tmp_path))
+    second = IntermediateStore('run-b', base_dir=str(tmp_path))
+    first.write('raw', synthetic_raw([5]))
+    second.write('raw', synthetic_raw([7]))
+
+    assert len(first.read('raw')) == 5
+    assert len(second.read('raw')) == 7
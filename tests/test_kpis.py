@@ -0,0 +1,154 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.transform.clean import clean_data
+from src.transform.kpis import calculate_kpis, resolve_kpis, kpi_lookback, KPI_COLUMNS
+
+
+def legacy_calculate_kpis(df, bars=1):
+    """Implementación original con un groupby por métrica (referencia de resultados).
+    `bars` = filas por día (24 en modo horario)."""
+    df = df.sort_values(by=['coin_id', 'date'])
+    df['daily_return'] = df.groupby('coin_id')['price'].pct_change(periods=bars)
+    df['market_cap_change_24h'] = df.groupby('coin_id')['market_cap'].pct_change(periods=bars) * 100
+    df['volume_change_24h'] = df.groupby('coin_id')['volume'].pct_change(periods=bars) * 100
+    df['profitability_30d'] = df.groupby('coin_id')['price'].pct_change(periods=30 * bars) * 100
+    df['volatility_30d'] = df.groupby('coin_id')['daily_return'].rolling(window=30 * bars).std().reset_index(0, drop=True) * 100
+    df['price_change_24h'] = df.groupby('coin_id')['price'].pct_change(periods=bars) * 100
+    df['price_change_7d'] = df.groupby('coin_id')['price'].pct_change(periods=7 * bars) * 100
+    df['price_change_30d'] = df.groupby('coin_id')['price'].pct_change(periods=30 * bars) * 100
+    df['market_cap_change_7d'] = df.groupby('coin_id')['market_cap'].pct_change(periods=7 * bars) * 100
+    df['market_cap_change_30d'] = df.groupby('coin_id')['market_cap'].pct_change(periods=30 * bars) * 100
+    df['volume_change_7d'] = df.groupby('coin_id')['volume'].pct_change(periods=7 * bars) * 100
+    df['volume_change_30d'] = df.groupby('coin_id')['volume'].pct_change(periods=30 * bars) * 100
+    return df.fillna(0)
+
+
+def synthetic_raw(lengths, seed=0, freq='D'):
+    """Frame crudo (como extract_all_coins) con una serie aleatoria por moneda, desordenado."""
+    rng = np.random.default_rng(seed)
+    frames = []
+    for i, n in enumerate(lengths):
+        ts = pd.date_range('2023-01-01', periods=n, freq=freq).as_unit('ms').asi8
+        price = 100 * np.cumprod(1 + rng.normal(0, 0.03, n))
+        frames.append(pd.DataFrame({
+            'timestamp': ts,
+            'price': price,
+            'volume': rng.uniform(1e6, 1e9, n),
+            'market_cap': price * 1e6,
+            'coin_id': f'coin-{i:02d}',
+        }))
+    raw = pd.concat(frames, ignore_index=True)
+    return raw.sample(frac=1, random_state=seed).reset_index(drop=True)
+
+
+def test_calculate_kpis_matches_groupby_implementation():
+    clean = clean_data(synthetic_raw([120, 31, 5, 1, 45, 30]))
+
+    result = calculate_kpis(clean.copy())
+    expected = legacy_calculate_kpis(clean.copy())
+
+    pd.testing.assert_frame_equal(result, expected, check_exact=False, rtol=1e-9, atol=1e-12)
+
+
+def test_calculate_kpis_masks_coin_boundaries():
+    clean = clean_data(synthetic_raw([40, 40]))
+    result = calculate_kpis(clean)
+
+    second_coin = result[result['coin_id'] == 'coin-01']
+    # La primera fila de cada moneda no debe heredar el precio de la moneda anterior
+    assert second_coin['daily_return'].iloc[0] == 0
+    assert (second_coin['volatility_30d'].iloc[:30] == 0).all()
+    assert second_coin['volatility_30d'].iloc[30] > 0
+
+
+def test_calculate_kpis_subset_only_evaluates_requested_columns():
+    clean = clean_data(synthetic_raw([60, 35]))
+    full = calculate_kpis(clean.copy())
+
+    subset = calculate_kpis(clean.copy(), columns=['volatility_30d', 'price_change_24h'])
+
+    # daily_return se calcula como intermedio compartido pero no se añade
+    assert resolve_kpis(['volatility_30d', 'price_change_24h']) == ['daily_return', 'volatility_30d',
+                                                                    'price_change_24h']
+    assert [c for c in subset.columns if c in KPI_COLUMNS] == ['volatility_30d', 'price_change_24h']
+    pd.testing.assert_frame_equal(subset[['volatility_30d', 'price_change_24h']],
+                                  full[['volatility_30d', 'price_change_24h']])
+    assert kpi_lookback(['volatility_30d']) == 30
+    assert kpi_lookback(['price_change_7d']) == 7
+
+
+def test_calculate_kpis_rejects_unknown_kpi():
+    clean = clean_data(synthetic_raw([5]))
+    try:
+        calculate_kpis(clean, columns=['sharpe_ratio'])
+    except ValueError as e:
+        assert 'sharpe_ratio' in str(e)
+    else:
+        raise AssertionError("Se esperaba ValueError")
+
+
+def test_lean_dtypes_through_clean_and_kpis():
+    clean = clean_data(synthetic_raw([40, 35]))
+    assert isinstance(clean['coin_id'].dtype, pd.CategoricalDtype)
+    assert clean['date'].dtype == 'datetime64[s]'
+
+    full = calculate_kpis(clean.copy())
+    lean = calculate_kpis(clean.copy(), float_dtype='float32')
+
+    assert lean['volatility_30d'].dtype == np.float32
+    # daily_return no es un porcentaje: se mantiene en float64
+    assert lean['daily_return'].dtype == np.float64
+    np.testing.assert_allclose(lean['volatility_30d'], full['volatility_30d'], rtol=1e-6)
+
+
+def test_hourly_granularity_uses_time_windows():
+    raw = synthetic_raw([24 * 35, 24 * 3], freq='h')
+    # CoinGecko devuelve puntos horarios con minutos/segundos arbitrarios
+    raw['timestamp'] += 137_000
+    clean = clean_data(raw, granularity='hourly')
+    assert (clean['date'].dt.minute == 0).all()
+    assert clean.groupby('coin_id', observed=True).size().tolist() == [24 * 35, 24 * 3]
+
+    result = calculate_kpis(clean.copy(), granularity='hourly')
+    expected = legacy_calculate_kpis(clean.copy(), bars=24)
+
+    pd.testing.assert_frame_equal(result, expected, check_exact=False, rtol=1e-9, atol=1e-12)
+    assert kpi_lookback(['volatility_30d'], granularity='hourly') == 30 * 24 - 1 + 24
+    assert kpi_lookback(['price_change_7d'], granularity='hourly') == 7 * 24
+
+
+def test_gapped_hourly_series_uses_time_windows():
+    raw = synthetic_raw([24 * 40, 24 * 33], freq='h', seed=4)
+    # Horas que faltan (habitual en los datos horarios de CoinGecko), también un día entero
+    hours = (raw['timestamp'] // 3_600_000) % (24 * 40)
+    raw = raw[~hours.isin([30, 31, 500, 701, 702, 703] + list(range(800, 824)))]
+    clean = clean_data(raw, granularity='hourly')
+    result = calculate_kpis(clean.copy(), granularity='hourly').set_index(['coin_id', 'date'])
+
+    # Referencia: la serie sobre la rejilla horaria completa (NaN en las horas que faltan)
+    frames = []
+    for coin, group in clean.groupby('coin_id', observed=True):
+        grid = group.set_index('date').reindex(pd.date_range(group['date'].min(), group['date'].max(), freq='h'))
+        grid['daily_return'] = grid['price'] / grid['price'].shift(24) - 1
+        grid['price_change_7d'] = (grid['price'] / grid['price'].shift(24 * 7) - 1) * 100
+        volatility = grid['daily_return'].rolling(24 * 30, min_periods=2).std() * 100
+        volatility.iloc[:24 * 31 - 1] = np.nan
+        grid['volatility_30d'] = volatility
+        frames.append(grid.dropna(subset=['price']).assign(coin_id=coin).rename_axis('date').reset_index())
+    expected = pd.concat(frames).set_index(['coin_id', 'date']).fillna(0)
+
+    for column in ('daily_return', 'price_change_7d', 'volatility_30d'):
+        np.testing.assert_allclose(result[column], expected.loc[result.index, column], rtol=1e-9, atol=1e-12)
+    # 24h después de una hora que falta no hay referencia: el cambio queda indefinido (0)
+    # en lugar de compararse con la barra de 25h antes
+    first = result.xs('coin-00')
+    day = pd.Timedelta('24h')
+    orphans = ~(first.index - day).isin(first.index) & (first.index >= first.index[0] + day)
+    assert orphans.sum() >= 2
+    assert (first.loc[orphans, 'daily_return'] == 0).all()
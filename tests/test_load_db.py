@@ -0,0 +1,79 @@
+import os
+import sys
+
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.load.load_db import filter_new_data
+
+
+def _frame():
+    dates = pd.date_range('2024-01-01', periods=5, freq='D')
+    return pd.DataFrame({
+        'coin_id': ['bitcoin'] * 5 + ['ethereum'] * 5 + ['solana'] * 5,
+        'date': list(dates) * 3,
+        'price': range(15),
+    })
+
+
+def test_filter_new_data_global_watermark():
+    df = filter_new_data(_frame(), pd.Timestamp('2024-01-03'))
+    assert len(df) == 6
+
+
+def test_filter_new_data_per_coin_watermarks():
+    watermarks = {'bitcoin': pd.Timestamp('2024-01-04'), 'ethereum': pd.Timestamp('2024-01-02')}
+    df = filter_new_data(_frame(), watermarks)
+
+    counts = df.groupby('coin_id').size().to_dict()
+    # bitcoin: 1 fila nueva, ethereum: 3, solana (sin watermark): todas
+    assert counts == {'bitcoin': 1, 'ethereum': 3, 'solana': 5}
+
+
+def test_write_frame_falls_back_to_to_sql_on_non_postgres():
+    from sqlalchemy import create_engine, text
+    from src.load.load_db import write_frame
+
+    engine = create_engine('sqlite://')
+    df = _frame().rename(columns={'coin_id': 'coin', 'date': 'price_timestamp'})
+    write_frame(df, 'cryptocurrency_prices', engine, load_method='copy')
+
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM cryptocurrency_prices")).scalar() == len(df)
+
+
+def test_upsert_frame_merges_overlapping_rows():
+    from sqlalchemy import create_engine, text
+    from src.load.load_db import upsert_frame
+
+    engine = create_engine('sqlite://')
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE cryptocurrency_prices (coin TEXT NOT NULL, price_timestamp TIMESTAMP NOT NULL, "
+                          "price NUMERIC, PRIMARY KEY (coin, price_timestamp))"))
+
+    first = _frame().rename(columns={'coin_id': 'coin', 'date': 'price_timestamp'})
+    upsert_frame(first, 'cryptocurrency_prices', engine)
+
+    # Lote solapado: corrige 2 filas existentes y añade 1 nueva
+    correction = first[first['coin'] == 'bitcoin'].tail(2).copy()
+    correction['price'] = [100, 200]
+    late = pd.DataFrame({'coin': ['bitcoin'], 'price_timestamp': [pd.Timestamp('2024-01-06')], 'price': [300]})
+    upsert_frame(pd.concat([correction, late]), 'cryptocurrency_prices', engine)
+
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT price FROM cryptocurrency_prices WHERE coin = 'bitcoin' "
+                                 "ORDER BY price_timestamp")).scalars().all()
+    assert rows == [0, 1, 2, 100, 200, 300]
+
+
+def test_load_data_to_supabase_raises_when_upsert_fails(monkeypatch):
+    import pytest
+    from sqlalchemy import create_engine
+    from src.load.load_db import load_data_to_supabase
+
+    monkeypatch.setattr('src.load.load_db.ROLLUPS_ENABLED', False)
+    df = _frame().assign(volume=1.0, market_cap=1.0)
+    # Sin tablas: el fallo del merge debe llegar al llamador, no quedarse en el log
+    with pytest.raises(Exception, match='no such table'):
+        load_data_to_supabase(df, engine=create_engine('sqlite://'), write_mode='upsert', parallel=False)
@@ -0,0 +1,45 @@
+import json
+import logging
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.utils.metrics import count_call, recorded_stages, stage, timed, write_textfile
+
+
+def test_stage_records_timings_rows_and_calls(tmp_path, caplog):
+    write_textfile(directory='')  # registro vacío
+
+    @timed('double')
+    def double(rows):
+        return rows + rows
+
+    with caplog.at_level(logging.INFO, logger='metrics'):
+        with stage('extract', enabled=True, chunk=1) as m:
+            count_call('api_calls', 3, enabled=True)
+            count_call('api_cache_hits', enabled=True)
+            m.rows_out = 10
+        double([1, 2])  # desactivado por defecto: no registra nada
+
+    [recorded] = recorded_stages()
+    assert recorded.stage == 'extract' and recorded.labels == {'chunk': 1}
+    assert recorded.calls == {'api_calls': 3, 'api_cache_hits': 1, 'db_queries': 0}
+    assert recorded.wall_seconds > 0 and recorded.peak_rss_mb > 0
+
+    line = json.loads(caplog.records[-1].getMessage())
+    assert line['event'] == 'stage' and line['rows_out'] == 10
+
+    path = write_textfile('pipeline', directory=str(tmp_path))
+    text = open(path).read()
+    assert 'crypto_etl_stage_api_calls{job="pipeline",stage="extract"} 3' in text
+    assert 'crypto_etl_stage_rows_out{job="pipeline",stage="extract"} 10' in text
+    assert recorded_stages() == []
+
+
+def test_disabled_stage_is_a_no_op(tmp_path):
+    with stage('load', rows_in=5, enabled=False) as m:
+        count_call('db_queries', enabled=False)
+    assert m.wall_seconds == 0.0 and m.calls == {}
+    assert recorded_stages() == []
+    assert write_textfile(directory=str(tmp_path)) is None
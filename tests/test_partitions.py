@@ -0,0 +1,25 @@
+import os
+import sys
+
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.db.partitions import month_range, partition_name, partitioned_schema_sql
+
+
+def test_month_range_covers_both_ends():
+    months = month_range('2024-11-15 13:00', '2025-02-01')
+    assert months == [pd.Timestamp('2024-11-01'), pd.Timestamp('2024-12-01'),
+                      pd.Timestamp('2025-01-01'), pd.Timestamp('2025-02-01')]
+    assert partition_name('cryptocurrency_prices', months[0]) == 'cryptocurrency_prices_p202411'
+
+
+def test_partitioned_schema_per_granularity():
+    daily = ';'.join(partitioned_schema_sql('daily'))
+    hourly = ';'.join(partitioned_schema_sql('hourly'))
+
+    assert 'PARTITION BY RANGE (price_timestamp)' in daily
+    assert 'USING BRIN (price_timestamp)' in daily
+    assert 'PRIMARY KEY (coin, price_timestamp) INCLUDE (price, volume, market_cap)' in daily
+    assert 'cryptocurrency_metrics_hourly_default PARTITION OF cryptocurrency_metrics_hourly DEFAULT' in hourly
@@ -0,0 +1,137 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+from pycoingecko import CoinGeckoAPI
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.mock_coingecko import start_mock_server, synthetic_quotes
+from src.etl.backfill import run_backfill
+from src.load.load_db import METRICS_COLUMNS
+from src.realtime import RealtimeService, TICKS_TABLE
+from src.transform.kpis import calculate_kpis
+from tests.test_backfill import FakeRangeCoinGecko, _engine
+
+COINS = ['bitcoin', 'ethereum']
+
+
+class QuoteLevelRangeCoinGecko(FakeRangeCoinGecko):
+    """Histórico diario al nivel de las cotizaciones del mock: la primera barra en vivo no es un pico."""
+
+    def get_coin_market_chart_range_by_id(self, id, vs_currency, from_timestamp, to_timestamp, **kwargs):
+        data = super().get_coin_market_chart_range_by_id(id, vs_currency, from_timestamp, to_timestamp)
+        level = synthetic_quotes([id], from_timestamp)[id][vs_currency]
+        prices = [[t, level * (1 + 0.02 * np.sin(t / 86_400_000))] for t, _ in data['prices']]
+        return {'prices': prices, 'total_volumes': [[t, p * 1_000] for t, p in prices],
+                'market_caps': [[t, p * 1_000_000] for t, p in prices]}
+
+
+class SimulatedClock:
+    """Reloj que solo avanza con sleep (o a mano sumando a `t`)."""
+
+    def __init__(self, start):
+        self.t = pd.Timestamp(start).timestamp()
+        self.sleeps = []
+
+    def now(self):
+        return self.t
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.t += seconds
+
+
+def test_polls_append_ticks_and_update_current_bar_across_midnight(tmp_path, monkeypatch):
+    monkeypatch.setattr('src.load.load_db.ROLLUPS_ENABLED', False)
+    engine = _engine(tmp_path)
+    run_backfill('2021-04-01', '2021-06-30', coins=COINS, window_days=120, max_workers=1, engine=engine,
+                 cg=QuoteLevelRangeCoinGecko())
+
+    clock = SimulatedClock('2021-06-30 23:58:10')
+    server, base_url = start_mock_server(rate_limit_per_second=1000, clock=clock.now)
+    cg = CoinGeckoAPI()
+    cg.api_base_url = base_url
+    service = RealtimeService(engine, coins=COINS, granularity='daily', interval=60, cg=cg, clock=clock)
+    assert service.run(max_polls=4) == 4
+    server.shutdown()
+
+    # Una sola llamada por consulta para todas las monedas, a cadencia fija
+    assert server.limiter.served == 4 and clock.sleeps == [60, 60, 60]
+    ticks = pd.read_sql(f"SELECT * FROM {TICKS_TABLE}", engine)
+    assert len(ticks) == 4 * len(COINS)
+
+    # La barra en curso se actualiza en su sitio: una fila por moneda y día con el último tick
+    prices = pd.read_sql("SELECT * FROM cryptocurrency_prices ORDER BY coin, price_timestamp", engine)
+    prices['price_timestamp'] = pd.to_datetime(prices['price_timestamp'])
+    assert not prices.duplicated(['coin', 'price_timestamp']).any()
+    for day, last_update in (('2021-06-30', '2021-06-30 23:59:00'), ('2021-07-01', '2021-07-01 00:01:00')):
+        quote = synthetic_quotes(COINS, pd.Timestamp(last_update).timestamp())
+        row = prices[prices['price_timestamp'] == day].set_index('coin')['price'].astype(float)
+        assert row.to_dict() == {coin: quote[coin]['usd'] for coin in COINS}
+
+    # KPIs de las barras en curso iguales a un recálculo completo sobre lo guardado
+    series = prices.rename(columns={'coin': 'coin_id', 'price_timestamp': 'date'}).drop(columns='row_index')
+    series[['price', 'volume', 'market_cap']] = series[['price', 'volume', 'market_cap']].astype(float)
+    expected = calculate_kpis(series, columns=METRICS_COLUMNS)
+    expected = expected[expected['date'] >= '2021-06-30'].sort_values(['coin_id', 'date'])
+    metrics = pd.read_sql("SELECT * FROM cryptocurrency_metrics WHERE price_timestamp >= '2021-06-30' "
+                          "ORDER BY coin, price_timestamp", engine)
+    for column in ('price_change_24h', 'volatility_30d', 'volume_change_7d'):
+        np.testing.assert_allclose(metrics[column].astype(float), expected[column], rtol=1e-9)
+
+    # El último tick se actualizó 10 s antes de la consulta; el reloj simulado no avanza durante ella
+    result = service.last_result
+    assert result.ticks == 2 and result.bars_updated == 2
+    assert result.source_lag_seconds == result.end_to_end_seconds == 10
+
+
+def test_slow_poll_skips_missed_slots(tmp_path, monkeypatch):
+    monkeypatch.setattr('src.load.load_db.ROLLUPS_ENABLED', False)
+    clock = SimulatedClock('2021-06-30 12:00:00')
+
+    class SlowCoinGecko:
+        calls = []
+
+        def get_price(self, ids, vs_currencies, **kwargs):
+            self.calls.append(clock.now())
+            clock.t += 150  # la consulta tarda dos intervalos y medio
+            return synthetic_quotes(ids, clock.now())
+
+    cg = SlowCoinGecko()
+    service = RealtimeService(_engine(tmp_path), coins=COINS, granularity='daily', interval=60, cg=cg, clock=clock)
+    service.run(max_polls=2)
+    start = pd.Timestamp('2021-06-30 12:00:00').timestamp()
+    assert cg.calls == [start, start + 180]
+
+
+def test_failed_bar_load_is_retried_on_next_poll(tmp_path, monkeypatch):
+    monkeypatch.setattr('src.load.load_db.ROLLUPS_ENABLED', False)
+    from src import realtime
+    load, failures = realtime.load_data_to_supabase, [1]
+
+    def flaky_load(df, **kwargs):
+        if failures:
+            failures.pop()
+            raise RuntimeError('merge failed')
+        return load(df, **kwargs)
+
+    monkeypatch.setattr(realtime, 'load_data_to_supabase', flaky_load)
+    clock = SimulatedClock('2021-06-30 23:59:30')
+
+    class QuoteCoinGecko:
+        def get_price(self, ids, vs_currencies, **kwargs):
+            return synthetic_quotes(ids, clock.now())
+
+    engine = _engine(tmp_path)
+    service = RealtimeService(engine, coins=COINS, granularity='daily', interval=60, cg=QuoteCoinGecko(),
+                              clock=clock)
+    # La primera consulta (barra del 30/06) falla al escribir; la segunda ya es del 01/07
+    assert service.run(max_polls=2) == 2
+    prices = pd.read_sql("SELECT coin, price_timestamp, price FROM cryptocurrency_prices", engine)
+    prices['price_timestamp'] = pd.to_datetime(prices['price_timestamp'])
+    for day, tick in (('2021-06-30', '2021-06-30 23:59:30'), ('2021-07-01', '2021-07-01 00:00:30')):
+        quote = synthetic_quotes(COINS, pd.Timestamp(tick).timestamp())
+        row = prices[prices['price_timestamp'] == day].set_index('coin')['price'].astype(float)
+        assert row.to_dict() == {coin: quote[coin]['usd'] for coin in COINS}
@@ -0,0 +1,94 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, text
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.load.load_db import load_data_to_supabase
+from src.load.rollups import ROLLUP_COLUMNS, compute_rollups, refresh_rollups
+
+
+def _transformed(days, start='2024-01-01'):
+    """Salida del transform (coin_id, date, precios y KPIs) para dos monedas."""
+    rng = np.random.default_rng(7)
+    frames = []
+    for coin in ('bitcoin', 'ethereum'):
+        price = 100 * np.cumprod(1 + rng.normal(0, 0.03, days))
+        frames.append(pd.DataFrame({
+            'coin_id': coin,
+            'date': pd.date_range(start, periods=days, freq='D'),
+            'price': price,
+            'volume': rng.uniform(1e6, 1e9, days),
+            'market_cap': price * 1e6,
+            **{column: rng.normal(0, 1, days) for column in (
+                'price_change_24h', 'price_change_7d', 'price_change_30d',
+                'market_cap_change_24h', 'market_cap_change_7d', 'market_cap_change_30d',
+                'volume_change_24h', 'volume_change_7d', 'volume_change_30d',
+                'daily_return', 'profitability_30d', 'volatility_30d')},
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+
+def _rollup_engine():
+    engine = create_engine('sqlite://')
+    numeric = ', '.join(f"{c} NUMERIC" for c in ROLLUP_COLUMNS[2:])
+    with engine.begin() as conn:
+        for table in ('cryptocurrency_rollup_weekly', 'cryptocurrency_rollup_monthly'):
+            conn.execute(text(f"CREATE TABLE {table} (coin TEXT NOT NULL, period_start TIMESTAMP NOT NULL, "
+                              f"{numeric}, PRIMARY KEY (coin, period_start))"))
+    return engine
+
+
+def _read(engine, table):
+    df = pd.read_sql(f"SELECT * FROM {table} ORDER BY coin, period_start", engine)
+    df['period_start'] = pd.to_datetime(df['period_start'])
+    return df
+
+
+def test_incremental_refresh_matches_full_recompute():
+    engine = _rollup_engine()
+    full = _transformed(75)
+
+    # Histórico hasta el 2024-02-14 y después un lote incremental que cae a mitad de semana y de mes
+    load_data_to_supabase(full[full['date'] <= '2024-02-14'], engine=engine, parallel=False, load_method='insert')
+    touched = full[full['date'] > '2024-02-14']
+    load_data_to_supabase(full, incremental=True, engine=engine, parallel=False, load_method='insert')
+
+    bars = full.rename(columns={'coin_id': 'coin', 'date': 'price_timestamp'})
+    for period, table in (('weekly', 'cryptocurrency_rollup_weekly'), ('monthly', 'cryptocurrency_rollup_monthly')):
+        expected = compute_rollups(bars, period).astype({'n_bars': 'int64'})
+        stored = _read(engine, table)[ROLLUP_COLUMNS]
+        pd.testing.assert_frame_equal(stored, expected, check_dtype=False, rtol=1e-9)
+
+    # Un refresco del último lote solo reescribe sus periodos (febrero y marzo)
+    refreshed = refresh_rollups(engine, touched, periods=('monthly',))
+    assert refreshed == {'cryptocurrency_rollup_monthly': 4}
+    # Un lote antiguo (relleno de huecos de enero) no relee ni reescribe los periodos posteriores
+    old_window = full[(full['date'] >= '2024-01-10') & (full['date'] <= '2024-01-12')]
+    assert refresh_rollups(engine, old_window) == {'cryptocurrency_rollup_weekly': 2,
+                                                   'cryptocurrency_rollup_monthly': 2}
+    for period, table in (('weekly', 'cryptocurrency_rollup_weekly'), ('monthly', 'cryptocurrency_rollup_monthly')):
+        expected = compute_rollups(bars, period).astype({'n_bars': 'int64'})
+        pd.testing.assert_frame_equal(_read(engine, table)[ROLLUP_COLUMNS], expected, check_dtype=False, rtol=1e-9)
+
+
+def test_monthly_rollup_ohlc():
+    bars = pd.DataFrame({
+        'coin': 'bitcoin',
+        'price_timestamp': pd.to_datetime(['2024-01-30', '2024-01-31', '2024-02-01', '2024-02-02']),
+        'price': [10.0, 12.0, 11.0, 9.0],
+        'volume': [1.0, 2.0, 3.0, 4.0],
+        'daily_return': [0.0, 0.2, -1 / 12, -2 / 11],
+        'volatility_30d': [1.0, 2.0, 3.0, 4.0],
+    })
+    rollups = compute_rollups(bars, 'monthly')
+
+    february = rollups.iloc[1]
+    assert february['period_start'] == pd.Timestamp('2024-02-01')
+    assert (february['open'], february['high'], february['low'], february['close']) == (11.0, 11.0, 9.0, 9.0)
+    assert february['volume'] == 7.0 and february['n_bars'] == 2
+    assert february['volatility_30d'] == 4.0
+    assert np.isclose(february['period_return'], (9 / 11 - 1) * 100)
@@ -0,0 +1,68 @@
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.etl.extract import build_coin_frame
+from src.load.load_db import METRICS_COLUMNS
+from src.streaming import run_streaming
+from src.transform.clean import clean_data
+from src.transform.kpis import calculate_kpis
+from tests.test_backfill import FakeRangeCoinGecko, _engine
+
+COINS = [f"coin-{i}" for i in range(16)]
+
+
+def fake_fetch(fail=(), latency=0.01, calls=None):
+    def fetch(coin_id, days, limiter=None, interval='daily'):
+        time.sleep(latency)
+        if calls is not None:
+            calls.append(coin_id)
+        if coin_id in fail:
+            raise ConnectionError('timeout')
+        data = FakeRangeCoinGecko().get_coin_market_chart_range_by_id(
+            coin_id, 'usd', int(pd.Timestamp('2021-01-01').timestamp()), int(pd.Timestamp('2021-05-01').timestamp()))
+        return build_coin_frame(data, coin_id)
+    return fetch
+
+
+def test_streaming_loads_same_rows_as_batch_with_bounded_queues(tmp_path, monkeypatch):
+    monkeypatch.setattr('src.load.load_db.ROLLUPS_ENABLED', False)
+    engine = _engine(tmp_path)
+    fetch = fake_fetch()
+    result = run_streaming(engine, COINS, queue_depth=1, extract_workers=2, load_batch_coins=2, fetch=fetch)
+
+    raw = pd.concat([fetch(coin, days=None) for coin in COINS], ignore_index=True)
+    expected = calculate_kpis(clean_data(raw), columns=METRICS_COLUMNS).sort_values(['coin_id', 'date'])
+    stored = pd.read_sql("SELECT * FROM cryptocurrency_metrics ORDER BY coin, price_timestamp", engine)
+    assert result.rows_loaded == len(stored) == len(expected)
+    assert sorted(coin for scope in result.scopes for coin in scope['coins']) == sorted(COINS)
+    np.testing.assert_allclose(stored['volatility_30d'].astype(float), expected['volatility_30d'], rtol=1e-9)
+    # Monedas en memoria acotadas por las colas, no por el universo: una por extractor bloqueado,
+    # cola cruda (1), lote del transform (2), cola de carga (1 lote de 2) y lote de carga (2 lotes)
+    assert result.max_in_flight <= 2 + 1 + 2 + 2 + 4 < len(COINS)
+
+
+def test_streaming_stops_and_reraises_on_stage_error(tmp_path, monkeypatch):
+    monkeypatch.setattr('src.load.load_db.ROLLUPS_ENABLED', False)
+    engine = _engine(tmp_path)
+    with pytest.raises(ConnectionError):
+        run_streaming(engine, COINS, queue_depth=1, extract_workers=2, fetch=fake_fetch(fail={'coin-3'}))
+
+
+def test_streaming_load_error_cancels_pipeline(tmp_path, monkeypatch):
+    def failing_load(df, **kwargs):
+        raise RuntimeError('merge failed')
+
+    monkeypatch.setattr('src.streaming.load_data_to_supabase', failing_load)
+    calls = []
+    with pytest.raises(RuntimeError, match='merge failed'):
+        run_streaming(_engine(tmp_path), COINS, queue_depth=1, extract_workers=1, load_batch_coins=1,
+                      fetch=fake_fetch(latency=0.05, calls=calls))
+    # La primera carga fallida detiene la extracción del resto de monedas
+    assert len(calls) < len(COINS)
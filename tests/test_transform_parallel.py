@@ -0,0 +1,27 @@
+import os
+import sys
+
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.transform.clean import clean_data
+from src.transform.kpis import calculate_kpis
+from src.transform.parallel import transform_parallel, _partition_bounds
+from tests.test_kpis import synthetic_raw
+
+
+def test_parallel_transform_matches_sequential():
+    raw = synthetic_raw([200, 40, 5, 1, 90, 60, 33])
+    expected = calculate_kpis(clean_data(raw.copy()), columns=['volatility_30d', 'profitability_30d'])
+
+    result = transform_parallel(raw, max_workers=2, columns=['volatility_30d', 'profitability_30d'])
+
+    pd.testing.assert_frame_equal(result, expected.reset_index(drop=True))
+
+
+def test_partition_bounds_balance_rows_and_keep_order():
+    bounds = _partition_bounds([100, 100, 100, 100], 2)
+    assert list(bounds) == [0, 2]
+    # Una moneda enorme no deja particiones vacías
+    assert list(_partition_bounds([1000, 1, 1], 3)) == [0, 1]
@@ -0,0 +1,106 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.transform.clean import clean_data
+from src.transform.kpis import calculate_kpis
+from src.transform.validate import split_nulls, validate_batch
+
+
+def _batch(days=40):
+    """Lote transformado de dos monedas con precios realistas (sin problemas)."""
+    rng = np.random.default_rng(3)
+    frames = []
+    for coin in ('bitcoin', 'ethereum'):
+        price = 100 * np.cumprod(1 + rng.normal(0, 0.02, days))
+        frames.append(pd.DataFrame({
+            'coin_id': coin,
+            'date': pd.date_range('2024-01-01', periods=days, freq='D'),
+            'price': price,
+            'volume': rng.uniform(1e8, 2e8, days),
+            'market_cap': price * 1e6,
+        }))
+    df = pd.concat(frames, ignore_index=True)
+    df['coin_id'] = df['coin_id'].astype('category')
+    return df
+
+
+def test_clean_batch_passes_untouched(tmp_path):
+    df = _batch()
+    # Cambio de nivel sostenido (no revierte): no es un pico
+    df.loc[df.index[20:40], 'price'] *= 3
+    valid, report = validate_batch(df, quarantine_dir=str(tmp_path))
+    assert report.clean and len(valid) == len(df)
+    assert report.gaps == 0 and report.stale_coins == []
+    assert not os.listdir(tmp_path)
+
+
+def test_bad_rows_are_quarantined_with_reason(tmp_path):
+    df = _batch()
+    df.loc[5, 'price'] = np.nan                                       # null_key
+    df.loc[10, 'price'] = df.loc[10, 'price'] * 50                    # pico de precio que revierte
+    df = pd.concat([df, df.iloc[[50]]], ignore_index=True)            # clave duplicada
+    df = df.drop(index=[60, 61, 62])                                  # hueco de 3 días en ethereum
+    df = df[~((df['coin_id'] == 'bitcoin') & (df['date'] > '2024-02-05'))]  # bitcoin se queda atrás
+
+    valid, report = validate_batch(df.sample(frac=1, random_state=0), quarantine_dir=str(tmp_path))
+
+    assert report.issues['null_key'] == 1
+    assert report.issues['price_outlier'] == 1
+    assert report.issues['duplicate'] == 1
+    assert report.quarantined == 3 and len(valid) == len(df) - 3
+    assert report.unordered_rows > 0
+    assert (report.gaps, report.missing_bars) == (1, 3)
+    assert report.stale_coins == ['bitcoin']
+    assert not valid.duplicated(['coin_id', 'date']).any() and valid['price'].notna().all()
+
+    quarantined = pd.read_parquet(report.quarantine_path)
+    assert sorted(quarantined['reason']) == ['duplicate', 'null_key', 'price_outlier']
+
+
+def test_reject_mode_raises_before_load(tmp_path):
+    df = _batch()
+    df.loc[3, 'volume'] = -1.0
+    with pytest.raises(ValueError, match='non_positive'):
+        validate_batch(df, mode='reject', quarantine_dir=str(tmp_path))
+
+
+def test_newest_bar_spike_is_flagged_against_history(tmp_path):
+    df = _batch()
+    last = df.index[df['coin_id'] == 'bitcoin'][-1]
+    df.loc[last, 'price'] *= 20                                       # la barra más reciente aún no revierte
+    valid, report = validate_batch(df, quarantine_dir=str(tmp_path))
+    assert report.issues['price_outlier'] == 1 and last not in valid.index
+
+    # Una fila por moneda (barra en curso): la historia llega como contexto
+    newest = df.groupby('coin_id', observed=True).tail(1)
+    valid, report = validate_batch(newest, context=df, quarantine_dir=str(tmp_path))
+    assert report.rows == 2 and report.issues['price_outlier'] == 1
+    assert list(valid['coin_id']) == ['ethereum']
+
+
+def test_only_rows_after_the_watermark_are_validated(tmp_path):
+    df = _batch()
+    df.loc[3, 'price'] *= 50                                          # pico del lookback, ya cargado
+    df.loc[35, 'price'] *= 50                                         # pico en una barra nueva
+    watermarks = {'bitcoin': pd.Timestamp('2024-01-30'), 'ethereum': pd.Timestamp('2024-01-30')}
+    valid, report = validate_batch(df, watermarks=watermarks, quarantine_dir=str(tmp_path))
+    assert report.rows == 20 and report.issues['price_outlier'] == 1
+    assert (valid['date'] > '2024-01-30').all() and 35 not in valid.index
+
+
+def test_nulls_are_counted_before_cleaning(tmp_path):
+    raw = _batch().assign(timestamp=lambda d: d['date'].dt.as_unit('ms').astype('int64')).drop(columns='date')
+    raw.loc[7, 'volume'] = np.nan
+    raw, nulls = split_nulls(raw)
+    df = calculate_kpis(clean_data(raw))
+    valid, report = validate_batch(df, nulls=nulls, quarantine_dir=str(tmp_path))
+    assert report.rows == 80 and report.issues['null_value'] == 1 and len(valid) == 79
+    assert list(pd.read_parquet(report.quarantine_path)['reason']) == ['null_value']
+    with pytest.raises(ValueError, match='null_value'):
+        validate_batch(df, nulls=nulls, mode='reject', quarantine_dir=str(tmp_path))